@@ -4,8 +4,19 @@ import os
 import subprocess
 import shutil
 from datetime import datetime
-from models import db, Car, VehicleIntake
-from routes import car_routes, view_routes, intake_routes
+from models import db, Car, VehicleIntake, init_sqlite_pragmas, get_sqlite_settings
+from routes import car_routes, view_routes, intake_routes, pdf_routes
+from pdf_service import pdf_service
+import pdf_assets
+import car_search
+import car_import
+import car_archive
+import feature_index
+import intake_numbers
+from intake_summary import intake_counts
+import migrations
+from car_stats import car_stats, init_stats_rollup
+from pdf_prerender import pdf_prerenderer, PDF_PRERENDER_ENABLED
 from version_utils import get_full_version_info, check_for_updates, get_changelog
 
 app = Flask(__name__)
@@ -28,33 +39,51 @@ os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 app.register_blueprint(car_routes.bp)
 app.register_blueprint(view_routes.bp)
 app.register_blueprint(intake_routes.bp)
+app.register_blueprint(pdf_routes.bp)
 
 # Initialize DB
 db.init_app(app)
 
+# SQLite-Pragmas (WAL, busy_timeout, ...) für jede Verbindung setzen
 with app.app_context():
-    db.create_all()
-    
-    # Migration: Füge in_stock Spalte hinzu, falls sie nicht existiert
-    # und setze Standardwert für bestehende Einträge
-    try:
-        from sqlalchemy import text, inspect
-        inspector = inspect(db.engine)
-        columns = [col['name'] for col in inspector.get_columns('cars')]
-        
-        if 'in_stock' not in columns:
-            # Spalte existiert nicht - füge sie hinzu
-            with db.engine.connect() as conn:
-                conn.execute(text('ALTER TABLE cars ADD COLUMN in_stock BOOLEAN DEFAULT 1 NOT NULL'))
-                conn.commit()
-            print("Migration: in_stock Spalte hinzugefügt")
-        else:
-            # Spalte existiert - setze NULL-Werte auf 1 (im Bestand)
-            with db.engine.connect() as conn:
-                conn.execute(text('UPDATE cars SET in_stock = 1 WHERE in_stock IS NULL'))
-                conn.commit()
-    except Exception as e:
-        print(f"Migration-Hinweis: {e}")
+    init_sqlite_pragmas(db.engine)
+
+# PDF-Render-Pool (Worker-Prozesse starten erst beim ersten Rendering)
+pdf_service.init_app(app)
+
+# Druckoptimierte Bildvarianten für die PDF-Templates
+pdf_assets.init_app(app)
+
+# Dashboard-Statistiken cachen (Invalidierung bei Änderungen am Bestand)
+car_stats.init_app(app)
+
+# Sammelimport per CLI (flask import-cars)
+car_import.init_app(app)
+
+# Archivierung lange verkaufter Fahrzeuge per CLI (flask archive-cars)
+car_archive.init_app(app)
+
+# Ausstattungsmerkmale normalisiert indizieren (flask rebuild-features)
+feature_index.init_app(app)
+
+# Reservierte interne Nummern beim Speichern von Aufnahmeblättern übernehmen
+intake_numbers.init_app(app)
+
+# Anzahl der Aufnahmeblätter je Filter cachen (Übersicht)
+intake_counts.init_app(app)
+
+# Schema-Migrationen per CLI (flask migrate)
+migrations.init_app(app)
+
+with app.app_context():
+    # Ausstehende Schema-Migrationen (im Normalfall nur PRAGMA user_version lesen)
+    migrations.run_migrations(db.engine)
+
+    # Volltextindex für die Fahrzeugsuche (Fallback: LIKE-Suche)
+    car_search.init_search_index(db.engine)
+
+    # Trigger für die Statistik-Tabelle (Fallback: Aggregation über cars)
+    init_stats_rollup(db.engine)
 
 @app.template_filter('numberformat')
 def numberformat_filter(value):
@@ -234,7 +263,8 @@ def settings():
     return render_template('settings.html', 
                          version_info=version_info,
                          update_info=update_info,
-                         changelog=changelog)
+                         changelog=changelog,
+                         sqlite_settings=get_sqlite_settings())
 
 @app.errorhandler(404)
 def not_found_error(error):
@@ -249,4 +279,12 @@ def internal_error(error):
 if __name__ == '__main__':
     port = int(os.getenv('PORT', 5000))
     debug = os.getenv('FLASK_ENV') == 'development'
+    # Hintergrund-Timer nur im ausliefernden Prozess starten, nicht im
+    # Überwachungsprozess des Reloaders (Debug-Modus)
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        # Lange verkaufte Fahrzeuge im Hintergrund archivieren
+        car_archive.start_archiver(app)
+        # PDFs nach dem Speichern im Hintergrund vorab rendern
+        if PDF_PRERENDER_ENABLED:
+            pdf_prerenderer.init_app(app)
     app.run(host='0.0.0.0', port=port, debug=debug)
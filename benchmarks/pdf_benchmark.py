@@ -0,0 +1,285 @@
+# benchmarks/pdf_benchmark.py
+"""
+Benchmark für die PDF-Generierung (Preisschild und Aufnahmeblatt).
+
+Rendert beide Templates mit verschiedenen Testdaten und misst pro Phase
+(Jinja-Rendering, Layout, PDF-Schreiben) die Laufzeit sowie Peak-RSS und
+PDF-Größe. Jedes Szenario läuft in einem eigenen Prozess, damit der
+gemessene Speicher nicht von vorherigen Szenarien abhängt.
+
+Verwendung (im Projektverzeichnis):
+    python benchmarks/pdf_benchmark.py                     # Messen + mit Baseline vergleichen
+    python benchmarks/pdf_benchmark.py --update-baseline   # Aktuelle Messung als Baseline speichern
+    python benchmarks/pdf_benchmark.py --scenario car_long_features
+
+Der Exit-Code ist 1, wenn ein Wert die Baseline um mehr als die Toleranz
+überschreitet.
+"""
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_FILE = os.path.join(ROOT_DIR, 'benchmarks', 'baseline.json')
+
+PHASES = ['jinja', 'layout', 'write']
+
+# Zeit-Toleranzen: relativ zur Baseline plus absoluter Puffer gegen Messrauschen
+DEFAULT_TOLERANCE = 0.25
+TIME_SLACK_MS = 5.0
+
+
+# ============== Testdaten ==============
+
+def _car(**overrides):
+    car = {
+        'id': 1,
+        'listing_number': 'B-1001',
+        'brand': 'Volkswagen',
+        'model': 'Golf VIII 1.5 eTSI Life',
+        'engine_capacity': 1498,
+        'power': 150,
+        'fuel_type': 'Benzin',
+        'transmission': 'Automatik',
+        'mileage': 23500,
+        'first_registration': '03/2022',
+        'features': 'Navigation, Sitzheizung, Einparkhilfe hinten, LED-Scheinwerfer',
+        'eco_badge': 4,
+        'price': 24990,
+        'vat_deductible': True,
+        'seller': 'Auto Berndl',
+        'created_at': '2026-01-15 10:00:00',
+        'in_stock': True
+    }
+    car.update(overrides)
+    return car
+
+
+def _intake(**overrides):
+    intake = {
+        'id': 1,
+        'brand': 'Skoda',
+        'model_variant': 'Octavia Combi 2.0 TDI Style',
+        'internal_number': '2026-042',
+        'vin': 'TMBJJ7NX5MY123456',
+        'first_registration': '2021-05',
+        'mileage': 68400,
+        'num_owners': 1,
+        'fuel_types': ['Diesel'],
+        'power_ps': 150,
+        'power_kw': 110,
+        'transmission': 'Automatik',
+        'eco_badge': 'grün',
+        'gross_price': 21990.0,
+        'net_price': 18478.99,
+        'vat_deductible': True
+    }
+    for field in ['exterior_features', 'interior_materials', 'comfort_features',
+                  'infotainment_features', 'safety_features', 'airbags', 'parking_features']:
+        intake.setdefault(field, [])
+    intake.update(overrides)
+    return intake
+
+
+def _all_intake_options():
+    from models import VehicleIntake
+    return {
+        'exterior_features': VehicleIntake.get_exterior_feature_options(),
+        'interior_materials': VehicleIntake.get_interior_material_options(),
+        'comfort_features': VehicleIntake.get_comfort_feature_options(),
+        'infotainment_features': VehicleIntake.get_infotainment_feature_options(),
+        'safety_features': VehicleIntake.get_safety_feature_options(),
+        'airbags': VehicleIntake.get_airbag_options(),
+        'parking_features': VehicleIntake.get_parking_feature_options(),
+        'additional_notes': 'Unfallfrei, Nichtraucherfahrzeug. ' * 20
+    }
+
+
+LONG_FEATURES = ', '.join(f'Ausstattungsmerkmal Nummer {i}' for i in range(1, 41))
+
+SCENARIOS = {
+    'car_default': ('car', lambda: _car()),
+    'car_long_features': ('car', lambda: _car(features=LONG_FEATURES)),
+    'car_consignment': ('car', lambda: _car(seller='Im Auftrag', vat_deductible=False)),
+    'car_long_name': ('car', lambda: _car(brand='Mercedes-Benz', model='GLE 450 d 4MATIC Coupé AMG Line Night-Paket')),
+    **{f'car_eco_badge_{badge}': ('car', (lambda badge=badge: _car(eco_badge=badge))) for badge in range(1, 6)},
+    'intake_minimal': ('intake', lambda: _intake()),
+    'intake_full': ('intake', lambda: _intake(**_all_intake_options())),
+    **{f'intake_eco_{color}': ('intake', (lambda color=color: _intake(eco_badge=color))) for color in ['grün', 'gelb', 'rot']},
+}
+
+
+# ============== Messung (läuft im Kindprozess) ==============
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss ist unter Linux in KB, unter macOS in Bytes
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(peak / divisor, 1)
+
+
+def run_scenario(name: str, repeat: int) -> dict:
+    """Misst ein Szenario im aktuellen Prozess."""
+    # Keine echte Datenbank und keine Hintergrund-Renderings im Benchmark
+    os.environ.setdefault('DATABASE_URL', 'sqlite://')
+    os.environ['PDF_PRERENDER'] = '0'
+    sys.path.insert(0, ROOT_DIR)
+
+    from flask import render_template
+    from weasyprint import HTML
+    from app import app
+    from pdf_fetcher import PDF_BASE_URL, get_url_fetcher, image_cache
+    from pdf_service import _get_stylesheets, _get_font_config
+    from routes.view_routes import get_car_sign_context, CAR_PDF_STYLESHEETS
+    from routes.intake_routes import get_intake_print_context
+
+    kind, build_fixture = SCENARIOS[name]
+    timings = {phase: [] for phase in PHASES}
+    pdf_size = 0
+
+    with app.test_request_context('/'):
+        fixture = build_fixture()
+        if kind == 'car':
+            template, context, stylesheet_names = 'car_template.html', get_car_sign_context(fixture), CAR_PDF_STYLESHEETS
+        else:
+            template, context, stylesheet_names = 'intake_pdf.html', get_intake_print_context(fixture), ()
+
+        fetcher = get_url_fetcher(app.static_folder)
+
+        # Erster Durchlauf (Fonts, Stylesheets, Bildcache) wird nicht gewertet
+        for iteration in range(repeat + 1):
+            start = time.perf_counter()
+            html_content = render_template(template, **context)
+            after_jinja = time.perf_counter()
+
+            document = HTML(string=html_content, base_url=PDF_BASE_URL, url_fetcher=fetcher).render(
+                stylesheets=_get_stylesheets(app.static_folder, stylesheet_names),
+                font_config=_get_font_config(),
+                presentational_hints=True,
+                cache=image_cache
+            )
+            after_layout = time.perf_counter()
+
+            pdf_bytes = document.write_pdf()
+            after_write = time.perf_counter()
+
+            if iteration == 0:
+                continue
+            timings['jinja'].append((after_jinja - start) * 1000)
+            timings['layout'].append((after_layout - after_jinja) * 1000)
+            timings['write'].append((after_write - after_layout) * 1000)
+            pdf_size = len(pdf_bytes)
+
+    result = {phase: round(statistics.median(values), 2) for phase, values in timings.items()}
+    result['total'] = round(sum(result[phase] for phase in PHASES), 2)
+    result['pages'] = len(document.pages)
+    result['pdf_bytes'] = pdf_size
+    result['peak_rss_mb'] = _peak_rss_mb()
+    return result
+
+
+def run_isolated(name: str, repeat: int) -> dict:
+    """Startet ein Szenario in einem frischen Python-Prozess."""
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', name, '--repeat', str(repeat)],
+        cwd=ROOT_DIR, capture_output=True, text=True, check=True
+    ).stdout
+    # Letzte Zeile enthält das Ergebnis (App-Start kann vorher loggen)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+# ============== Baseline-Vergleich ==============
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Gibt eine Liste von Regressionen (Text) zurück."""
+    regressions = []
+    for name, current in results.items():
+        reference = baseline.get(name)
+        if not reference:
+            continue
+        for metric in PHASES + ['total']:
+            limit = reference[metric] * (1 + tolerance) + TIME_SLACK_MS
+            if current[metric] > limit:
+                regressions.append(f'{name}: {metric} {current[metric]:.1f} ms > {limit:.1f} ms (Baseline {reference[metric]:.1f} ms)')
+        for metric in ['pdf_bytes', 'peak_rss_mb']:
+            limit = reference[metric] * (1 + tolerance)
+            if current[metric] > limit:
+                regressions.append(f'{name}: {metric} {current[metric]} > {limit:.1f} (Baseline {reference[metric]})')
+        if current['pages'] != reference['pages']:
+            regressions.append(f"{name}: {current['pages']} Seiten statt {reference['pages']}")
+    return regressions
+
+
+def print_table(results: dict):
+    header = f"{'Szenario':<24}{'Jinja':>9}{'Layout':>9}{'Write':>9}{'Gesamt':>9}{'Seiten':>8}{'PDF KB':>9}{'RSS MB':>9}"
+    print(header)
+    print('-' * len(header))
+    for name, r in results.items():
+        print(f"{name:<24}{r['jinja']:>9.1f}{r['layout']:>9.1f}{r['write']:>9.1f}{r['total']:>9.1f}"
+              f"{r['pages']:>8}{r['pdf_bytes'] / 1024:>9.1f}{r['peak_rss_mb']:>9.1f}")
+    print('(Zeiten in ms, Median)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark für die PDF-Generierung')
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help='Nur dieses Szenario (mehrfach möglich)')
+    parser.add_argument('--repeat', type=int, default=5, help='Messungen pro Szenario (Standard: 5)')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE, help='Erlaubte Abweichung zur Baseline (Standard: 0.25 = 25%%)')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='Pfad zur Baseline-Datei')
+    parser.add_argument('--update-baseline', action='store_true', help='Ergebnisse als neue Baseline speichern')
+    parser.add_argument('--json', metavar='DATEI', help='Ergebnisse zusätzlich als JSON speichern')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_scenario(args.child, args.repeat)))
+        return 0
+
+    names = args.scenario or list(SCENARIOS)
+    results = {}
+    for name in names:
+        print(f'Messe {name} ...', file=sys.stderr)
+        results[name] = run_isolated(name, args.repeat)
+
+    print_table(results)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f'Baseline gespeichert: {args.baseline}')
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print('Keine Baseline vorhanden - mit --update-baseline anlegen.')
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print('\nREGRESSIONEN:')
+        for line in regressions:
+            print(f'  - {line}')
+        return 1
+
+    print('\nKeine Regressionen gegenüber der Baseline.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,216 @@
+# benchmarks/serializer_benchmark.py
+"""
+Micro-Benchmark für VehicleIntake.to_dict/from_dict.
+
+Vergleicht die vorberechneten Serialisierer (Umwandlung je Spalte wird
+einmalig beim Import von models.py festgelegt) mit der früheren
+Implementierung, die bei jedem Aufruf Feldlisten aufbaute und linear
+durchsuchte. to_dict läuft wie in Liste und Druckansicht auf aus der
+Datenbank geladenen Zeilen (SQLite im Speicher), from_dict wie beim
+Anlegen auf neuen Objekten. Vorab wird geprüft, dass beide Varianten
+identische Ergebnisse liefern.
+
+Verwendung (im Projektverzeichnis):
+    python benchmarks/serializer_benchmark.py
+    python benchmarks/serializer_benchmark.py --count 10000 --repeat 7
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from flask import Flask  # noqa: E402
+from models import db, VehicleIntake  # noqa: E402
+
+
+# ============== Frühere Implementierung (Referenz) ==============
+
+def legacy_to_dict(self):
+    result = {}
+    for c in self.__table__.columns:
+        value = getattr(self, c.name)
+        if c.name in ['fuel_types', 'exterior_features', 'interior_materials',
+                      'comfort_features', 'infotainment_features', 'safety_features',
+                      'airbags', 'parking_features']:
+            if value:
+                try:
+                    result[c.name] = json.loads(value)
+                except (json.JSONDecodeError, TypeError):
+                    result[c.name] = []
+            else:
+                result[c.name] = []
+        elif isinstance(value, bool):
+            result[c.name] = value
+        else:
+            result[c.name] = value
+    return result
+
+
+def legacy_from_dict(self, data):
+    json_fields = ['fuel_types', 'exterior_features', 'interior_materials',
+                   'comfort_features', 'infotainment_features', 'safety_features',
+                   'airbags', 'parking_features']
+    int_fields = ['mileage', 'num_owners', 'power_ps', 'power_kw', 'engine_capacity',
+                  'cylinders', 'co2_emission', 'gears', 'curb_weight', 'gross_weight',
+                  'trailer_load_braked', 'trailer_load_unbraked', 'support_load',
+                  'last_inspection_km', 'replacement_engine_km', 'replacement_transmission_km',
+                  'num_keys']
+    float_fields = ['tank_size', 'fuel_consumption', 'tire_tread_front', 'tire_tread_rear',
+                    'net_price', 'gross_price', 'transfer_costs', 'optional_price']
+    bool_fields = ['particle_filter', 'color_metallic', 'color_matte', 'oil_change_new',
+                   'brakes_new', 'timing_belt_new', 'replacement_engine',
+                   'replacement_transmission', 'vat_deductible']
+
+    for key, value in data.items():
+        if hasattr(self, key) and key not in ['id', 'created_at']:
+            if key in json_fields:
+                if isinstance(value, list):
+                    setattr(self, key, json.dumps(value))
+                elif isinstance(value, str):
+                    setattr(self, key, value)
+            elif key in int_fields:
+                if value == '' or value is None:
+                    setattr(self, key, None)
+                else:
+                    try:
+                        setattr(self, key, int(value))
+                    except (ValueError, TypeError):
+                        setattr(self, key, None)
+            elif key in float_fields:
+                if value == '' or value is None:
+                    setattr(self, key, None)
+                else:
+                    try:
+                        setattr(self, key, float(value))
+                    except (ValueError, TypeError):
+                        setattr(self, key, None)
+            elif key in bool_fields:
+                if isinstance(value, bool):
+                    setattr(self, key, value)
+                elif value in ['true', 'True', '1', 1]:
+                    setattr(self, key, True)
+                elif value in ['false', 'False', '0', 0, '', None]:
+                    setattr(self, key, False)
+                else:
+                    setattr(self, key, bool(value))
+            else:
+                if value == '':
+                    setattr(self, key, None)
+                else:
+                    setattr(self, key, value)
+
+
+# ============== Testdaten ==============
+
+def form_payload(index: int) -> dict:
+    """Formulardaten wie aus intake_form.html (Zahlen und Booleans als Strings)."""
+    return {
+        'brand': 'Skoda',
+        'model_variant': f'Octavia Combi 2.0 TDI Style {index}',
+        'internal_number': f'2026-{index:04d}',
+        'vin': f'TMBJJ7NX5MY{index:06d}',
+        'first_registration': '2021-05',
+        'mileage': str(60000 + index),
+        'num_owners': '1',
+        'power_ps': '150',
+        'power_kw': '110',
+        'engine_capacity': '1968',
+        'tank_size': '50',
+        'fuel_consumption': '4,9',
+        'transmission': 'Automatik',
+        'eco_badge': 'grün',
+        'particle_filter': 'true',
+        'color_metallic': True,
+        'color_matte': '',
+        'vat_deductible': 'true',
+        'net_price': '18478.99',
+        'gross_price': '21990',
+        'additional_notes': 'Unfallfrei, Nichtraucherfahrzeug.',
+        'fuel_types': ['Diesel'],
+        'exterior_features': VehicleIntake.get_exterior_feature_options()[:8],
+        'interior_materials': ['Teilleder'],
+        'comfort_features': VehicleIntake.get_comfort_feature_options()[:6],
+        'infotainment_features': VehicleIntake.get_infotainment_feature_options()[:7],
+        'safety_features': VehicleIntake.get_safety_feature_options()[:10],
+        'airbags': VehicleIntake.get_airbag_options(),
+        'parking_features': ['Einparkhilfe hinten', 'Rückfahrkamera'],
+        'id': index,
+        'created_at': '2026-01-15 10:00:00',
+    }
+
+
+# ============== Messung ==============
+
+def measure(function, repeat: int) -> float:
+    """Median-Laufzeit in ms."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-Benchmark für VehicleIntake.to_dict/from_dict')
+    parser.add_argument('--count', type=int, default=5000, help='Anzahl Aufnahmeblätter (Standard: 5000)')
+    parser.add_argument('--repeat', type=int, default=5, help='Messungen pro Variante (Standard: 5)')
+    args = parser.parse_args()
+
+    payloads = [form_payload(index) for index in range(args.count)]
+
+    # Gleiches Ergebnis wie bisher?
+    for payload in payloads[:50]:
+        legacy, current = VehicleIntake(), VehicleIntake()
+        legacy_from_dict(legacy, payload)
+        current.from_dict(payload)
+        if legacy_to_dict(legacy) != current.to_dict() or legacy_to_dict(current) != current.to_dict():
+            print('FEHLER: Ergebnisse weichen von der bisherigen Implementierung ab')
+            return 1
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        for payload in payloads:
+            intake = VehicleIntake()
+            intake.from_dict(payload)
+            db.session.add(intake)
+        db.session.commit()
+        db.session.expunge_all()
+        intakes = VehicleIntake.query.order_by(VehicleIntake.id).all()
+        return report(args, payloads, intakes)
+
+
+def report(args, payloads, intakes):
+    """Misst beide Varianten und gibt die Tabelle aus."""
+
+    def run_from_dict(implementation):
+        targets = [VehicleIntake() for _ in payloads]
+        return lambda: [implementation(target, payload) for target, payload in zip(targets, payloads)]
+
+    rows = [
+        ('to_dict', measure(lambda: [legacy_to_dict(i) for i in intakes], args.repeat),
+         measure(lambda: [i.to_dict() for i in intakes], args.repeat)),
+        ('from_dict', measure(run_from_dict(legacy_from_dict), args.repeat),
+         measure(run_from_dict(VehicleIntake.from_dict), args.repeat)),
+    ]
+
+    header = f"{'Methode':<12}{'bisher ms':>12}{'neu ms':>10}{'µs/Zeile':>10}{'Faktor':>9}"
+    print(f'{args.count} Aufnahmeblätter, Median aus {args.repeat} Messungen')
+    print(header)
+    print('-' * len(header))
+    for name, legacy_ms, current_ms in rows:
+        print(f'{name:<12}{legacy_ms:>12.1f}{current_ms:>10.1f}{current_ms * 1000 / args.count:>10.1f}'
+              f'{legacy_ms / current_ms:>8.1f}x')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,183 @@
+# car_archive.py
+"""
+Archiv verkaufter Fahrzeuge.
+
+Verkaufte Fahrzeuge blieben bisher für immer in `cars` (in_stock = 0),
+jede Bestandsabfrage musste sie lesen und herausfiltern. Fahrzeuge, die
+seit mehr als ARCHIVE_AFTER_DAYS Tagen verkauft sind, werden deshalb in
+die Tabelle `cars_archive` verschoben (gleiche Spalten, gleiche ID). Das
+läuft blockweise im Hintergrund: alle ARCHIVE_INTERVAL Sekunden, je
+Block eine kurze Schreibtransaktion mit höchstens ARCHIVE_BATCH_SIZE
+Fahrzeugen. Manuell: `flask archive-cars`.
+
+Den Verkaufszeitpunkt `cars.sold_at` setzen SQLite-Trigger, sobald
+in_stock auf 0 wechselt (auch bei Sammeländerungen und Import), und
+löschen ihn wieder, wenn das Fahrzeug zurück in den Bestand kommt.
+
+Suche (/api/cars) und Export beziehen das Archiv mit `include_archive=1`
+ein. Die Auswertungen (car_stats) zählen archivierte Fahrzeuge weiter
+mit, Volltextindex und Ausstattungs-Zuordnung enthalten nur den Bestand.
+
+`cars` vergibt IDs mit AUTOINCREMENT (Migration 8), archivierte IDs
+werden also nicht erneut vergeben. Ein Fahrzeug, dessen ID im Archiv
+schon belegt ist (nur aus der Zeit vor Migration 8), bleibt im Bestand.
+"""
+import os
+import threading
+import time
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import select, insert, delete, func, text
+
+from models import db, Car, CarArchive
+
+CAR_ARCHIVE_ENABLED = os.getenv('CAR_ARCHIVE', '1') == '1'
+ARCHIVE_AFTER_DAYS = int(os.getenv('CAR_ARCHIVE_AFTER_DAYS', 90))
+ARCHIVE_BATCH_SIZE = int(os.getenv('CAR_ARCHIVE_BATCH_SIZE', 500))
+ARCHIVE_INTERVAL = float(os.getenv('CAR_ARCHIVE_INTERVAL', 3600))  # Sekunden
+ARCHIVE_START_DELAY = 60  # Sekunden nach dem Start - nicht während des Hochfahrens
+ARCHIVE_BATCH_PAUSE = 0.2  # Sekunden zwischen zwei Blöcken (andere Schreiber kommen dran)
+
+_cars = Car.__table__
+_archive = CarArchive.__table__
+
+# Alle Spalten von `cars` (das Archiv hat zusätzlich archived_at)
+ARCHIVE_COLUMNS = [column.name for column in _cars.columns]
+
+# Verkaufszeitpunkt pflegen - das innere UPDATE ändert nur sold_at und
+# löst damit weder diese noch die Such- und Statistik-Trigger erneut aus
+TRIGGERS = {
+    'cars_sold_at_ai': """CREATE TRIGGER IF NOT EXISTS cars_sold_at_ai AFTER INSERT ON cars
+        WHEN NOT new.in_stock AND new.sold_at IS NULL BEGIN
+        UPDATE cars SET sold_at = CURRENT_TIMESTAMP WHERE id = new.id;
+    END""",
+    'cars_sold_at_au': """CREATE TRIGGER IF NOT EXISTS cars_sold_at_au AFTER UPDATE OF in_stock ON cars
+        WHEN new.in_stock IS NOT old.in_stock BEGIN
+        UPDATE cars SET sold_at = CASE WHEN new.in_stock THEN NULL ELSE CURRENT_TIMESTAMP END WHERE id = new.id;
+    END""",
+}
+
+# Altbestand: Verkaufsdatum unbekannt - ab der Migration gerechnet
+BACKFILL_SQL = 'UPDATE cars SET sold_at = CURRENT_TIMESTAMP WHERE NOT in_stock AND sold_at IS NULL'
+
+
+def install_archive(conn):
+    """Legt die Trigger für sold_at an und befüllt den Altbestand (Migration, siehe migrations.py)."""
+    for statement in TRIGGERS.values():
+        conn.execute(text(statement))
+    conn.execute(text(BACKFILL_SQL))
+
+
+def _due_ids(conn, days: int, batch_size: int) -> list:
+    """IDs der ältesten fälligen Verkäufe (über den Index auf sold_at)."""
+    return list(conn.execute(
+        select(_cars.c.id)
+        .where(
+            _cars.c.in_stock == False,  # noqa: E712
+            _cars.c.sold_at < func.datetime('now', f'-{days} days'),
+            _cars.c.id.notin_(select(_archive.c.id))
+        )
+        .order_by(_cars.c.sold_at)
+        .limit(batch_size)
+    ).scalars())
+
+
+def archive_batch(conn, days: int, batch_size: int) -> int:
+    """
+    Verschiebt höchstens batch_size fällige Fahrzeuge in der laufenden
+    Transaktion (Commit durch den Aufrufer). Gibt die Anzahl zurück.
+    """
+    ids = _due_ids(conn, days, batch_size)
+    if ids:
+        conn.execute(insert(_archive).from_select(
+            ARCHIVE_COLUMNS,
+            select(*[_cars.c[name] for name in ARCHIVE_COLUMNS]).where(_cars.c.id.in_(ids))
+        ))
+        # Die Trigger auf cars bereinigen Volltextindex und Ausstattungs-Zuordnung
+        conn.execute(delete(_cars).where(_cars.c.id.in_(ids)))
+    return len(ids)
+
+
+def archive_sold_cars(engine, days=None, batch_size=None, pause=ARCHIVE_BATCH_PAUSE) -> int:
+    """
+    Verschiebt alle Fahrzeuge, die seit mehr als `days` Tagen verkauft
+    sind, blockweise ins Archiv. Gibt die Anzahl zurück.
+    """
+    days = ARCHIVE_AFTER_DAYS if days is None else days
+    batch_size = batch_size or ARCHIVE_BATCH_SIZE
+    if engine.dialect.name != 'sqlite' or days < 0:
+        return 0
+
+    total = 0
+    with engine.connect() as conn:
+        while True:
+            # Schreibsperre vor der Auswahl: parallele Läufe verschieben nichts doppelt
+            conn.exec_driver_sql('BEGIN IMMEDIATE')
+            try:
+                moved = archive_batch(conn, days, batch_size)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            total += moved
+            if moved < batch_size:
+                return total
+            time.sleep(pause)
+
+
+class CarArchiver:
+    """Archiviert regelmäßig im Hintergrund (Timer-Thread)."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.app = None
+        self._timer = None
+
+    def init_app(self, app):
+        """Startet den ersten Lauf kurz nach dem Start."""
+        self.app = app
+        self._schedule(ARCHIVE_START_DELAY)
+
+    def _schedule(self, delay: float):
+        self._timer = threading.Timer(delay, self._run)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _run(self):
+        try:
+            with self.app.app_context():
+                count = archive_sold_cars(db.engine)
+            if count:
+                self.app.logger.info('%s verkaufte Fahrzeuge archiviert', count)
+        except Exception as e:
+            self.app.logger.warning('Archivierung fehlgeschlagen: %s', e)
+        finally:
+            self._schedule(self.interval)
+
+
+car_archiver = CarArchiver(ARCHIVE_INTERVAL)
+
+
+@click.command('archive-cars')
+@click.option('--days', type=int, default=None, help=f'Verkauft vor mehr als N Tagen (Standard: {ARCHIVE_AFTER_DAYS})')
+@click.option('--batch-size', type=int, default=None, help=f'Fahrzeuge pro Transaktion (Standard: {ARCHIVE_BATCH_SIZE})')
+@with_appcontext
+def archive_cars_command(days, batch_size):
+    """Verschiebt lange verkaufte Fahrzeuge ins Archiv."""
+    count = archive_sold_cars(db.engine, days, batch_size)
+    click.echo(f'{count} Fahrzeug(e) archiviert')
+
+
+def init_app(app):
+    """Registriert `flask archive-cars`."""
+    app.cli.add_command(archive_cars_command)
+
+
+def start_archiver(app):
+    """
+    Startet die Hintergrund-Archivierung. Nur im ausliefernden Prozess
+    aufrufen, nicht bei jedem Import von `app` (z. B. `flask ...`-Befehle).
+    """
+    if CAR_ARCHIVE_ENABLED and ARCHIVE_AFTER_DAYS > 0:
+        car_archiver.init_app(app)
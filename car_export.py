@@ -0,0 +1,194 @@
+# car_export.py
+"""
+Export der Fahrzeugliste als CSV oder XLSX.
+
+Die Zeilen werden direkt aus einer Spaltenabfrage (ohne ORM-Objekte)
+in Blöcken von EXPORT_CHUNK_SIZE gelesen (`yield_per`) und sofort in den
+Response geschrieben. Der Speicherbedarf bleibt damit unabhängig von der
+Anzahl der Fahrzeuge konstant. CSV wird zusätzlich gzip-komprimiert
+gestreamt, XLSX ist als ZIP-Archiv bereits komprimiert.
+"""
+import csv
+import io
+import re
+import zipfile
+import zlib
+from xml.sax.saxutils import escape
+
+from models import Car
+
+EXPORT_CHUNK_SIZE = 500
+
+
+def _format_yes_no(value):
+    return 'Ja' if value else 'Nein'
+
+
+def _format_datetime(value):
+    return value.strftime('%d.%m.%Y %H:%M') if value else ''
+
+
+# Überschrift, Spalte, Formatierung (None = Wert unverändert)
+EXPORT_COLUMNS = [
+    ('ID', Car.id, None),
+    ('Angebotsnummer', Car.listing_number, None),
+    ('Marke', Car.brand, None),
+    ('Modell', Car.model, None),
+    ('Hubraum', Car.engine_capacity, None),
+    ('Leistung', Car.power, None),
+    ('Kraftstoff', Car.fuel_type, None),
+    ('Getriebe', Car.transmission, None),
+    ('Kilometer', Car.mileage, None),
+    ('Erstzulassung', Car.first_registration, None),
+    ('Ausstattung', Car.features, None),
+    ('Umweltplakette', Car.eco_badge, None),
+    ('Preis', Car.price, None),
+    ('MwSt. ausweisbar', Car.vat_deductible, _format_yes_no),
+    ('Verkäufer', Car.seller, None),
+    ('Im Bestand', Car.in_stock, _format_yes_no),
+    ('Erstellt', Car.created_at, _format_datetime),
+]
+
+EXPORT_HEADERS = [header for header, _, _ in EXPORT_COLUMNS]
+
+
+def iter_export_rows(query, model=Car):
+    """
+    Liefert die formatierten Zeilen einer (gefilterten, sortierten) Car-Abfrage
+    (bzw. CarArchive-Abfrage mit model=CarArchive, gleiche Spalten).
+    """
+    formatters = [formatter for _, _, formatter in EXPORT_COLUMNS]
+    columns = [getattr(model, column.key) for _, column, _ in EXPORT_COLUMNS]
+    rows = query.with_entities(*columns).yield_per(EXPORT_CHUNK_SIZE)
+    for row in rows:
+        yield [value if formatter is None else formatter(value) for value, formatter in zip(row, formatters)]
+
+
+def iter_csv(rows):
+    """CSV (Semikolon, UTF-8 mit BOM für Excel), blockweise als Bytes."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';', lineterminator='\r\n')
+    buffer.write('\ufeff')
+    writer.writerow(EXPORT_HEADERS)
+
+    for index, row in enumerate(rows, 1):
+        writer.writerow(['' if value is None else value for value in row])
+        if index % EXPORT_CHUNK_SIZE == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def gzip_stream(chunks, level=6):
+    """Komprimiert einen Byte-Stream fortlaufend im gzip-Format."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+# ============== XLSX ==============
+
+# In XML 1.0 nicht erlaubte Steuerzeichen
+_INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+_XLSX_STATIC_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Fahrzeuge" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+class ZipStreamBuffer(io.RawIOBase):
+    """Nicht-seekbarer Schreibpuffer, aus dem der ZIP-Stream stückweise gelesen wird."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _xlsx_cell(value) -> str:
+    if value is None or value == '':
+        return '<c/>'
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f'<c><v>{value}</v></c>'
+    text = _INVALID_XML_CHARS.sub('', str(value))
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(text)}</t></is></c>'
+
+
+def _xlsx_row(values) -> str:
+    return '<row>' + ''.join(_xlsx_cell(value) for value in values) + '</row>'
+
+
+def iter_xlsx(rows):
+    """
+    XLSX-Arbeitsmappe (eine Tabelle, Texte als Inline-Strings), blockweise
+    als Bytes. Das ZIP wird mit Datendeskriptoren geschrieben und muss
+    daher nicht zwischengespeichert werden.
+    """
+    buffer = ZipStreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_STATIC_PARTS.items():
+            archive.writestr(name, content)
+        yield buffer.pop()
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write((
+                '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+                '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                '<sheetData>' + _xlsx_row(EXPORT_HEADERS)
+            ).encode('utf-8'))
+
+            for index, row in enumerate(rows, 1):
+                sheet.write(_xlsx_row(row).encode('utf-8'))
+                if index % EXPORT_CHUNK_SIZE == 0:
+                    yield buffer.pop()
+
+            sheet.write(b'</sheetData></worksheet>')
+    yield buffer.pop()
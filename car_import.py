@@ -0,0 +1,430 @@
+# car_import.py
+"""
+Sammelimport von Fahrzeugen aus CSV oder aus einem mobile.de-Export.
+
+Die Datei wird als Stream gelesen (CSV zeilenweise, XML per iterparse),
+jeder Datensatz wird mit den Regeln von `CarForm` geprüft und die gültigen
+Fahrzeuge werden in Blöcken von IMPORT_BATCH_SIZE geschrieben: ein
+INSERT bzw. UPDATE mit executemany und ein Commit pro Block. Vorhandene
+Fahrzeuge werden anhand der Angebotsnummer aktualisiert. Fehlerhafte
+Datensätze werden mit Zeilennummer gemeldet, der Rest der Datei wird
+trotzdem importiert.
+
+Unterstützte Formate:
+- CSV mit Spaltennamen wie der Export (`/api/cars/export.csv`) oder den
+  Feldnamen des Modells (`listing_number`, `brand`, ...)
+- mobile.de-CSV mit Kopfzeile (`interne_nummer`, `marke`, `modell`, ...)
+- mobile.de-XML (Anzeigen-Format der Seller-API, `<ad:ad>`-Elemente)
+"""
+import codecs
+import csv
+import io
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func, insert, update
+from sqlalchemy.exc import SQLAlchemyError
+from werkzeug.datastructures import MultiDict
+
+from feature_index import index_cars
+from forms import CarForm
+from models import db, Car
+
+IMPORT_BATCH_SIZE = 500
+
+# Höchstens so viele Fehler werden einzeln gemeldet (gezählt werden alle)
+IMPORT_MAX_ERRORS = 1000
+
+IMPORT_FORMATS = ('csv', 'xml')
+
+# Felder, die aus dem Formular übernommen werden
+FORM_FIELDS = [
+    'listing_number', 'brand', 'model', 'engine_capacity', 'power', 'fuel_type',
+    'transmission', 'mileage', 'first_registration', 'features', 'eco_badge',
+    'price', 'vat_deductible', 'seller'
+]
+
+# Spaltennamen (klein geschrieben) -> Feld
+CSV_COLUMNS = {
+    'id': None,
+    'angebotsnummer': 'listing_number',
+    'marke': 'brand',
+    'modell': 'model',
+    'hubraum': 'engine_capacity',
+    'leistung': 'power',
+    'kraftstoff': 'fuel_type',
+    'getriebe': 'transmission',
+    'kilometer': 'mileage',
+    'erstzulassung': 'first_registration',
+    'ausstattung': 'features',
+    'umweltplakette': 'eco_badge',
+    'preis': 'price',
+    'mwst. ausweisbar': 'vat_deductible',
+    'verkäufer': 'seller',
+    'im bestand': 'in_stock',
+    'erstellt': None,
+}
+CSV_COLUMNS.update({name: name for name in FORM_FIELDS + ['in_stock']})
+
+# mobile.de-CSV: Spaltennamen der Kopfzeile -> Feld
+MOBILE_CSV_COLUMNS = {
+    'interne_nummer': 'listing_number',
+    'marke': 'brand',
+    'modell': 'model',
+    'hubraum': 'engine_capacity',
+    'leistung': 'power_kw',
+    'kraftstoffart': 'fuel_type',
+    'getriebeart': 'transmission',
+    'kilometer': 'mileage',
+    'ez': 'first_registration',
+    'bemerkung': 'features',
+    'feinstaubplakette': 'eco_badge',
+    'preis': 'price',
+    'mwst': 'vat_deductible',
+}
+
+# Schlüssel/Codes von mobile.de -> Auswahlwerte von CarForm
+MOBILE_FUEL_TYPES = {
+    '1': 'Benzin', '2': 'Diesel', '6': 'Elektro', '7': 'Hybrid', '10': 'Hybrid',
+    'PETROL': 'Benzin', 'DIESEL': 'Diesel', 'ELECTRICITY': 'Elektro',
+    'HYBRID': 'Hybrid', 'HYBRID_DIESEL': 'Hybrid',
+}
+MOBILE_TRANSMISSIONS = {
+    '2': 'Manuell', '3': 'Automatik', '4': 'Automatik',
+    'MANUAL_GEARBOX': 'Manuell', 'SEMIAUTOMATIC_GEARBOX': 'Automatik', 'AUTOMATIC_GEARBOX': 'Automatik',
+}
+MOBILE_EMISSION_STICKERS = {
+    'EMISSIONSSTICKER_NONE': '1', 'EMISSIONSSTICKER_RED': '2',
+    'EMISSIONSSTICKER_YELLOW': '3', 'EMISSIONSSTICKER_GREEN': '4',
+}
+
+_TRUE_VALUES = {'1', 'true', 'ja', 'yes', 'y', 'x'}
+
+# 1 kW = 1,35962 PS
+KW_TO_PS = 1.35962
+
+
+@dataclass
+class ImportResult:
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    failed: int = 0
+    errors: list = field(default_factory=list)
+
+    def add_error(self, position, listing_number, errors):
+        self.failed += 1
+        if len(self.errors) < IMPORT_MAX_ERRORS:
+            self.errors.append({'line': position, 'listing_number': listing_number, 'errors': errors})
+
+    def to_dict(self):
+        return {
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'unchanged': self.unchanged,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors)
+        }
+
+
+# ============== Einlesen ==============
+
+def _is_true(value) -> bool:
+    return str(value).strip().lower() in _TRUE_VALUES
+
+
+def _kw_to_ps(value):
+    try:
+        return str(round(float(str(value).replace(',', '.')) * KW_TO_PS))
+    except ValueError:
+        return value
+
+
+def _normalize_registration(value: str) -> str:
+    """mobile.de liefert MM.JJJJ, JJJJMM oder JJJJ-MM; gespeichert wird MM/JJJJ."""
+    value = value.strip()
+    if len(value) == 7 and value[2] in './-':
+        return f'{value[:2]}/{value[3:]}'
+    if len(value) == 7 and value[4] == '-':
+        return f'{value[5:]}/{value[:4]}'
+    if len(value) == 6 and value.isdigit():
+        return f'{value[4:]}/{value[:4]}'
+    return value
+
+
+def _text_stream(stream):
+    """Liest einen Byte-Stream als Text (UTF-8 mit/ohne BOM, sonst Windows-1252)."""
+    if isinstance(stream, io.TextIOBase):
+        return stream
+    buffered = stream if hasattr(stream, 'peek') else io.BufferedReader(stream)
+    head = buffered.peek(4096)
+    try:
+        codecs.getincrementaldecoder('utf-8')().decode(head[:4000])
+        encoding = 'utf-8-sig'
+    except UnicodeDecodeError:
+        encoding = 'cp1252'
+    return io.TextIOWrapper(buffered, encoding=encoding, newline='')
+
+
+def iter_csv_records(stream):
+    """
+    Liest Datensätze aus einer CSV-Datei mit Kopfzeile (Trennzeichen ; oder ,).
+    Gibt (Zeilennummer, Felder) zurück.
+    """
+    text = _text_stream(stream)
+    sample = text.readline()
+    delimiter = ';' if sample.count(';') >= sample.count(',') else ','
+    reader = csv.reader(_chain_first(sample, text), delimiter=delimiter)
+
+    header = [name.strip().lower() for name in next(reader, [])]
+    mobile = 'interne_nummer' in header
+    columns = MOBILE_CSV_COLUMNS if mobile else CSV_COLUMNS
+    mapping = [columns.get(name) for name in header]
+
+    for row in reader:
+        if not any(value.strip() for value in row):
+            continue
+        record = {}
+        for name, value in zip(mapping, row):
+            if name:
+                record[name] = value.strip()
+        if mobile:
+            record = _from_mobile_csv(record)
+        yield reader.line_num, record
+
+
+def _chain_first(first_line, rest):
+    yield first_line
+    yield from rest
+
+
+def _from_mobile_csv(record):
+    if 'power_kw' in record:
+        record['power'] = _kw_to_ps(record.pop('power_kw'))
+    if 'fuel_type' in record:
+        record['fuel_type'] = MOBILE_FUEL_TYPES.get(record['fuel_type'], record['fuel_type'])
+    if 'transmission' in record:
+        record['transmission'] = MOBILE_TRANSMISSIONS.get(record['transmission'], record['transmission'])
+    if 'first_registration' in record:
+        record['first_registration'] = _normalize_registration(record['first_registration'])
+    if 'vat_deductible' in record:
+        record['vat_deductible'] = 'ja' if _is_true(record['vat_deductible']) else ''
+    return record
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit('}', 1)[-1]
+
+
+def iter_mobile_xml_records(stream):
+    """
+    Liest Anzeigen aus einem mobile.de-XML-Export (Namensräume werden
+    ignoriert). Gibt (laufende Nummer der Anzeige, Felder) zurück.
+    """
+    position = 0
+    parents = []
+    for event_name, element in ET.iterparse(stream, events=('start', 'end')):
+        if event_name == 'start':
+            parents.append(element)
+            continue
+        parents.pop()
+        if _local_name(element.tag) != 'ad':
+            continue
+        position += 1
+        yield position, _from_mobile_xml(element)
+        # Verarbeitete Anzeigen aus dem Baum lösen, damit der Speicher nicht wächst
+        if parents:
+            parents[-1].remove(element)
+
+
+def _from_mobile_xml(ad):
+    values, features = {}, []
+    model_key = None
+    for element in ad.iter():
+        name = _local_name(element.tag)
+        value = element.get('value')
+        if name == 'seller-inventory-key':
+            values['listing_number'] = value
+        elif name == 'make':
+            values['brand'] = element.get('key')
+        elif name == 'model':
+            model_key = element.get('key')
+        elif name == 'model-description':
+            values['model'] = value
+        elif name == 'cubic-capacity':
+            values['engine_capacity'] = value
+        elif name == 'power':
+            values['power'] = _kw_to_ps(value)
+        elif name == 'fuel':
+            values['fuel_type'] = MOBILE_FUEL_TYPES.get(value, value)
+        elif name == 'gearbox':
+            values['transmission'] = MOBILE_TRANSMISSIONS.get(value, value)
+        elif name == 'mileage':
+            values['mileage'] = value
+        elif name == 'first-registration':
+            values['first_registration'] = _normalize_registration(value or '')
+        elif name == 'emission-sticker':
+            values['eco_badge'] = MOBILE_EMISSION_STICKERS.get(value, value)
+        elif name == 'consumer-price-amount':
+            values['price'] = value
+        elif name == 'vatable':
+            values['vat_deductible'] = 'ja' if _is_true(value) else ''
+        elif name == 'feature' and element.get('key'):
+            features.append(element.get('key').replace('_', ' ').capitalize())
+    values.setdefault('model', model_key)
+    if features:
+        values['features'] = '\n'.join(features)
+    return {name: value.strip() for name, value in values.items() if value is not None}
+
+
+def iter_records(stream, file_format):
+    if file_format == 'xml':
+        return iter_mobile_xml_records(stream)
+    return iter_csv_records(stream)
+
+
+def detect_format(filename: str, content_type: str = '') -> str:
+    if (filename or '').lower().endswith('.xml') or 'xml' in (content_type or ''):
+        return 'xml'
+    return 'csv'
+
+
+# ============== Prüfen und Schreiben ==============
+
+def validate_record(record, form=None):
+    """
+    Prüft einen Datensatz mit den Regeln von CarForm.
+    Gibt (car_data, None) oder (None, Fehler je Feld) zurück. Ein
+    übergebenes Formular wird wiederverwendet (spart das Anlegen pro Zeile).
+    """
+    formdata = MultiDict(record)
+    if 'vat_deductible' in record and not _is_true(record['vat_deductible']):
+        # BooleanField: jeder übermittelte Wert gilt als "an"
+        formdata.pop('vat_deductible')
+    formdata.setdefault('seller', 'Auto Berndl')
+
+    if form is None:
+        form = CarForm(formdata=None, meta={'csrf': False})
+    form.process(formdata)
+    if not form.validate():
+        return None, {name: messages for name, messages in form.errors.items()}
+
+    car_data = {name: getattr(form, name).data for name in FORM_FIELDS}
+    # Wie car_form: eine Ausstattung pro Zeile
+    lines = [line.strip() for line in car_data['features'].splitlines() if line.strip()]
+    car_data['features'] = ', '.join(lines)
+    if 'in_stock' in record:
+        car_data['in_stock'] = _is_true(record['in_stock'])
+    return car_data, None
+
+
+def import_cars(records, batch_size=IMPORT_BATCH_SIZE) -> ImportResult:
+    """Prüft und speichert die Datensätze blockweise (Upsert per Angebotsnummer)."""
+    result = ImportResult()
+    form = CarForm(formdata=None, meta={'csrf': False})
+    batch = []
+    for position, record in records:
+        car_data, errors = validate_record(record, form)
+        if errors:
+            result.add_error(position, record.get('listing_number'), errors)
+            continue
+        batch.append((position, car_data))
+        if len(batch) >= batch_size:
+            _write_batch(batch, result)
+            batch = []
+    if batch:
+        _write_batch(batch, result)
+    return result
+
+
+def _write_batch(batch, result):
+    """Schreibt einen Block in einer Transaktion; schlägt sie fehl, wird zeilenweise wiederholt."""
+    try:
+        inserted, updated, unchanged = _upsert(batch)
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        if len(batch) == 1:
+            position, car_data = batch[0]
+            result.add_error(position, car_data['listing_number'], {'database': ['Speichern fehlgeschlagen']})
+            return
+        for item in batch:
+            _write_batch([item], result)
+        return
+    result.inserted += inserted
+    result.updated += updated
+    result.unchanged += unchanged
+
+
+def _upsert(batch):
+    # Innerhalb eines Blocks gewinnt der letzte Datensatz je Angebotsnummer
+    by_number = {car_data['listing_number']: car_data for _, car_data in batch}
+
+    # Gibt es eine Angebotsnummer mehrfach, wird das zuletzt angelegte Fahrzeug aktualisiert
+    latest_ids = (
+        db.session.query(func.max(Car.id))
+        .filter(Car.listing_number.in_(list(by_number)))
+        .group_by(Car.listing_number)
+    )
+    fields = {name for car_data in by_number.values() for name in car_data}
+    existing = {
+        row.listing_number: row
+        for row in db.session.query(Car.id, Car.version, *[getattr(Car, name) for name in fields])
+        .filter(Car.id.in_(latest_ids))
+    }
+
+    # Unveränderte Fahrzeuge nicht schreiben - sonst steigt die Version und
+    # ETags und PDF-Cache-Schlüssel werden ungültig
+    changed = {
+        number: car_data for number, car_data in by_number.items()
+        if number in existing and any(getattr(existing[number], name) != value for name, value in car_data.items())
+    }
+
+    # Mit der gelesenen Version: SQLAlchemy erhöht sie und prüft sie im WHERE
+    updates = [
+        dict(car_data, id=existing[number].id, version=existing[number].version)
+        for number, car_data in changed.items()
+    ]
+    inserts = [car_data for number, car_data in by_number.items() if number not in existing]
+
+    # executemany: ein Statement pro Block, unabhängig von der Anzahl der Zeilen
+    if updates:
+        db.session.execute(update(Car), updates)
+    if inserts:
+        db.session.execute(insert(Car), inserts)
+
+    # Die Sammel-Statements umgehen das Session-Event - Ausstattung hier indizieren
+    written = list(changed) + [car_data['listing_number'] for car_data in inserts]
+    if written:
+        index_cars(db.session.connection(), db.session.query(Car.id, Car.features).filter(
+            Car.listing_number.in_(written)
+        ).all())
+    return len(inserts), len(updates), len(existing) - len(updates)
+
+
+# ============== CLI ==============
+
+@click.command('import-cars')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(IMPORT_FORMATS), default=None,
+              help='Dateiformat (Standard: anhand der Dateiendung)')
+@with_appcontext
+def import_cars_command(path, file_format):
+    """Importiert Fahrzeuge aus einer CSV- oder mobile.de-Datei."""
+    file_format = file_format or detect_format(path)
+    with open(path, 'rb') as stream:
+        result = import_cars(iter_records(stream, file_format))
+
+    click.echo(f'Neu: {result.inserted}, aktualisiert: {result.updated}, unverändert: {result.unchanged}, '
+               f'fehlerhaft: {result.failed}')
+    for error in result.errors:
+        details = '; '.join(f"{name}: {', '.join(messages)}" for name, messages in error['errors'].items())
+        click.echo(f"Zeile {error['line']} ({error['listing_number'] or '-'}): {details}", err=True)
+
+
+def init_app(app):
+    """Registriert `flask import-cars`."""
+    app.cli.add_command(import_cars_command)
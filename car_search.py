@@ -0,0 +1,133 @@
+# car_search.py
+"""
+Volltextsuche über den Fahrzeugbestand (SQLite FTS5).
+
+Die Suche mit `LIKE '%begriff%'` kann keinen Index nutzen und liest bei
+jeder Anfrage die komplette Tabelle. Stattdessen wird ein FTS5-Index
+(`cars_fts`) über Angebotsnummer, Marke, Modell, Kraftstoff und Getriebe
+geführt, den Trigger bei jedem INSERT/UPDATE/DELETE auf `cars` aktuell
+halten. Jedes Suchwort wird als Präfix gesucht ("gol tdi" findet
+"Golf 2.0 TDI"), Treffer werden nach Relevanz (bm25) sortiert.
+
+Steht FTS5 nicht zur Verfügung (andere Datenbank oder SQLite ohne FTS5),
+sucht `database.build_cars_query` weiter mit LIKE.
+"""
+import re
+
+from sqlalchemy import text, table, column, literal_column, select, func
+from sqlalchemy.exc import OperationalError
+
+FTS_TABLE = 'cars_fts'
+
+# Spalte -> Gewichtung für das Ranking (Treffer in der Angebotsnummer zählen am meisten)
+FTS_COLUMNS = {
+    'listing_number': 10.0,
+    'brand': 5.0,
+    'model': 5.0,
+    'fuel_type': 1.0,
+    'transmission': 1.0,
+}
+
+_columns = ', '.join(FTS_COLUMNS)
+_new_values = ', '.join(f'new.{name}' for name in FTS_COLUMNS)
+_old_values = ', '.join(f'old.{name}' for name in FTS_COLUMNS)
+
+# Externer Inhalt: der Index speichert nur Tokens, die Texte bleiben in `cars`
+SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        {_columns},
+        content='cars', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON cars BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, {_columns}) VALUES (new.id, {_new_values});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON cars BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_columns}) VALUES ('delete', old.id, {_old_values});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF id, {_columns} ON cars BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_columns}) VALUES ('delete', old.id, {_old_values});
+        INSERT INTO {FTS_TABLE}(rowid, {_columns}) VALUES (new.id, {_new_values});
+    END""",
+]
+
+# Gleiche Wortgrenzen wie der unicode61-Tokenizer (Buchstaben und Ziffern)
+_TOKEN_PATTERN = re.compile(r'[^\W_]+')
+
+_fts_table = table(FTS_TABLE, column('rowid'))
+
+_available = False
+
+
+def install_search_index(conn) -> bool:
+    """
+    Legt den FTS5-Index samt Triggern an und baut ihn aus dem Bestand auf
+    (Migration, siehe migrations.py). Gibt zurück, ob FTS5 verfügbar ist.
+    """
+    try:
+        for statement in SCHEMA:
+            conn.execute(text(statement))
+    except OperationalError as e:
+        # z.B. "no such module: fts5"
+        print(f"Volltextsuche nicht verfügbar, verwende LIKE-Suche: {e.orig}")
+        return False
+    conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+    return True
+
+
+def has_search_index(conn) -> bool:
+    """Prüft, ob der Index angelegt ist (nur lesend)."""
+    return conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {'name': FTS_TABLE}
+    ).first() is not None
+
+
+def init_search_index(engine):
+    """
+    Prüft beim Start, ob der Index angelegt ist (nur lesend).
+    Gibt zurück, ob die Volltextsuche verfügbar ist.
+    """
+    global _available
+    _available = False
+    if engine.dialect.name != 'sqlite':
+        return False
+
+    with engine.connect() as conn:
+        _available = has_search_index(conn)
+    return _available
+
+
+def rebuild_search_index(engine):
+    """Baut den Index komplett neu aus der Tabelle `cars` auf."""
+    with engine.begin() as conn:
+        conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+
+
+def is_available() -> bool:
+    return _available
+
+
+def tokenize(search_term: str) -> list:
+    """Zerlegt einen Suchbegriff in Suchwörter."""
+    return _TOKEN_PATTERN.findall(search_term or '')
+
+
+def build_match_query(tokens) -> str:
+    """Baut den FTS5-Ausdruck: alle Wörter müssen vorkommen, jeweils als Präfix."""
+    return ' AND '.join('"{}"*'.format(token.replace('"', '""')) for token in tokens)
+
+
+def match_subquery(tokens):
+    """
+    Unterabfrage mit den Treffern (`car_id`) und ihrem Rang (`rank`,
+    kleiner = relevanter).
+    """
+    fts = literal_column(FTS_TABLE)
+    return select(
+        _fts_table.c.rowid.label('car_id'),
+        func.bm25(fts, *FTS_COLUMNS.values()).label('rank')
+    ).select_from(_fts_table).where(
+        fts.op('MATCH')(build_match_query(tokens))
+    ).subquery()
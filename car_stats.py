@@ -0,0 +1,372 @@
+# car_stats.py
+"""
+Dashboard-Statistiken des Fahrzeugbestands mit Cache.
+
+Alle Kennzahlen (Anzahl, Durchschnittspreis, Durchschnitts-Kilometer,
+diese Woche hinzugefügt, Top-Marken, Kraftstoffe) werden aus einer
+gruppierten Abfrage berechnet und im Prozess zwischengespeichert.
+Der Cache wird verworfen, sobald ein Fahrzeug angelegt, geändert oder
+gelöscht wird (Session-Events), und wenn ein Fahrzeug aus dem
+7-Tage-Fenster "diese Woche hinzugefügt" herausfällt (Timer).
+
+Grundlage ist die Rollup-Tabelle `car_stats_daily` (Anzahl und Summen
+je Tag, Marke, Kraftstoff, Verkäufer und Bestandsstatus), die SQLite-
+Trigger bei jedem INSERT/UPDATE/DELETE auf `cars` fortschreiben. Abfragen
+lesen damit eine Zeile pro Gruppe statt eine pro Fahrzeug. Archivierte
+Fahrzeuge (`cars_archive`, siehe car_archive.py) zählen weiter mit. Ohne
+Trigger (andere Datenbank) wird direkt über `cars` aggregiert.
+
+Der Cache gilt pro Prozess. Damit Änderungen aus anderen Prozessen
+(`flask import-cars`, `flask archive-cars`, Migrationen) sichtbar werden,
+wird er zusätzlich nach höchstens STATS_CACHE_TTL Sekunden neu berechnet.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import event, func, text
+
+from models import db, Car, CarStatsDaily
+
+RECENT_DAYS = 7
+TOP_BRANDS = 5
+STATS_CACHE_TTL = 60  # Sekunden - begrenzt veraltete Werte bei mehreren Prozessen
+
+_SESSION_KEY = 'car_stats_changed'
+
+# ============== Rollup-Tabelle (SQLite-Trigger) ==============
+
+ROLLUP_TABLE = CarStatsDaily.__tablename__
+ROLLUP_GROUP = ['day', 'brand', 'fuel_type', 'seller', 'in_stock']
+
+_group_columns = ', '.join(ROLLUP_GROUP)
+
+
+def _rollup_key(row: str) -> dict:
+    """Gruppenwerte der Zeile `new` bzw. `old` im Trigger."""
+    return {
+        'day': f"coalesce(date({row}.created_at), '')",
+        'brand': f'{row}.brand',
+        'fuel_type': f'{row}.fuel_type',
+        'seller': f'{row}.seller',
+        'in_stock': f'{row}.in_stock',
+    }
+
+
+def _rollup_add(row: str) -> str:
+    key = _rollup_key(row)
+    return f"""INSERT INTO {ROLLUP_TABLE} ({_group_columns}, car_count, price_sum, mileage_sum)
+        VALUES ({', '.join(key[name] for name in ROLLUP_GROUP)}, 1, {row}.price, {row}.mileage)
+        ON CONFLICT ({_group_columns}) DO UPDATE SET
+            car_count = car_count + 1,
+            price_sum = price_sum + excluded.price_sum,
+            mileage_sum = mileage_sum + excluded.mileage_sum;"""
+
+
+def _rollup_remove(row: str) -> str:
+    key = _rollup_key(row)
+    condition = ' AND '.join(f'{name} IS {key[name]}' for name in ROLLUP_GROUP)
+    return f"""UPDATE {ROLLUP_TABLE} SET
+            car_count = car_count - 1,
+            price_sum = price_sum - {row}.price,
+            mileage_sum = mileage_sum - {row}.mileage
+        WHERE {condition};
+        DELETE FROM {ROLLUP_TABLE} WHERE car_count <= 0 AND {condition};"""
+
+
+ROLLUP_TRIGGERS = {
+    f'{ROLLUP_TABLE}_ai': f"""CREATE TRIGGER IF NOT EXISTS {ROLLUP_TABLE}_ai AFTER INSERT ON cars BEGIN
+        {_rollup_add('new')}
+    END""",
+    f'{ROLLUP_TABLE}_ad': f"""CREATE TRIGGER IF NOT EXISTS {ROLLUP_TABLE}_ad AFTER DELETE ON cars BEGIN
+        {_rollup_remove('old')}
+    END""",
+    f'{ROLLUP_TABLE}_au': f"""CREATE TRIGGER IF NOT EXISTS {ROLLUP_TABLE}_au
+        AFTER UPDATE OF created_at, brand, fuel_type, seller, in_stock, price, mileage ON cars BEGIN
+        {_rollup_remove('old')}
+        {_rollup_add('new')}
+    END""",
+}
+
+REBUILD_SQL = f"""INSERT INTO {ROLLUP_TABLE} ({_group_columns}, car_count, price_sum, mileage_sum)
+    SELECT coalesce(date(created_at), ''), brand, fuel_type, seller, in_stock,
+           count(*), coalesce(sum(price), 0), coalesce(sum(mileage), 0)
+    FROM cars
+    GROUP BY 1, 2, 3, 4, 5"""
+
+# Archiv: Verschieben (INSERT ins Archiv, DELETE aus cars) lässt die Summen unverändert
+ARCHIVE_ROLLUP_TRIGGERS = {
+    f'{ROLLUP_TABLE}_archive_ai': f"""CREATE TRIGGER IF NOT EXISTS {ROLLUP_TABLE}_archive_ai
+        AFTER INSERT ON cars_archive BEGIN
+        {_rollup_add('new')}
+    END""",
+    f'{ROLLUP_TABLE}_archive_ad': f"""CREATE TRIGGER IF NOT EXISTS {ROLLUP_TABLE}_archive_ad
+        AFTER DELETE ON cars_archive BEGIN
+        {_rollup_remove('old')}
+    END""",
+}
+
+ARCHIVE_REBUILD_SQL = f"""INSERT INTO {ROLLUP_TABLE} ({_group_columns}, car_count, price_sum, mileage_sum)
+    SELECT coalesce(date(created_at), ''), brand, fuel_type, seller, in_stock,
+           count(*), coalesce(sum(price), 0), coalesce(sum(mileage), 0)
+    FROM cars_archive
+    WHERE true
+    GROUP BY 1, 2, 3, 4, 5
+    ON CONFLICT ({_group_columns}) DO UPDATE SET
+        car_count = car_count + excluded.car_count,
+        price_sum = price_sum + excluded.price_sum,
+        mileage_sum = mileage_sum + excluded.mileage_sum"""
+
+_rollup_available = False
+
+
+def install_stats_rollup(conn):
+    """
+    Legt die Trigger der Rollup-Tabelle an und baut die Tabelle aus dem
+    Bestand auf (Migration, siehe migrations.py).
+    """
+    for statement in ROLLUP_TRIGGERS.values():
+        conn.execute(text(statement))
+    _rebuild(conn)
+
+
+def init_stats_rollup(engine):
+    """
+    Prüft beim Start, ob alle Trigger der Rollup-Tabelle angelegt sind
+    (nur lesend). Ohne Trigger wird direkt über `cars` aggregiert.
+    """
+    global _rollup_available
+    _rollup_available = False
+    if engine.dialect.name != 'sqlite':
+        return False
+
+    with engine.connect() as conn:
+        existing = {name for (name, ) in conn.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'cars'")
+        )}
+    _rollup_available = all(name in existing for name in ROLLUP_TRIGGERS)
+    return _rollup_available
+
+
+def install_archive_rollup(conn):
+    """Legt die Trigger für das Fahrzeugarchiv an (Migration, siehe migrations.py)."""
+    for statement in ARCHIVE_ROLLUP_TRIGGERS.values():
+        conn.execute(text(statement))
+
+
+def _rebuild(conn):
+    conn.execute(text(f'DELETE FROM {ROLLUP_TABLE}'))
+    conn.execute(text(REBUILD_SQL))
+    # Das Archiv gibt es erst ab Migration 7
+    if conn.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'cars_archive'")).first():
+        conn.execute(text(ARCHIVE_REBUILD_SQL))
+
+
+def rebuild_stats_rollup(engine) -> int:
+    """Berechnet die Rollup-Tabelle komplett neu. Gibt die Anzahl der Gruppen zurück."""
+    with engine.begin() as conn:
+        _rebuild(conn)
+        return conn.execute(text(f'SELECT count(*) FROM {ROLLUP_TABLE}')).scalar()
+
+
+def is_rollup_available() -> bool:
+    return _rollup_available
+
+
+# ============== Auswertung ==============
+
+# Dimensionen für Auswertungen: Name -> (Ausdruck auf cars, Ausdruck auf dem Rollup)
+REPORT_DIMENSIONS = {
+    'brand': (Car.brand, CarStatsDaily.brand),
+    'fuel_type': (Car.fuel_type, CarStatsDaily.fuel_type),
+    'seller': (Car.seller, CarStatsDaily.seller),
+    'in_stock': (Car.in_stock, CarStatsDaily.in_stock),
+    'day': (func.coalesce(func.date(Car.created_at), ''), CarStatsDaily.day),
+    'month': (func.substr(func.coalesce(func.date(Car.created_at), ''), 1, 7), func.substr(CarStatsDaily.day, 1, 7)),
+    'year': (func.substr(func.coalesce(func.date(Car.created_at), ''), 1, 4), func.substr(CarStatsDaily.day, 1, 4)),
+}
+
+
+def query_stats_groups(group_by, in_stock=None, date_from=None, date_to=None):
+    """
+    Aggregiert Anzahl und Summen nach den angegebenen Dimensionen
+    (siehe REPORT_DIMENSIONS). Liest aus der Rollup-Tabelle, wenn verfügbar.
+    Gibt Zeilen (Dimensionen..., Anzahl, Preissumme, Kilometersumme) zurück.
+    """
+    source = 1 if _rollup_available else 0
+    dimensions = [REPORT_DIMENSIONS[name][source].label(name) for name in group_by]
+    day = REPORT_DIMENSIONS['day'][source]
+
+    if _rollup_available:
+        measures = [func.sum(CarStatsDaily.car_count), func.sum(CarStatsDaily.price_sum),
+                    func.sum(CarStatsDaily.mileage_sum)]
+        stock_column = CarStatsDaily.in_stock
+    else:
+        measures = [func.count(Car.id), func.sum(Car.price), func.sum(Car.mileage)]
+        stock_column = Car.in_stock
+
+    query = db.session.query(*dimensions, *measures)
+    if not _rollup_available:
+        query = query.select_from(Car)
+    if in_stock is not None:
+        query = query.filter(stock_column == in_stock)
+    if date_from:
+        query = query.filter(day >= date_from)
+    if date_to:
+        query = query.filter(day <= date_to, day != '')
+    if dimensions:
+        query = query.group_by(*dimensions).order_by(*dimensions)
+    return query.all()
+
+
+def compute_car_stats(now=None):
+    """
+    Berechnet die Statistiken der Fahrzeuge im Bestand.
+    Gibt (stats, rollover_at) zurück; rollover_at ist der Zeitpunkt, an dem
+    das älteste Fahrzeug aus "diese Woche hinzugefügt" herausfällt (oder None).
+    """
+    now = now or datetime.now()
+    week_ago = now - timedelta(days=RECENT_DAYS)
+
+    # Eine Zeile pro (Marke, Kraftstoff) - daraus lassen sich alle Kennzahlen ableiten
+    rows = query_stats_groups(['brand', 'fuel_type'], in_stock=True)
+
+    # "Diese Woche": sekundengenau über den Index auf created_at (nur neue Fahrzeuge)
+    recent_count, oldest_recent = db.session.query(
+        func.count(Car.id), func.min(Car.created_at)
+    ).filter(Car.in_stock == True, Car.created_at >= week_ago).one()
+
+    total = price_sum = mileage_sum = 0
+    brands, fuel_types = {}, {}
+    for brand, fuel_type, count, group_price, group_mileage in rows:
+        total += count
+        price_sum += group_price or 0
+        mileage_sum += group_mileage or 0
+        brands[brand] = brands.get(brand, 0) + count
+        fuel_types[fuel_type] = fuel_types.get(fuel_type, 0) + count
+
+    top_brands = sorted(brands.items(), key=lambda item: (-item[1], item[0]))[:TOP_BRANDS]
+
+    stats = {
+        'total': total,
+        'avg_price': round(price_sum / total, 2) if total else 0,
+        'avg_mileage': round(mileage_sum / total, 2) if total else 0,
+        'recent_count': recent_count,
+        'brands': [{'brand': brand, 'count': count} for brand, count in top_brands],
+        'fuel_types': [{'fuel_type': fuel_type, 'count': count} for fuel_type, count in sorted(fuel_types.items())]
+    }
+    rollover_at = oldest_recent + timedelta(days=RECENT_DAYS) if oldest_recent is not None else None
+    return stats, rollover_at
+
+
+class CarStatsCache:
+    """Hält die zuletzt berechneten Statistiken bis zur nächsten Änderung (höchstens STATS_CACHE_TTL)."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._stats = None
+        self._expires_at = 0.0
+        self._generation = 0  # wird bei jeder Invalidierung erhöht
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Registriert die Session-Events, die den Cache invalidieren, und `flask rebuild-stats`."""
+        event.listen(db.session, 'after_flush', _collect_changes)
+        event.listen(db.session, 'do_orm_execute', _collect_bulk_changes)
+        event.listen(db.session, 'after_commit', self._after_commit)
+        event.listen(db.session, 'after_rollback', _discard_changes)
+        app.cli.add_command(rebuild_stats_command)
+
+    def get(self) -> dict:
+        """Gibt die Statistiken zurück (aus dem Cache oder neu berechnet)."""
+        now = time.monotonic()
+        with self._lock:
+            if self._stats is not None and self._expires_at > now:
+                self.hits += 1
+                return self._stats
+            self.misses += 1
+            generation = self._generation
+
+        stats, rollover_at = compute_car_stats()
+
+        with self._lock:
+            # Während der Berechnung geändert: Ergebnis nicht cachen
+            if generation == self._generation:
+                self._stats = stats
+                self._expires_at = now + STATS_CACHE_TTL
+                self._schedule_rollover(rollover_at)
+        return stats
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._stats = None
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def _schedule_rollover(self, rollover_at):
+        """Invalidiert den Cache, wenn das älteste neue Fahrzeug älter als eine Woche wird."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if rollover_at is None:
+            return
+        delay = max(0.0, (rollover_at - datetime.now()).total_seconds()) + 1
+        self._timer = threading.Timer(delay, self.invalidate)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _after_commit(self, session):
+        # Erneut invalidieren: ein paralleler Request kann zwischen Flush und
+        # Commit noch den alten Stand gelesen und gecacht haben
+        if session.info.pop(_SESSION_KEY, False):
+            self.invalidate()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'cached': self._stats is not None and self._expires_at > time.monotonic(),
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+def _collect_changes(session, flush_context):
+    """Invalidiert den Cache, sobald Fahrzeuge geschrieben werden."""
+    changed = any(isinstance(obj, Car) for obj in list(session.new) + list(session.dirty) + list(session.deleted))
+    if changed:
+        session.info[_SESSION_KEY] = True
+        car_stats.invalidate()
+
+
+def _collect_bulk_changes(orm_execute_state):
+    """Erfasst INSERT/UPDATE/DELETE-Statements auf Fahrzeuge (ohne Flush einzelner Objekte)."""
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        mappers = orm_execute_state.all_mappers
+        if any(mapper.class_ is Car for mapper in mappers):
+            orm_execute_state.session.info[_SESSION_KEY] = True
+            car_stats.invalidate()
+
+
+def _discard_changes(session):
+    session.info.pop(_SESSION_KEY, None)
+
+
+@click.command('rebuild-stats')
+@with_appcontext
+def rebuild_stats_command():
+    """Berechnet die Statistik-Tabelle car_stats_daily aus dem Bestand neu."""
+    if not is_rollup_available():
+        raise click.ClickException('Statistik-Tabelle nicht verfügbar (nur mit SQLite)')
+    groups = rebuild_stats_rollup(db.engine)
+    car_stats.invalidate()
+    click.echo(f'Statistik neu berechnet: {groups} Gruppen')
+
+
+# Globale Instanz
+car_stats = CarStatsCache()
@@ -0,0 +1,96 @@
+# conditional_requests.py
+"""
+Bedingte Requests (ETag / Last-Modified / If-Match) für Fahrzeuge und
+Aufnahmeblätter.
+
+Die Bearbeiten-Dialoge laden `GET /car/<id>` bzw. `/api/intake/<id>` bei
+jedem Öffnen komplett neu. Cars und VehicleIntake führen dafür eine
+Zeilenversion (`version`, von SQLAlchemy bei jedem UPDATE erhöht und als
+Bedingung geprüft) und `updated_at`. Daraus werden starke ETags und
+Last-Modified gebildet; mit `Cache-Control: no-cache` fragt der Browser
+bei jedem Öffnen nach und bekommt bei unverändertem Datensatz
+`304 Not Modified` - ermittelt über zwei Spalten, ohne das Objekt zu
+laden oder zu serialisieren.
+
+Ein PUT mit `If-Match` wird mit `412 Precondition Failed` abgelehnt,
+wenn der Datensatz inzwischen geändert wurde (verlorene Änderungen).
+Ohne If-Match bleibt das bisherige Verhalten.
+"""
+from datetime import timezone
+
+from flask import current_app, jsonify, request
+
+from models import db
+
+CONFLICT_MESSAGE = 'Der Datensatz wurde zwischenzeitlich geändert - bitte neu laden'
+
+# Erhöhen, wenn sich die Ausgabe von to_dict() ändert (2: cars.sold_at) -
+# gecachte Darstellungen werden dann einmalig neu geladen
+REPRESENTATION_VERSION = 2
+
+
+def row_etag(table: str, row_id: int, version: int) -> str:
+    """Starker ETag eines Datensatzes (ohne Anführungszeichen)."""
+    return f'{table}-{row_id}-v{version}-r{REPRESENTATION_VERSION}'
+
+
+def get_row_validators(model, row_id):
+    """
+    Liest (version, last_modified) eines Datensatzes, ohne ihn zu laden.
+    Gibt None zurück, wenn es den Datensatz nicht gibt.
+    """
+    row = (
+        db.session.query(model.version, model.updated_at, model.created_at)
+        .filter(model.id == row_id)
+        .first()
+    )
+    if row is None:
+        return None
+    return row.version, row.updated_at or row.created_at
+
+
+def _as_utc(value):
+    # SQLite liefert CURRENT_TIMESTAMP (UTC) ohne Zeitzone
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.replace(microsecond=0)
+
+
+def is_not_modified(etag: str, last_modified=None) -> bool:
+    """Prüft If-None-Match (vorrangig) bzw. If-Modified-Since des Requests."""
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    last_modified = _as_utc(last_modified)
+    if last_modified and request.if_modified_since:
+        return last_modified <= request.if_modified_since
+    return False
+
+
+def set_validators(response, etag: str, last_modified=None):
+    """Setzt ETag, Last-Modified und Revalidierung bei jedem Abruf."""
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = _as_utc(last_modified)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def not_modified(etag: str, last_modified=None):
+    """Leere 304-Antwort mit den aktuellen Validatoren."""
+    return set_validators(current_app.response_class(status=304), etag, last_modified)
+
+
+def if_match_failed(etag: str) -> bool:
+    """True, wenn der Request If-Match sendet und der ETag nicht (mehr) passt."""
+    return bool(request.if_match) and not request.if_match.contains(etag)
+
+
+def precondition_failed(etag: str):
+    """412-Antwort mit dem aktuellen ETag, damit der Client neu laden kann."""
+    response = jsonify({'error': CONFLICT_MESSAGE})
+    response.status_code = 412
+    response.set_etag(etag)
+    return response
@@ -1,38 +1,349 @@
 # database.py
-from models import db, Car
-from sqlalchemy import or_, desc
+from models import db, Car, CarArchive
+from sqlalchemy import or_, and_, desc, type_coerce, case, cast, func, update, delete, DateTime, String, Integer
+from datetime import datetime
+import base64
+import binascii
+import json
+import car_search
+import feature_index
 
-def get_all_cars(search_term=None, sort_by='id', sort_order='asc'):
-    """Retrieves all cars with optional search and sort parameters using SQLAlchemy."""
+def _filter_cars_like(query, tokens, model=Car):
+    """LIKE fallback: every token must appear in one of the searchable columns."""
+    conditions = []
+    for token in tokens:
+        search_pattern = f'%{token}%'
+        conditions.append(or_(
+            model.listing_number.like(search_pattern),
+            model.brand.like(search_pattern),
+            model.model.like(search_pattern),
+            model.fuel_type.like(search_pattern),
+            model.transmission.like(search_pattern)
+        ))
+    return query.filter(and_(*conditions))
+
+
+CAR_SORT_COLUMNS = {
+    'id': Car.id,
+    'listing_number': Car.listing_number,
+    'brand': Car.brand,
+    'model': Car.model,
+    'price': Car.price,
+    'created_at': Car.created_at
+}
+
+
+def _build_filtered_cars_query(search_term=None, sort_by='id', sort_order='asc', features=None):
+    """
+    Builds the filtered car query and resolves the sort key.
+    Returns (query, sort_column, descending).
+
+    Searches the FTS5 index when available (prefix match per token, all
+    tokens required). sort_by='relevance' sorts search hits by rank.
+    features (names or catalogue codes) must all be present on the car.
+    """
     query = Car.query
+    rank = None
+
+    if features:
+        condition = feature_index.car_feature_condition(features)
+        if condition is not None:
+            query = query.filter(condition)
 
     if search_term:
-        search_pattern = f'%{search_term}%'
-        query = query.filter(or_(
-            Car.listing_number.like(search_pattern),
-            Car.brand.like(search_pattern),
-            Car.model.like(search_pattern),
-            Car.fuel_type.like(search_pattern),
-            Car.transmission.like(search_pattern)
-        ))
+        tokens = car_search.tokenize(search_term)
+        if tokens and car_search.is_available():
+            matches = car_search.match_subquery(tokens)
+            query = query.join(matches, matches.c.car_id == Car.id)
+            rank = matches.c.rank
+        else:
+            query = _filter_cars_like(query, tokens or [search_term])
+
+    if sort_by == 'relevance' and rank is not None:
+        # Best match first
+        return query, rank, False
+
+    sort_column = CAR_SORT_COLUMNS.get(sort_by, Car.id)
+    return query, sort_column, sort_order.lower() == 'desc'
+
+
+def _build_archive_query(search_term=None, sort_by='id', sort_order='asc', features=None):
+    """
+    Same as _build_filtered_cars_query for archived cars.
+    The archive has no FTS index (LIKE search) and no feature links
+    (text match on features); relevance falls back to the ID.
+    """
+    query = CarArchive.query
+
+    if features:
+        condition = feature_index.archive_feature_condition(features)
+        if condition is not None:
+            query = query.filter(condition)
+
+    if search_term:
+        query = _filter_cars_like(query, car_search.tokenize(search_term) or [search_term], CarArchive)
+
+    sort_column = getattr(CarArchive, CAR_SORT_COLUMNS.get(sort_by, Car.id).key)
+    return query, sort_column, sort_order.lower() == 'desc'
+
+
+def build_archive_query(search_term=None, sort_by='id', sort_order='asc', features=None):
+    """Builds the filtered and sorted archive query without executing it."""
+    query, sort_column, descending = _build_archive_query(search_term, sort_by, sort_order, features)
+    if descending:
+        return query.order_by(desc(sort_column), desc(CarArchive.id))
+    return query.order_by(sort_column, CarArchive.id)
+
+
+def build_cars_query(search_term=None, sort_by='id', sort_order='asc', features=None):
+    """Builds the filtered and sorted car query without executing it."""
+    query, sort_column, descending = _build_filtered_cars_query(search_term, sort_by, sort_order, features)
+
+    # The ID breaks ties so the order is stable (required for keyset pagination)
+    if descending:
+        return query.order_by(desc(sort_column), desc(Car.id))
+    return query.order_by(sort_column, Car.id)
+
+
+def get_all_cars(search_term=None, sort_by='id', sort_order='asc', features=None):
+    """Retrieves all cars with optional search and sort parameters using SQLAlchemy."""
+    return build_cars_query(search_term, sort_by, sort_order, features).all()
+
+
+def _keyset_filter(sort_column, value, last_id, descending, id_column=Car.id):
+    """Condition for all rows after (value, last_id) in the sort order (SQLite sorts NULL first)."""
+    if descending:
+        if value is None:
+            return and_(sort_column.is_(None), id_column < last_id)
+        return or_(sort_column < value, and_(sort_column == value, id_column < last_id), sort_column.is_(None))
+    if value is None:
+        return or_(and_(sort_column.is_(None), id_column > last_id), sort_column.isnot(None))
+    return or_(sort_column > value, and_(sort_column == value, id_column > last_id))
+
+
+def encode_cursor(sort_key, value, last_id):
+    """Encodes the position after a row as an opaque, URL-safe cursor."""
+    if isinstance(value, datetime):
+        value = {'datetime': value.isoformat()}
+    payload = json.dumps([sort_key, value, last_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, sort_key):
+    """Decodes a cursor; raises ValueError if it is invalid or was issued for another sort order."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort_key, value, last_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if isinstance(value, dict):
+            value = datetime.fromisoformat(value['datetime'])
+        last_id = int(last_id)
+    except (ValueError, TypeError, KeyError, binascii.Error):
+        raise ValueError('Ungültiger Cursor')
+    if cursor_sort_key != sort_key:
+        raise ValueError('Cursor passt nicht zur Sortierung')
+    return value, last_id
+
+
+# Archived cars follow the live results; their cursors carry this prefix
+ARCHIVE_CURSOR_PREFIX = 'archive.'
+ARCHIVE_START_CURSOR = 'archive'
+
 
-    valid_columns = {
-        'id': Car.id,
-        'listing_number': Car.listing_number,
-        'brand': Car.brand,
-        'model': Car.model,
-        'price': Car.price,
-        'created_at': Car.created_at
-    }
+def _fetch_page(query, sort_column, descending, id_column, sort_key, cursor, limit):
+    """Runs one keyset page query; returns up to limit + 1 (row, sort value) pairs."""
+    if isinstance(getattr(sort_column, 'type', None), DateTime):
+        # Compare the stored value as-is: SQLite keeps timestamps as text and
+        # server defaults have no microseconds, bound datetimes always do
+        sort_column = type_coerce(sort_column, String)
 
-    sort_column = valid_columns.get(sort_by, Car.id)
+    if cursor:
+        value, last_id = decode_cursor(cursor, sort_key)
+        query = query.filter(_keyset_filter(sort_column, value, last_id, descending, id_column))
 
-    if sort_order.lower() == 'desc':
-        query = query.order_by(desc(sort_column))
+    if descending:
+        query = query.order_by(desc(sort_column), desc(id_column))
     else:
-        query = query.order_by(sort_column)
+        query = query.order_by(sort_column, id_column)
 
-    return query.all()
+    # The sort value is selected with the row (the search rank is not a Car attribute)
+    return query.add_columns(sort_column).limit(limit + 1).all()
+
+
+def get_cars_page(search_term=None, sort_by='id', sort_order='asc', cursor=None, limit=50, features=None,
+                  include_archive=False):
+    """
+    Returns one page of cars using keyset pagination.
+    Returns (cars, next_cursor); next_cursor is None on the last page.
+    Raises ValueError for an invalid cursor.
+
+    include_archive appends the matching archived cars (CarArchive) after
+    the live results, in the same sort order.
+    """
+    query, sort_column, descending = _build_filtered_cars_query(search_term, sort_by, sort_order, features)
+    sort_key = f"{sort_by}:{'desc' if descending else 'asc'}"
+
+    rows = []
+    archive_cursor = None
+    if include_archive and cursor and cursor.startswith(ARCHIVE_START_CURSOR):
+        # Live results are exhausted
+        archive_cursor = cursor[len(ARCHIVE_CURSOR_PREFIX):] if cursor != ARCHIVE_START_CURSOR else None
+    else:
+        rows = _fetch_page(query, sort_column, descending, Car.id, sort_key, cursor, limit)
+        if len(rows) > limit or not include_archive:
+            return _page_result(rows, limit, sort_key)
+
+    archive_query, archive_sort, _ = _build_archive_query(search_term, sort_by, sort_order, features)
+    archive_rows = _fetch_page(archive_query, archive_sort, descending, CarArchive.id,
+                               sort_key, archive_cursor, limit - len(rows))
+    if rows and archive_rows and len(rows) == limit:
+        # Page filled exactly by live cars: the next page starts the archive
+        return [car for car, _ in rows], ARCHIVE_START_CURSOR
+
+    cars, next_cursor = _page_result(archive_rows, limit - len(rows), sort_key)
+    if next_cursor:
+        next_cursor = ARCHIVE_CURSOR_PREFIX + next_cursor
+    return [car for car, _ in rows] + cars, next_cursor
+
+
+def _page_result(rows, limit, sort_key):
+    """Splits the lookahead row off and encodes the cursor after the last returned row."""
+    cars = [car for car, _ in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last_car, last_value = rows[limit - 1]
+        next_cursor = encode_cursor(sort_key, last_value, last_car.id)
+    return cars, next_cursor
+
+
+def count_cars(search_term=None, features=None):
+    """Counts the cars matching a search term and feature filter."""
+    query, _, _ = _build_filtered_cars_query(search_term, features=features)
+    return query.order_by(None).count()
+
+
+def count_archived_cars(search_term=None, features=None):
+    """Counts the archived cars matching a search term and feature filter."""
+    query, _, _ = _build_archive_query(search_term, features=features)
+    return query.order_by(None).count()
+
+
+def iter_cars_by_ids(car_ids, chunk_size=200):
+    """Yields cars for the given IDs in the given order, loading them in chunks."""
+    for start in range(0, len(car_ids), chunk_size):
+        chunk = car_ids[start:start + chunk_size]
+        cars = {car.id: car for car in Car.query.filter(Car.id.in_(chunk))}
+        for car_id in chunk:
+            if car_id in cars:
+                yield cars[car_id]
+
+
+# Fields that can be changed for many cars at once
+BULK_UPDATE_FIELDS = {
+    'in_stock': bool,
+    'vat_deductible': bool,
+    'seller': str,
+    'price': int,
+}
+BULK_SELLERS = ('Auto Berndl', 'Im Auftrag')
+
+
+def _bulk_condition(car_ids=None, filters=None, exclude_ids=None):
+    """
+    WHERE clause for a bulk operation: either explicit IDs or a filter like
+    /view-cars (`search`, optionally `features` and `in_stock`), minus
+    `exclude_ids`.
+    """
+    if car_ids is not None:
+        if not isinstance(car_ids, list) or not all(isinstance(car_id, int) for car_id in car_ids):
+            raise ValueError('ids muss eine Liste von Fahrzeug-IDs sein')
+        if not car_ids:
+            raise ValueError('Keine Fahrzeuge ausgewählt')
+        condition = Car.id.in_(car_ids)
+    elif isinstance(filters, dict):
+        features = filters.get('features')
+        if features is not None and (not isinstance(features, list)
+                                     or not all(isinstance(value, (str, int)) for value in features)):
+            raise ValueError('features muss eine Liste von Ausstattungsmerkmalen sein')
+        query, _, _ = _build_filtered_cars_query(filters.get('search') or None, features=features)
+        if filters.get('in_stock') is not None:
+            query = query.filter(Car.in_stock == bool(filters['in_stock']))
+        # The search may join the FTS index - select the matching IDs in a subquery
+        condition = Car.id.in_(query.with_entities(Car.id).order_by(None).statement)
+    else:
+        raise ValueError('Keine Fahrzeuge ausgewählt')
+
+    if exclude_ids:
+        if not isinstance(exclude_ids, list) or not all(isinstance(car_id, int) for car_id in exclude_ids):
+            raise ValueError('exclude_ids muss eine Liste von Fahrzeug-IDs sein')
+        condition = and_(condition, Car.id.notin_(exclude_ids))
+    return condition
+
+
+def build_car_patch(changes):
+    """
+    Validates a bulk patch and returns the column values for the UPDATE.
+    Besides the fields in BULK_UPDATE_FIELDS, the price can be adjusted
+    relative to the current price with `price_change` (amount) or
+    `price_percent` (percentage); the result is never below 0.
+    """
+    if not isinstance(changes, dict) or not changes:
+        raise ValueError('Keine Änderungen angegeben')
+
+    values = {}
+    for name, value in changes.items():
+        if name in ('price_change', 'price_percent'):
+            continue
+        expected = BULK_UPDATE_FIELDS.get(name)
+        if expected is None:
+            raise ValueError(f'Feld kann nicht gesammelt geändert werden: {name}')
+        if not isinstance(value, expected) or (expected is int and isinstance(value, bool)):
+            raise ValueError(f'Ungültiger Wert für {name}')
+        values[name] = value
+
+    if 'seller' in values and values['seller'] not in BULK_SELLERS:
+        raise ValueError('Ungültiger Verkäufer')
+
+    price_changes = [name for name in ('price', 'price_change', 'price_percent') if name in changes]
+    if len(price_changes) > 1:
+        raise ValueError('Preis nur auf eine Art ändern (price, price_change oder price_percent)')
+    if 'price' in values and values['price'] < 0:
+        raise ValueError('Preis darf nicht negativ sein')
+
+    if 'price_change' in changes:
+        amount = changes['price_change']
+        if not isinstance(amount, int) or isinstance(amount, bool):
+            raise ValueError('Ungültiger Wert für price_change')
+        new_price = Car.price + amount
+        values['price'] = case((new_price < 0, 0), else_=new_price)
+    elif 'price_percent' in changes:
+        percent = changes['price_percent']
+        if not isinstance(percent, (int, float)) or isinstance(percent, bool) or not -100 <= percent <= 1000:
+            raise ValueError('Ungültiger Wert für price_percent')
+        values['price'] = cast(func.round(Car.price * (1 + percent / 100.0)), Integer)
+    return values
+
+
+def bulk_update_cars(changes, car_ids=None, filters=None, exclude_ids=None):
+    """Applies a patch to all selected cars in one UPDATE statement. Returns the number of cars."""
+    values = build_car_patch(changes)
+    # Sammel-UPDATE umgeht die Versionsprüfung der Session - Version selbst erhöhen
+    values['version'] = Car.version + 1
+    condition = _bulk_condition(car_ids, filters, exclude_ids)
+    result = db.session.execute(
+        update(Car).where(condition).values(**values).execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def bulk_delete_cars(car_ids=None, filters=None, exclude_ids=None):
+    """Deletes all selected cars in one DELETE statement. Returns the number of cars."""
+    condition = _bulk_condition(car_ids, filters, exclude_ids)
+    result = db.session.execute(
+        delete(Car).where(condition).execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
 
 
 def get_car_by_id(car_id):
@@ -61,7 +372,8 @@ def update_car(car_id, car_data):
             car_data['features'] = ', '.join(car_data['features'])
             
         for key, value in car_data.items():
-            setattr(car, key, value)
+            if key not in Car.READONLY_FIELDS:
+                setattr(car, key, value)
         db.session.commit()
     return car
 
@@ -0,0 +1,335 @@
+# feature_index.py
+"""
+Merkmalskatalog und normalisierte Ausstattungs-Zuordnung.
+
+`Car.features` ist ein Freitext (durch Komma/Zeilen getrennt), die
+Ausstattung der Aufnahmeblätter steht als JSON-Text in acht Feldern.
+Eine Frage wie "alle Fahrzeuge mit Navigation und Anhängerkupplung"
+müsste jede Zeile lesen und zerlegen. Deshalb werden alle Merkmale im
+Katalog `features` mit festem Integer-Code geführt (vorbelegt aus den
+`get_*_options`-Listen, neue Freitext-Merkmale kommen automatisch hinzu)
+und je Fahrzeug bzw. Aufnahmeblatt in den Zuordnungstabellen
+`car_features` / `intake_features` abgelegt (Index auf Merkmal + ID).
+
+Die Zuordnung ist ein abgeleiteter Index: `to_dict()` und die
+Quellspalten bleiben unverändert. Sie wird beim Flush von Fahrzeugen und
+Aufnahmeblättern mitgeschrieben (Session-Event), beim Sammelimport
+explizit und beim Löschen per Trigger bereinigt.
+"""
+import json
+import re
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import event, select, insert, delete, text, func, and_, or_, inspect
+
+from models import db, Car, CarArchive, VehicleIntake, Feature, CarFeature, IntakeFeature
+
+CAR_CATEGORY = 'car'
+
+# Kategorie (JSON-Feld im Aufnahmeblatt) -> Optionen; die Reihenfolge
+# bestimmt die Codes beim ersten Anlegen, danach bleiben sie fest
+INTAKE_CATEGORIES = {
+    'fuel_types': VehicleIntake.get_fuel_type_options,
+    'exterior_features': VehicleIntake.get_exterior_feature_options,
+    'interior_materials': VehicleIntake.get_interior_material_options,
+    'comfort_features': VehicleIntake.get_comfort_feature_options,
+    'infotainment_features': VehicleIntake.get_infotainment_feature_options,
+    'safety_features': VehicleIntake.get_safety_feature_options,
+    'airbags': VehicleIntake.get_airbag_options,
+    'parking_features': VehicleIntake.get_parking_feature_options,
+}
+
+INDEX_CHUNK_SIZE = 500
+
+_features = Feature.__table__
+_car_features = CarFeature.__table__
+_intake_features = IntakeFeature.__table__
+
+# Löschen ohne aktivierte Foreign Keys (SQLite): Zuordnungen per Trigger entfernen
+TRIGGERS = {
+    'car_features_ad': """CREATE TRIGGER IF NOT EXISTS car_features_ad AFTER DELETE ON cars BEGIN
+        DELETE FROM car_features WHERE car_id = old.id;
+    END""",
+    'intake_features_ad': """CREATE TRIGGER IF NOT EXISTS intake_features_ad AFTER DELETE ON vehicle_intakes BEGIN
+        DELETE FROM intake_features WHERE intake_id = old.id;
+    END""",
+}
+
+_SEPARATORS = re.compile(r'[,\n\r]+')
+
+
+def feature_key(name: str) -> str:
+    """Normalisierter Suchschlüssel (Groß-/Kleinschreibung und Leerraum egal)."""
+    return ' '.join(name.split()).casefold()
+
+
+def parse_car_features(features) -> list:
+    """Zerlegt Car.features (Komma- oder zeilengetrennt) in einzelne Merkmale."""
+    names, seen = [], set()
+    for name in _SEPARATORS.split(features or ''):
+        name = ' '.join(name.split())
+        if name and feature_key(name) not in seen:
+            seen.add(feature_key(name))
+            names.append(name)
+    return names
+
+
+def parse_intake_features(values: dict) -> list:
+    """Liest die JSON-Felder eines Aufnahmeblatts als Liste (Kategorie, Merkmal)."""
+    pairs = []
+    for category in INTAKE_CATEGORIES:
+        raw = values.get(category)
+        try:
+            items = json.loads(raw) if isinstance(raw, str) else (raw or [])
+        except json.JSONDecodeError:
+            items = []
+        if not isinstance(items, list):
+            continue
+        for item in items:
+            if isinstance(item, str) and item.strip():
+                pairs.append((category, ' '.join(item.split())))
+    return pairs
+
+
+# ============== Katalog ==============
+
+def _lookup_features(conn, wanted) -> dict:
+    """(Kategorie, Schlüssel) -> Code für die vorhandenen Merkmale."""
+    found = {}
+    keys = list({key for _, key in wanted})
+    for start in range(0, len(keys), INDEX_CHUNK_SIZE):
+        rows = conn.execute(
+            select(_features.c.id, _features.c.category, _features.c.key)
+            .where(_features.c.key.in_(keys[start:start + INDEX_CHUNK_SIZE]))
+        )
+        for feature_id, category, key in rows:
+            if (category, key) in wanted:
+                found[(category, key)] = feature_id
+    return found
+
+
+def ensure_features(conn, pairs) -> dict:
+    """
+    Gibt die Codes für (Kategorie, Name)-Paare zurück und legt fehlende
+    Merkmale im Katalog an. Ergebnis: (Kategorie, Schlüssel) -> Code.
+    """
+    wanted = {}
+    for category, name in pairs:
+        wanted.setdefault((category, feature_key(name)), name)
+    if not wanted:
+        return {}
+
+    ids = _lookup_features(conn, wanted)
+    missing = [(category, key) for category, key in wanted if (category, key) not in ids]
+    if missing:
+        conn.execute(insert(_features), [
+            {'category': category, 'name': wanted[(category, key)], 'key': key}
+            for category, key in missing
+        ])
+        ids.update(_lookup_features(conn, {pair: wanted[pair] for pair in missing}))
+    return ids
+
+
+def seed_catalogue(conn):
+    """Legt alle Optionen der Aufnahmeblatt-Listen im Katalog an (fehlende werden ergänzt)."""
+    ensure_features(conn, [
+        (category, name)
+        for category, get_options in INTAKE_CATEGORIES.items()
+        for name in get_options()
+    ])
+
+
+# ============== Zuordnungen schreiben ==============
+
+def _replace_links(conn, table, owner_column, owners):
+    """owners: Liste (ID, [(Kategorie, Name), ...]) - ersetzt deren Zuordnungen."""
+    for start in range(0, len(owners), INDEX_CHUNK_SIZE):
+        chunk = owners[start:start + INDEX_CHUNK_SIZE]
+        conn.execute(delete(table).where(table.c[owner_column].in_([owner_id for owner_id, _ in chunk])))
+
+        ids = ensure_features(conn, [pair for _, pairs in chunk for pair in pairs])
+        links = {
+            (owner_id, ids[(category, feature_key(name))])
+            for owner_id, pairs in chunk
+            for category, name in pairs
+        }
+        if links:
+            conn.execute(insert(table), [
+                {owner_column: owner_id, 'feature_id': feature_id} for owner_id, feature_id in links
+            ])
+
+
+def index_cars(conn, rows):
+    """Schreibt die Zuordnungen für (car_id, features)-Zeilen neu."""
+    owners = [(car_id, [(CAR_CATEGORY, name) for name in parse_car_features(features)]) for car_id, features in rows]
+    _replace_links(conn, _car_features, 'car_id', owners)
+
+
+def index_intakes(conn, intakes):
+    """Schreibt die Zuordnungen für Aufnahmeblätter (Objekte oder Dicts mit `id`) neu."""
+    owners = []
+    for intake in intakes:
+        values = intake if isinstance(intake, dict) else {
+            category: getattr(intake, category) for category in INTAKE_CATEGORIES
+        }
+        intake_id = values['id'] if isinstance(intake, dict) else intake.id
+        owners.append((intake_id, parse_intake_features(values)))
+    _replace_links(conn, _intake_features, 'intake_id', owners)
+
+
+def rebuild_feature_index(conn) -> tuple:
+    """Baut alle Zuordnungen aus den Quellspalten neu auf. Gibt (Fahrzeuge, Aufnahmeblätter) zurück."""
+    conn.execute(delete(_car_features))
+    conn.execute(delete(_intake_features))
+    seed_catalogue(conn)
+
+    cars = conn.execute(select(Car.id, Car.features)).fetchall()
+    index_cars(conn, cars)
+
+    columns = [VehicleIntake.id] + [getattr(VehicleIntake, category) for category in INTAKE_CATEGORIES]
+    intakes = [dict(row._mapping) for row in conn.execute(select(*columns))]
+    index_intakes(conn, intakes)
+    return len(cars), len(intakes)
+
+
+def install_feature_index(conn):
+    """
+    Legt die Lösch-Trigger an und baut Katalog und Zuordnungen aus dem
+    Bestand auf (Migration, siehe migrations.py). Neue Optionen landen
+    danach beim ersten Speichern über ensure_features im Katalog.
+    """
+    if conn.dialect.name == 'sqlite':
+        for statement in TRIGGERS.values():
+            conn.execute(text(statement))
+    rebuild_feature_index(conn)
+
+
+# ============== Session-Event ==============
+
+def _changed(obj, attributes) -> bool:
+    state = inspect(obj)
+    return any(state.attrs[name].history.has_changes() for name in attributes)
+
+
+def _index_flushed(session, flush_context):
+    """Schreibt die Zuordnungen neuer oder geänderter Fahrzeuge/Aufnahmeblätter in derselben Transaktion."""
+    cars, intakes = [], []
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Car) and (obj in session.new or _changed(obj, ['features'])):
+            cars.append((obj.id, obj.features))
+        elif isinstance(obj, VehicleIntake) and (obj in session.new or _changed(obj, INTAKE_CATEGORIES)):
+            intakes.append(obj)
+
+    if cars or intakes:
+        conn = session.connection()
+        if cars:
+            index_cars(conn, cars)
+        if intakes:
+            index_intakes(conn, intakes)
+
+
+# ============== Abfragen ==============
+
+def _split_terms(values):
+    """Trennt Filterwerte in Codes (Ziffern) und Namen (normalisiert)."""
+    codes, keys = [], []
+    for value in values:
+        value = str(value).strip()
+        if value.isdigit():
+            codes.append(int(value))
+        elif value:
+            keys.append(feature_key(value))
+    return codes, keys
+
+
+def _owners_with(table, owner_column, term_condition):
+    return (
+        select(table.c[owner_column])
+        .join(_features, _features.c.id == table.c.feature_id)
+        .where(term_condition)
+    )
+
+
+def _feature_condition(id_column, table, owner_column, values, match='all'):
+    codes, keys = _split_terms(values)
+    terms = [_features.c.id == code for code in codes] + [_features.c.key == key for key in keys]
+    if not terms:
+        return None
+    if match == 'any':
+        return id_column.in_(_owners_with(table, owner_column, or_(*terms)))
+    # Alle Merkmale: je Merkmal eine Teilabfrage über den Index (Merkmal, ID)
+    return and_(*[id_column.in_(_owners_with(table, owner_column, term)) for term in terms])
+
+
+def car_feature_condition(values, match='all'):
+    """
+    WHERE-Bedingung für Fahrzeuge mit allen (match='all') bzw. mindestens
+    einem (match='any') der Merkmale. Werte sind Namen oder Codes.
+    Gibt None zurück, wenn keine Merkmale angegeben sind.
+    """
+    return _feature_condition(Car.id, _car_features, 'car_id', values, match)
+
+
+def archive_feature_condition(values, match='all'):
+    """
+    Wie car_feature_condition, für das Archiv. Archivierte Fahrzeuge haben
+    keine Zuordnung mehr, gesucht wird im Ausstattungstext.
+    """
+    codes, keys = _split_terms(values)
+    if not codes and not keys:
+        return None
+    found = db.session.execute(
+        select(_features.c.id, _features.c.key, _features.c.name)
+        .where(or_(_features.c.id.in_(codes), _features.c.key.in_(keys)))
+    ).all()
+    names = {row.name for row in found}
+    # Unbekannte Merkmale: bei 'all' kein Treffer statt ungefiltert
+    missing = set(codes) - {row.id for row in found} or set(keys) - {row.key for row in found}
+    if not names or (match != 'any' and missing):
+        return CarArchive.id.is_(None)
+    terms = [CarArchive.features.contains(name, autoescape=True) for name in sorted(names)]
+    return or_(*terms) if match == 'any' else and_(*terms)
+
+
+def intake_feature_condition(values, match='all'):
+    """Wie car_feature_condition, für Aufnahmeblätter (alle Kategorien)."""
+    return _feature_condition(VehicleIntake.id, _intake_features, 'intake_id', values, match)
+
+
+def get_feature_catalogue(category=None, with_counts=False):
+    """Katalog (optional je Kategorie), auf Wunsch mit der Anzahl Fahrzeuge/Aufnahmeblätter je Merkmal."""
+    query = db.session.query(Feature)
+    if category:
+        query = query.filter(Feature.category == category)
+    features = query.order_by(Feature.category, Feature.id).all()
+    result = [feature.to_dict() for feature in features]
+
+    if with_counts:
+        counts = {}
+        for table in (_car_features, _intake_features):
+            rows = db.session.execute(
+                select(table.c.feature_id, func.count()).group_by(table.c.feature_id)
+            )
+            for feature_id, count in rows:
+                counts[feature_id] = counts.get(feature_id, 0) + count
+        for item in result:
+            item['count'] = counts.get(item['id'], 0)
+    return result
+
+
+# ============== Registrierung ==============
+
+@click.command('rebuild-features')
+@with_appcontext
+def rebuild_features_command():
+    """Baut die Ausstattungs-Zuordnungen aus Fahrzeugen und Aufnahmeblättern neu auf."""
+    with db.engine.begin() as conn:
+        cars, intakes = rebuild_feature_index(conn)
+    click.echo(f'Ausstattung neu indiziert: {cars} Fahrzeuge, {intakes} Aufnahmeblätter')
+
+
+def init_app(app):
+    """Registriert das Session-Event und `flask rebuild-features`."""
+    event.listen(db.session, 'after_flush', _index_flushed)
+    app.cli.add_command(rebuild_features_command)
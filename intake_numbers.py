@@ -0,0 +1,161 @@
+# intake_numbers.py
+"""
+Vergabe der internen Nummern für Aufnahmeblätter ("2026-042").
+
+Bisher wurde beim Klick auf "Nummer generieren" die Anzahl der
+Aufnahmeblätter des Jahres gezählt (`COUNT(*) ... LIKE '2026-%'`) und um
+eins erhöht - mit wachsender Tabelle immer langsamer, und zwei
+gleichzeitig geöffnete Formulare bekamen dieselbe Nummer.
+
+Stattdessen führt `intake_number_counters` je Jahr die zuletzt vergebene
+laufende Nummer. Eine Reservierung erhöht den Zähler in einem einzigen
+Statement (UPSERT ... RETURNING) und merkt sich die Nummer in
+`intake_number_reservations`. Wird das Formular verworfen, gibt der
+Browser die Nummer frei; freigegebene und seit RESERVATION_TTL nicht
+gespeicherte Nummern werden bei der nächsten Reservierung zuerst
+wiederverwendet. Beim Speichern eines Aufnahmeblatts (Session-Event)
+wird die Reservierung entfernt und der Zähler bei manuell eingegebenen,
+höheren Nummern nachgezogen.
+
+Die Zähler werden per Migration aus den vorhandenen Nummern befüllt.
+"""
+import re
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, select, insert, update, delete, exists, func, inspect, or_, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, VehicleIntake, IntakeNumberCounter, IntakeNumberReservation
+
+# Danach gilt eine nicht gespeicherte Reservierung als verworfen
+RESERVATION_TTL = timedelta(hours=24)
+
+_NUMBER_PATTERN = re.compile(r'^(\d{4})-(\d+)$')
+
+_counters = IntakeNumberCounter.__table__
+_reservations = IntakeNumberReservation.__table__
+
+SEED_SQL = """INSERT INTO intake_number_counters (year, last_number)
+    SELECT CAST(substr(internal_number, 1, 4) AS INTEGER), max(CAST(substr(internal_number, 6) AS INTEGER))
+    FROM vehicle_intakes
+    WHERE internal_number GLOB '[0-9][0-9][0-9][0-9]-[0-9]*'
+    GROUP BY 1
+    ON CONFLICT(year) DO UPDATE SET last_number = max(last_number, excluded.last_number)"""
+
+
+def format_number(year: int, sequence: int) -> str:
+    return f'{year}-{str(sequence).zfill(3)}'
+
+
+def parse_number(number):
+    """Gibt (Jahr, laufende Nummer) zurück oder None, wenn die Nummer nicht dem Schema entspricht."""
+    match = _NUMBER_PATTERN.match((number or '').strip())
+    if not match:
+        return None
+    return int(match.group(1)), int(match.group(2))
+
+
+def _unused(number_column):
+    return ~exists().where(VehicleIntake.internal_number == number_column)
+
+
+def reserve_number(year=None) -> str:
+    """
+    Reserviert die nächste freie Nummer des Jahres in der laufenden
+    Transaktion (Commit durch den Aufrufer).
+    """
+    year = year or datetime.now().year
+    now = datetime.now()
+
+    # Zuerst eine freigegebene oder verwaiste Nummer wiederverwenden
+    reusable = (
+        select(_reservations.c.number)
+        .where(
+            _reservations.c.year == year,
+            or_(_reservations.c.released, _reservations.c.reserved_at < now - RESERVATION_TTL),
+            _unused(_reservations.c.number)
+        )
+        .order_by(_reservations.c.sequence)
+        .limit(1)
+        .scalar_subquery()
+    )
+    number = db.session.execute(
+        update(_reservations)
+        .where(_reservations.c.number == reusable)
+        .values(released=False, reserved_at=now)
+        .returning(_reservations.c.number)
+    ).scalar()
+    if number:
+        return number
+
+    # Zähler atomar erhöhen (legt die Zeile für ein neues Jahr an)
+    sequence = db.session.execute(
+        sqlite_insert(_counters)
+        .values(year=year, last_number=1)
+        .on_conflict_do_update(index_elements=['year'], set_={'last_number': _counters.c.last_number + 1})
+        .returning(_counters.c.last_number)
+    ).scalar_one()
+
+    number = format_number(year, sequence)
+    db.session.execute(insert(_reservations).values(
+        number=number, year=year, sequence=sequence, released=False, reserved_at=now
+    ))
+    return number
+
+
+def release_number(number) -> bool:
+    """Gibt eine reservierte, nicht gespeicherte Nummer zur Wiederverwendung frei."""
+    result = db.session.execute(
+        update(_reservations)
+        .where(
+            _reservations.c.number == number,
+            _reservations.c.released.is_(False),
+            _unused(_reservations.c.number)
+        )
+        .values(released=True)
+    )
+    return result.rowcount > 0
+
+
+def _confirm_numbers(conn, numbers):
+    """Gespeicherte Nummern: Reservierung entfernen, Zähler ggf. nachziehen."""
+    conn.execute(delete(_reservations).where(_reservations.c.number.in_(numbers)))
+
+    highest = {}
+    for number in numbers:
+        parsed = parse_number(number)
+        if parsed:
+            year, sequence = parsed
+            highest[year] = max(sequence, highest.get(year, 0))
+
+    for year, sequence in highest.items():
+        conn.execute(
+            sqlite_insert(_counters)
+            .values(year=year, last_number=sequence)
+            .on_conflict_do_update(
+                index_elements=['year'],
+                set_={'last_number': func.max(_counters.c.last_number, sequence)}
+            )
+        )
+
+
+def _confirm_flushed(session, flush_context):
+    numbers = set()
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, VehicleIntake) and obj.internal_number:
+            history = inspect(obj).attrs['internal_number'].history
+            if obj in session.new or history.has_changes():
+                numbers.add(obj.internal_number.strip())
+
+    if numbers:
+        _confirm_numbers(session.connection(), sorted(numbers))
+
+
+def seed_counters(conn):
+    """Befüllt die Zähler aus den vorhandenen Nummern (Migration, siehe migrations.py)."""
+    conn.execute(text(SEED_SQL))
+
+
+def init_app(app):
+    """Registriert das Session-Event für gespeicherte Nummern."""
+    event.listen(db.session, 'after_flush', _confirm_flushed)
@@ -0,0 +1,120 @@
+# intake_summary.py
+"""
+Schlanke Übersicht der Aufnahmeblätter.
+
+Die Kachelansicht (intake_list.html) zeigt nur Marke, Modell, Nummer,
+FIN, Eckdaten, Preis und Datum. `to_dict()` liest dagegen alle rund 80
+Spalten und zerlegt acht JSON-Felder pro Zeile. Mit `fields=summary`
+wählt /api/intakes nur die SUMMARY_FIELDS aus (Spaltenabfrage ohne
+ORM-Objekte, die Text-/JSON-Spalten werden gar nicht gelesen).
+
+Die Gesamtzahl für die Seitennavigation wird je Filter im Prozess
+zwischengespeichert (höchstens COUNT_CACHE_TTL Sekunden) und verworfen,
+sobald ein Aufnahmeblatt geschrieben wird. Gezählt wird nur über die ID,
+nicht über eine Unterabfrage mit allen Spalten.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event, func
+
+from models import db, VehicleIntake
+
+SUMMARY_FIELDS = [
+    'id', 'brand', 'model_variant', 'internal_number', 'vin', 'first_registration',
+    'mileage', 'power_ps', 'gross_price', 'created_at'
+]
+
+COUNT_CACHE_TTL = 60  # Sekunden - begrenzt veraltete Werte bei mehreren Prozessen
+COUNT_CACHE_SIZE = 100  # verschiedene Filter
+
+_SESSION_KEY = 'intake_counts_changed'
+
+
+def summary_items(query) -> list:
+    """Liest nur die Übersichtsspalten einer (gefilterten, sortierten) Abfrage."""
+    rows = query.with_entities(*[getattr(VehicleIntake, name) for name in SUMMARY_FIELDS]).all()
+    return [dict(zip(SUMMARY_FIELDS, row)) for row in rows]
+
+
+class IntakeCountCache:
+    """Anzahl der Aufnahmeblätter je Filter bis zur nächsten Änderung."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self._counts = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Registriert die Session-Events, die den Cache invalidieren."""
+        event.listen(db.session, 'after_flush', _collect_changes)
+        event.listen(db.session, 'do_orm_execute', _collect_bulk_changes)
+        event.listen(db.session, 'after_commit', self._after_commit)
+        event.listen(db.session, 'after_rollback', _discard_changes)
+
+    def count(self, key, query) -> int:
+        """Anzahl der Treffer von `query`; `key` beschreibt den Filter eindeutig."""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._counts.get(key)
+            if cached is not None and cached[1] > now:
+                self._counts.move_to_end(key)
+                self.hits += 1
+                return cached[0]
+            self.misses += 1
+            generation = self._generation
+
+        total = query.with_entities(func.count(VehicleIntake.id)).order_by(None).scalar()
+
+        with self._lock:
+            # Während der Abfrage geändert: Ergebnis nicht cachen
+            if generation == self._generation:
+                self._counts[key] = (total, now + COUNT_CACHE_TTL)
+                self._counts.move_to_end(key)
+                while len(self._counts) > COUNT_CACHE_SIZE:
+                    self._counts.popitem(last=False)
+        return total
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._counts.clear()
+
+    def _after_commit(self, session):
+        # Erneut invalidieren: ein paralleler Request kann zwischen Flush und
+        # Commit noch den alten Stand gezählt und gecacht haben
+        if session.info.pop(_SESSION_KEY, False):
+            self.invalidate()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'entries': len(self._counts), 'hits': self.hits, 'misses': self.misses}
+
+
+intake_counts = IntakeCountCache()
+
+
+def _collect_changes(session, flush_context):
+    """Invalidiert den Cache, sobald Aufnahmeblätter geschrieben werden."""
+    changed = any(
+        isinstance(obj, VehicleIntake)
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+    )
+    if changed:
+        session.info[_SESSION_KEY] = True
+        intake_counts.invalidate()
+
+
+def _collect_bulk_changes(orm_execute_state):
+    """Erfasst INSERT/UPDATE/DELETE-Statements auf Aufnahmeblätter (ohne Flush einzelner Objekte)."""
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        if any(mapper.class_ is VehicleIntake for mapper in orm_execute_state.all_mappers):
+            orm_execute_state.session.info[_SESSION_KEY] = True
+            intake_counts.invalidate()
+
+
+def _discard_changes(session):
+    session.info.pop(_SESSION_KEY, None)
@@ -0,0 +1,350 @@
+# migrations.py
+"""
+Versionierte Schema-Migrationen.
+
+Die Schema-Version steht in `PRAGMA user_version` der SQLite-Datenbank
+(0 = noch nicht migriert). Beim Start wird nur diese Zahl gelesen (und
+ob der Volltextindex existiert); nur wenn noch Migrationen ausstehen,
+werden sie der Reihe nach ausgeführt.
+Jede Migration läuft in einer eigenen Transaktion (BEGIN IMMEDIATE),
+die auch die neue Versionsnummer schreibt - sie wird also genau einmal
+und entweder vollständig oder gar nicht angewendet.
+
+update.sh führt die Migrationen vor dem Neustart des Dienstes aus
+(`python3 migrations.py`), alternativ `flask migrate`.
+
+Neue Migration: Funktion `_migration_xxx(conn)` schreiben und mit der
+nächsten Nummer an MIGRATIONS anhängen. Bereits ausgelieferte
+Migrationen werden nicht mehr geändert. Migration 1 legt das Schema
+der ersten Version aus fest hinterlegtem SQL an (BASE_SCHEMA); neue
+Tabellen legen spätere Migrationen aus dem jeweiligen Modell an. Weil
+solche Tabellen damit auch spätere Spalten schon enthalten können,
+fügen Migrationen Spalten nur idempotent hinzu (`_add_column`).
+
+Fehlt SQLite das FTS5-Modul, bleibt Migration 2 ohne Volltextindex
+(LIKE-Suche); der Index wird bei jedem Lauf nachgeholt, sobald FTS5
+verfügbar ist.
+"""
+import os
+import sys
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import inspect, text
+
+import car_archive
+import car_search
+import feature_index
+import intake_numbers
+from car_stats import install_stats_rollup, install_archive_rollup
+from models import (db, CarArchive, CarFeature, CarStatsDaily, Feature, IntakeFeature, IntakeNumberCounter,
+                    IntakeNumberReservation)
+
+
+# Schema der ersten Version (vor den Migrationen) - eingefroren, damit
+# Migration 1 unabhängig von späteren Änderungen an models.py bleibt
+BASE_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS cars (
+        id INTEGER NOT NULL,
+        listing_number VARCHAR NOT NULL,
+        brand VARCHAR NOT NULL,
+        model VARCHAR NOT NULL,
+        engine_capacity INTEGER NOT NULL,
+        power INTEGER NOT NULL,
+        fuel_type VARCHAR NOT NULL,
+        transmission VARCHAR NOT NULL,
+        mileage INTEGER NOT NULL,
+        first_registration VARCHAR NOT NULL,
+        features VARCHAR NOT NULL,
+        eco_badge INTEGER NOT NULL,
+        price INTEGER NOT NULL,
+        vat_deductible BOOLEAN NOT NULL,
+        seller VARCHAR DEFAULT 'Auto Berndl' NOT NULL,
+        created_at DATETIME DEFAULT (CURRENT_TIMESTAMP),
+        in_stock BOOLEAN DEFAULT '1' NOT NULL,
+        PRIMARY KEY (id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS vehicle_intakes (
+        id INTEGER NOT NULL,
+        created_at DATETIME DEFAULT (CURRENT_TIMESTAMP),
+        updated_at DATETIME,
+        brand VARCHAR(100) NOT NULL,
+        model_variant VARCHAR(200) NOT NULL,
+        first_registration VARCHAR(20),
+        vin VARCHAR(17),
+        internal_number VARCHAR(50),
+        mileage INTEGER,
+        num_owners INTEGER,
+        hu_au_until VARCHAR(20),
+        service_book VARCHAR(50),
+        accident_damage VARCHAR(100),
+        fuel_types TEXT,
+        power_ps INTEGER,
+        power_kw INTEGER,
+        engine_capacity INTEGER,
+        cylinders INTEGER,
+        tank_size FLOAT,
+        fuel_consumption FLOAT,
+        co2_emission INTEGER,
+        drive_type VARCHAR(50),
+        transmission VARCHAR(50),
+        gears INTEGER,
+        emission_class VARCHAR(50),
+        eco_badge VARCHAR(20),
+        particle_filter BOOLEAN,
+        euro_norm VARCHAR(20),
+        curb_weight INTEGER,
+        gross_weight INTEGER,
+        trailer_load_braked INTEGER,
+        trailer_load_unbraked INTEGER,
+        support_load INTEGER,
+        exterior_color VARCHAR(50),
+        color_metallic BOOLEAN,
+        color_matte BOOLEAN,
+        color_wrapped VARCHAR(100),
+        exterior_features TEXT,
+        interior_color VARCHAR(50),
+        interior_materials TEXT,
+        comfort_features TEXT,
+        infotainment_features TEXT,
+        safety_features TEXT,
+        airbags TEXT,
+        climate_type VARCHAR(50),
+        parking_features TEXT,
+        last_inspection_date VARCHAR(20),
+        last_inspection_km INTEGER,
+        oil_change_new BOOLEAN,
+        tire_tread_front FLOAT,
+        tire_tread_rear FLOAT,
+        brakes_new BOOLEAN,
+        timing_belt_new BOOLEAN,
+        replacement_engine BOOLEAN,
+        replacement_engine_km INTEGER,
+        replacement_transmission BOOLEAN,
+        replacement_transmission_km INTEGER,
+        num_keys INTEGER,
+        service_book_maintained VARCHAR(50),
+        warranty_type VARCHAR(100),
+        vat_deductible BOOLEAN,
+        net_price FLOAT,
+        gross_price FLOAT,
+        transfer_costs FLOAT,
+        optional_price FLOAT,
+        additional_notes TEXT,
+        PRIMARY KEY (id)
+    )""",
+] + [
+    f'CREATE INDEX IF NOT EXISTS ix_{table}_{name} ON {table} ({name})'
+    for table, names in (
+        ('cars', ('brand', 'created_at', 'fuel_type', 'listing_number', 'model', 'price', 'seller', 'transmission')),
+        ('vehicle_intakes', ('brand', 'created_at', 'internal_number', 'vin')),
+    )
+    for name in names
+]
+
+
+def _migration_base_schema(conn):
+    """Tabellen anlegen, Spalte cars.in_stock nachrüsten."""
+    for statement in BASE_SCHEMA:
+        conn.execute(text(statement))
+
+    columns = [col['name'] for col in inspect(conn).get_columns('cars')]
+    if 'in_stock' not in columns:
+        conn.execute(text('ALTER TABLE cars ADD COLUMN in_stock BOOLEAN DEFAULT 1 NOT NULL'))
+    else:
+        conn.execute(text('UPDATE cars SET in_stock = 1 WHERE in_stock IS NULL'))
+    # Erst nach dem Nachrüsten der Spalte (Datenbanken von vor in_stock)
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_cars_in_stock ON cars (in_stock)'))
+
+
+def _migration_search_index(conn):
+    # Ohne FTS5 bleibt die LIKE-Suche; retry_search_index holt den Index später nach
+    car_search.install_search_index(conn)
+
+
+def _migration_stats_rollup(conn):
+    db.metadata.create_all(conn, tables=[CarStatsDaily.__table__])
+    install_stats_rollup(conn)
+
+
+def _migration_feature_index(conn):
+    db.metadata.create_all(conn, tables=[Feature.__table__, CarFeature.__table__, IntakeFeature.__table__])
+    feature_index.install_feature_index(conn)
+
+
+def _migration_intake_numbers(conn):
+    db.metadata.create_all(conn, tables=[IntakeNumberCounter.__table__, IntakeNumberReservation.__table__])
+    intake_numbers.seed_counters(conn)
+
+
+def _add_column(conn, table, name, definition):
+    columns = [col['name'] for col in inspect(conn).get_columns(table)]
+    if name not in columns:
+        conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {name} {definition}'))
+
+
+def _migration_row_versions(conn):
+    """Zeilenversion und Änderungszeitpunkt für ETag/If-Match."""
+    _add_column(conn, 'cars', 'updated_at', 'DATETIME')
+    _add_column(conn, 'cars', 'version', 'INTEGER DEFAULT 1 NOT NULL')
+    _add_column(conn, 'vehicle_intakes', 'version', 'INTEGER DEFAULT 1 NOT NULL')
+
+
+def _migration_car_archive(conn):
+    """Verkaufszeitpunkt, Archivtabelle und Trigger."""
+    _add_column(conn, 'cars', 'sold_at', 'DATETIME')
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_cars_sold_at ON cars (sold_at)'))
+    db.metadata.create_all(conn, tables=[CarArchive.__table__])
+    car_archive.install_archive(conn)
+    install_archive_rollup(conn)
+
+
+def _migration_car_autoincrement(conn):
+    """
+    `cars` mit AUTOINCREMENT neu aufbauen: ohne vergibt SQLite nach dem
+    Löschen des neuesten Fahrzeugs dessen ID - und damit ggf. eine bereits
+    archivierte - erneut. Spalten, Indizes und Trigger werden übernommen.
+    """
+    columns = conn.exec_driver_sql('PRAGMA table_info(cars)').all()
+    definitions = []
+    for _, name, type_, notnull, default, pk in columns:
+        if pk:
+            definitions.append(f'{name} INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT')
+            continue
+        definition = f'{name} {type_}'
+        if default is not None:
+            definition += f' DEFAULT {default}'
+        if notnull:
+            definition += ' NOT NULL'
+        definitions.append(definition)
+    names = ', '.join(column[1] for column in columns)
+
+    # Indizes und Trigger verschwinden mit der Tabelle
+    dependents = conn.exec_driver_sql(
+        "SELECT sql FROM sqlite_master WHERE tbl_name = 'cars' AND type IN ('index', 'trigger') AND sql IS NOT NULL"
+    ).scalars().all()
+
+    conn.exec_driver_sql(f"CREATE TABLE cars_new ({', '.join(definitions)})")
+    conn.exec_driver_sql(f'INSERT INTO cars_new ({names}) SELECT {names} FROM cars')
+    conn.exec_driver_sql('DROP TABLE cars')
+    conn.exec_driver_sql('ALTER TABLE cars_new RENAME TO cars')
+    for statement in dependents:
+        conn.exec_driver_sql(statement)
+
+    # Neue IDs liegen über allen bisher vergebenen, auch den archivierten
+    conn.exec_driver_sql("DELETE FROM sqlite_sequence WHERE name = 'cars'")
+    conn.exec_driver_sql("""INSERT INTO sqlite_sequence (name, seq) SELECT 'cars', max(
+        coalesce((SELECT max(id) FROM cars), 0), coalesce((SELECT max(id) FROM cars_archive), 0))""")
+
+
+# (Version, Beschreibung, Funktion) - aufsteigend und lückenlos
+MIGRATIONS = [
+    (1, 'Basisschema und Spalte cars.in_stock', _migration_base_schema),
+    (2, 'Volltextindex für die Fahrzeugsuche', _migration_search_index),
+    (3, 'Statistik-Tabelle mit Triggern', _migration_stats_rollup),
+    (4, 'Ausstattungskatalog und Zuordnungen', _migration_feature_index),
+    (5, 'Zähler für interne Nummern der Aufnahmeblätter', _migration_intake_numbers),
+    (6, 'Zeilenversion für Fahrzeuge und Aufnahmeblätter', _migration_row_versions),
+    (7, 'Archiv für verkaufte Fahrzeuge', _migration_car_archive),
+    (8, 'Fahrzeug-IDs nicht wiederverwenden (AUTOINCREMENT)', _migration_car_autoincrement),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn) -> int:
+    return conn.exec_driver_sql('PRAGMA user_version').scalar()
+
+
+def run_migrations(engine) -> list:
+    """
+    Führt alle ausstehenden Migrationen aus. Gibt die Beschreibungen der
+    angewendeten Migrationen zurück (leer, wenn das Schema aktuell ist).
+    """
+    if engine.dialect.name != 'sqlite':
+        # Ohne user_version: nur fehlende Tabellen anlegen
+        db.metadata.create_all(engine)
+        return []
+
+    applied = []
+    with engine.connect() as conn:
+        if get_schema_version(conn) >= LATEST_VERSION:
+            retry_search_index(conn)
+            return applied
+
+        for version, description, migrate in MIGRATIONS:
+            # Schreibsperre vor dem erneuten Lesen der Version: startet ein
+            # zweiter Prozess gleichzeitig, wartet er und überspringt die Migration
+            conn.exec_driver_sql('BEGIN IMMEDIATE')
+            try:
+                if get_schema_version(conn) >= version:
+                    conn.rollback()
+                    continue
+                migrate(conn)
+                conn.exec_driver_sql(f'PRAGMA user_version = {version}')
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            print(f"Migration {version}: {description}")
+            applied.append(description)
+        retry_search_index(conn)
+    return applied
+
+
+def retry_search_index(conn) -> bool:
+    """
+    Holt den Volltextindex nach, wenn Migration 2 ohne FTS5 lief und das
+    Modul inzwischen verfügbar ist. Gibt zurück, ob er angelegt wurde.
+    """
+    if get_schema_version(conn) < 2 or car_search.has_search_index(conn):
+        return False
+    conn.exec_driver_sql('BEGIN IMMEDIATE')
+    try:
+        installed = not car_search.has_search_index(conn) and car_search.install_search_index(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    if installed:
+        print("Volltextindex für die Fahrzeugsuche nachträglich angelegt")
+    return installed
+
+
+@click.command('migrate')
+@with_appcontext
+def migrate_command():
+    """Führt ausstehende Datenbank-Migrationen aus."""
+    applied = run_migrations(db.engine)
+    click.echo(f'{len(applied)} Migration(en) ausgeführt' if applied else 'Datenbank ist aktuell')
+
+
+def init_app(app):
+    """Registriert `flask migrate`."""
+    app.cli.add_command(migrate_command)
+
+
+if __name__ == '__main__':
+    # Eigenständig aus update.sh, ohne die komplette Anwendung zu starten
+    from flask import Flask
+    from models import init_sqlite_pragmas
+
+    data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+    os.makedirs(data_dir, exist_ok=True)
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv(
+        'DATABASE_URL', f'sqlite:///{os.path.join(data_dir, "car_data.db")}'
+    )
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+
+    with app.app_context():
+        init_sqlite_pragmas(db.engine)
+        try:
+            applied = run_migrations(db.engine)
+        except Exception as e:
+            print(f"Migration-Fehler: {e}")
+            sys.exit(1)
+        version = LATEST_VERSION if db.engine.dialect.name == 'sqlite' else '-'
+        print(f"Datenbank-Migration erfolgreich abgeschlossen ({len(applied)} neu, Schema-Version {version})")
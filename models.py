@@ -1,11 +1,101 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, FetchedValue
 from sqlalchemy.sql import func
 import json
+import os
 
 db = SQLAlchemy()
 
+
+# ============== SQLite-Verbindungseinstellungen ==============
+# Werden bei jeder neuen Verbindung gesetzt. WAL erlaubt gleichzeitiges Lesen
+# während eines Schreibvorgangs, busy_timeout wartet auf Sperren statt sofort
+# "database is locked" zu melden. Jeder Wert ist per Umgebungsvariable
+# überschreibbar (z.B. SQLITE_JOURNAL_MODE=DELETE).
+
+# Pragma -> (Umgebungsvariable, Standardwert, erlaubte Werte oder int)
+SQLITE_PRAGMAS = {
+    'journal_mode': ('SQLITE_JOURNAL_MODE', 'WAL', {'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'}),
+    'busy_timeout': ('SQLITE_BUSY_TIMEOUT', '5000', int),  # Millisekunden
+    'synchronous': ('SQLITE_SYNCHRONOUS', 'NORMAL', {'OFF', 'NORMAL', 'FULL', 'EXTRA'}),
+    'mmap_size': ('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024), int),  # Bytes
+    'cache_size': ('SQLITE_CACHE_SIZE', '-65536', int),  # negativ = KiB (64 MB)
+    'temp_store': ('SQLITE_TEMP_STORE', 'MEMORY', {'DEFAULT', 'FILE', 'MEMORY'}),
+}
+
+# Von SQLite als Zahl zurückgegebene Einstellungen (für die Anzeige)
+_PRAGMA_VALUE_NAMES = {
+    'synchronous': ['OFF', 'NORMAL', 'FULL', 'EXTRA'],
+    'temp_store': ['DEFAULT', 'FILE', 'MEMORY'],
+}
+
+
+def get_sqlite_pragma_config() -> dict:
+    """Liest die gewünschten Pragma-Werte aus der Umgebung (ValueError bei ungültigen Werten)."""
+    config = {}
+    for pragma, (env_name, default, allowed) in SQLITE_PRAGMAS.items():
+        value = os.getenv(env_name, default).strip()
+        if allowed is int:
+            try:
+                value = int(value)
+            except ValueError:
+                raise ValueError(f'{env_name} muss eine Ganzzahl sein, nicht "{value}"')
+        else:
+            value = value.upper()
+            if value not in allowed:
+                raise ValueError(f'{env_name} muss einer von {", ".join(sorted(allowed))} sein, nicht "{value}"')
+        config[pragma] = value
+    return config
+
+
+def init_sqlite_pragmas(engine):
+    """Registriert das Setzen der Pragmas für jede neue Verbindung der Engine."""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    config = get_sqlite_pragma_config()
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            # busy_timeout zuerst, damit bereits das Umschalten auf WAL auf Sperren wartet
+            cursor.execute(f"PRAGMA busy_timeout = {config['busy_timeout']}")
+            for pragma, value in config.items():
+                if pragma != 'busy_timeout':
+                    cursor.execute(f'PRAGMA {pragma} = {value}')
+        finally:
+            cursor.close()
+
+
+def get_sqlite_settings() -> list:
+    """Gewünschte und tatsächlich aktive Pragma-Werte (für die Einstellungsseite)."""
+    if db.engine.dialect.name != 'sqlite':
+        return []
+
+    config = get_sqlite_pragma_config()
+    settings = []
+    with db.engine.connect() as conn:
+        for pragma, (env_name, _, _) in SQLITE_PRAGMAS.items():
+            active = conn.exec_driver_sql(f'PRAGMA {pragma}').scalar()
+            names = _PRAGMA_VALUE_NAMES.get(pragma)
+            if names and isinstance(active, int) and active < len(names):
+                active = names[active]
+            elif isinstance(active, str):
+                active = active.upper()
+            settings.append({
+                'name': pragma,
+                'env': env_name,
+                'configured': config[pragma],
+                'active': active,
+                'overridden': env_name in os.environ
+            })
+    return settings
+
 class Car(db.Model):
     __tablename__ = 'cars'
+    # IDs gelöschter Fahrzeuge nicht neu vergeben - archivierte Fahrzeuge behalten ihre ID
+    __table_args__ = {'sqlite_autoincrement': True}
 
     id = db.Column(db.Integer, primary_key=True)
     listing_number = db.Column(db.String, nullable=False, index=True)
@@ -24,11 +114,143 @@ class Car(db.Model):
     seller = db.Column(db.String, nullable=False, server_default='Auto Berndl', index=True)
     created_at = db.Column(db.DateTime(timezone=True), server_default=func.now(), index=True)
     in_stock = db.Column(db.Boolean, nullable=False, server_default='1', index=True)  # True = im Bestand, False = verkauft
+    updated_at = db.Column(db.DateTime(timezone=True), onupdate=func.now())
+    # Zeilenversion: wird bei jedem UPDATE erhöht und dabei geprüft (ETag/If-Match)
+    version = db.Column(db.Integer, nullable=False, server_default='1')
+    # Zeitpunkt des Verkaufs (in_stock -> False), per Trigger gesetzt (siehe car_archive.py)
+    sold_at = db.Column(db.DateTime(timezone=True), server_onupdate=FetchedValue(), index=True)
+    __mapper_args__ = {'version_id_col': version}
+
+    # Werden von update_car nie überschrieben
+    READONLY_FIELDS = ('id', 'created_at', 'updated_at', 'version', 'sold_at')
+
+    def to_dict(self):
+        return {c.name: getattr(self, c.name) for c in self.__table__.columns}
+
+
+class CarArchive(db.Model):
+    """
+    Archiv verkaufter Fahrzeuge: gleiche Spalten wie `cars` (gleiche ID),
+    dazu der Archivierungszeitpunkt. Wird von car_archive.py befüllt und
+    nur gelesen (Suche/Export mit `include_archive`, Auswertungen).
+    """
+    __tablename__ = 'cars_archive'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    listing_number = db.Column(db.String, nullable=False, index=True)
+    brand = db.Column(db.String, nullable=False, index=True)
+    model = db.Column(db.String, nullable=False)
+    engine_capacity = db.Column(db.Integer, nullable=False)
+    power = db.Column(db.Integer, nullable=False)
+    fuel_type = db.Column(db.String, nullable=False)
+    transmission = db.Column(db.String, nullable=False)
+    mileage = db.Column(db.Integer, nullable=False)
+    first_registration = db.Column(db.String, nullable=False)
+    features = db.Column(db.String, nullable=False)
+    eco_badge = db.Column(db.Integer, nullable=False)
+    price = db.Column(db.Integer, nullable=False)
+    vat_deductible = db.Column(db.Boolean, nullable=False)
+    seller = db.Column(db.String, nullable=False, server_default='Auto Berndl')
+    created_at = db.Column(db.DateTime(timezone=True))
+    in_stock = db.Column(db.Boolean, nullable=False, server_default='0')
+    updated_at = db.Column(db.DateTime(timezone=True))
+    version = db.Column(db.Integer, nullable=False, server_default='1')
+    sold_at = db.Column(db.DateTime(timezone=True), index=True)
+    archived_at = db.Column(db.DateTime(timezone=True), server_default=func.now(), nullable=False)
 
     def to_dict(self):
         return {c.name: getattr(self, c.name) for c in self.__table__.columns}
 
 
+class CarStatsDaily(db.Model):
+    """
+    Vorverdichtete Fahrzeugstatistik: Anzahl und Summen je Tag, Marke,
+    Kraftstoff, Verkäufer und Bestandsstatus. Wird per Trigger bei jeder
+    Änderung an `cars` fortgeschrieben (siehe car_stats.py).
+    """
+    __tablename__ = 'car_stats_daily'
+    __table_args__ = (
+        db.UniqueConstraint('day', 'brand', 'fuel_type', 'seller', 'in_stock', name='uq_car_stats_daily_group'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.String(10), nullable=False, index=True)  # YYYY-MM-DD (created_at), '' = unbekannt
+    brand = db.Column(db.String, nullable=False)
+    fuel_type = db.Column(db.String, nullable=False)
+    seller = db.Column(db.String, nullable=False)
+    in_stock = db.Column(db.Boolean, nullable=False)
+    car_count = db.Column(db.Integer, nullable=False, default=0)
+    price_sum = db.Column(db.Integer, nullable=False, default=0)
+    mileage_sum = db.Column(db.Integer, nullable=False, default=0)
+
+
+class Feature(db.Model):
+    """
+    Merkmalskatalog: jede Ausstattung bekommt einen festen Integer-Code
+    (`id`). Kategorie 'car' für die Freitext-Ausstattung der Fahrzeuge,
+    sonst der Name des JSON-Feldes im Aufnahmeblatt (siehe feature_index.py).
+    """
+    __tablename__ = 'features'
+    __table_args__ = (
+        db.UniqueConstraint('category', 'key', name='uq_features_category_key'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    category = db.Column(db.String(50), nullable=False)
+    name = db.Column(db.String(200), nullable=False)  # Anzeigename
+    key = db.Column(db.String(200), nullable=False, index=True)  # normalisiert (casefold) für die Suche
+
+    def to_dict(self):
+        return {'id': self.id, 'category': self.category, 'name': self.name}
+
+
+class CarFeature(db.Model):
+    """Zuordnung Fahrzeug <-> Merkmal (abgeleitet aus Car.features)."""
+    __tablename__ = 'car_features'
+    __table_args__ = (
+        db.Index('ix_car_features_feature_car', 'feature_id', 'car_id'),
+    )
+
+    car_id = db.Column(db.Integer, db.ForeignKey('cars.id', ondelete='CASCADE'), primary_key=True)
+    feature_id = db.Column(db.Integer, db.ForeignKey('features.id'), primary_key=True)
+
+
+class IntakeFeature(db.Model):
+    """Zuordnung Aufnahmeblatt <-> Merkmal (abgeleitet aus den JSON-Feldern)."""
+    __tablename__ = 'intake_features'
+    __table_args__ = (
+        db.Index('ix_intake_features_feature_intake', 'feature_id', 'intake_id'),
+    )
+
+    intake_id = db.Column(db.Integer, db.ForeignKey('vehicle_intakes.id', ondelete='CASCADE'), primary_key=True)
+    feature_id = db.Column(db.Integer, db.ForeignKey('features.id'), primary_key=True)
+
+
+class IntakeNumberCounter(db.Model):
+    """Zuletzt vergebene laufende Nummer je Jahr für interne Nummern (siehe intake_numbers.py)."""
+    __tablename__ = 'intake_number_counters'
+
+    year = db.Column(db.Integer, primary_key=True)
+    last_number = db.Column(db.Integer, nullable=False, default=0)
+
+
+class IntakeNumberReservation(db.Model):
+    """
+    Vergebene, aber noch nicht gespeicherte interne Nummer. Freigegebene
+    (oder lange nicht genutzte) Reservierungen werden wiederverwendet.
+    """
+    __tablename__ = 'intake_number_reservations'
+    __table_args__ = (
+        db.Index('ix_intake_number_reservations_year_sequence', 'year', 'sequence'),
+    )
+
+    number = db.Column(db.String(50), primary_key=True)
+    year = db.Column(db.Integer, nullable=False)
+    sequence = db.Column(db.Integer, nullable=False)
+    released = db.Column(db.Boolean, nullable=False, default=False)
+    reserved_at = db.Column(db.DateTime, nullable=False)
+
+
 class VehicleIntake(db.Model):
     """
     Umfassendes Fahrzeug-Aufnahmeblatt mit allen Mobile.de-Feldern
@@ -40,6 +262,9 @@ class VehicleIntake(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     created_at = db.Column(db.DateTime(timezone=True), server_default=func.now(), index=True)
     updated_at = db.Column(db.DateTime(timezone=True), onupdate=func.now())
+    # Zeilenversion: wird bei jedem UPDATE erhöht und dabei geprüft (ETag/If-Match)
+    version = db.Column(db.Integer, nullable=False, server_default='1')
+    __mapper_args__ = {'version_id_col': version}
     
     # ============== A. Basisdaten ==============
     brand = db.Column(db.String(100), nullable=False, index=True)  # Marke
@@ -143,92 +368,57 @@ class VehicleIntake(db.Model):
     # ============== M. Zusatzfelder ==============
     additional_notes = db.Column(db.Text)  # Freitext für weitere Ausstattung/Hinweise
     
+    # Feldarten für to_dict/from_dict - die Umwandlung je Spalte wird
+    # einmalig nach der Klassendefinition festgelegt (siehe unten)
+    JSON_FIELDS = ('fuel_types', 'exterior_features', 'interior_materials',
+                   'comfort_features', 'infotainment_features', 'safety_features',
+                   'airbags', 'parking_features')
+
+    # Numerische Felder (Integer)
+    INT_FIELDS = ('mileage', 'num_owners', 'power_ps', 'power_kw', 'engine_capacity',
+                  'cylinders', 'co2_emission', 'gears', 'curb_weight', 'gross_weight',
+                  'trailer_load_braked', 'trailer_load_unbraked', 'support_load',
+                  'last_inspection_km', 'replacement_engine_km', 'replacement_transmission_km',
+                  'num_keys')
+
+    # Numerische Felder (Float)
+    FLOAT_FIELDS = ('tank_size', 'fuel_consumption', 'tire_tread_front', 'tire_tread_rear',
+                    'net_price', 'gross_price', 'transfer_costs', 'optional_price')
+
+    # Boolean Felder
+    BOOL_FIELDS = ('particle_filter', 'color_metallic', 'color_matte', 'oil_change_new',
+                   'brakes_new', 'timing_belt_new', 'replacement_engine',
+                   'replacement_transmission', 'vat_deductible')
+
+    # Werden von from_dict nie überschrieben
+    READONLY_FIELDS = ('id', 'created_at', 'updated_at', 'version')
+
     def to_dict(self):
         """Konvertiert das Modell in ein Dictionary."""
-        result = {}
-        for c in self.__table__.columns:
-            value = getattr(self, c.name)
-            # JSON-Felder parsen
-            if c.name in ['fuel_types', 'exterior_features', 'interior_materials', 
-                         'comfort_features', 'infotainment_features', 'safety_features',
-                         'airbags', 'parking_features']:
-                if value:
-                    try:
-                        result[c.name] = json.loads(value)
-                    except (json.JSONDecodeError, TypeError):
-                        result[c.name] = []
-                else:
-                    result[c.name] = []
-            elif isinstance(value, bool):
-                result[c.name] = value
-            else:
-                result[c.name] = value
+        # Geladene Werte direkt aus dem Instanz-Dict, nicht geladene über das Attribut
+        loaded = self.__dict__
+        result = {name: loaded[name] if name in loaded else getattr(self, name) for name in _INTAKE_COLUMNS}
+        # JSON-Felder parsen
+        for name in VehicleIntake.JSON_FIELDS:
+            result[name] = _parse_json_list(result[name])
         return result
     
-    def from_dict(self, data):
-        """Aktualisiert das Modell aus einem Dictionary."""
-        json_fields = ['fuel_types', 'exterior_features', 'interior_materials', 
-                      'comfort_features', 'infotainment_features', 'safety_features',
-                      'airbags', 'parking_features']
-        
-        # Numerische Felder (Integer)
-        int_fields = ['mileage', 'num_owners', 'power_ps', 'power_kw', 'engine_capacity',
-                     'cylinders', 'co2_emission', 'gears', 'curb_weight', 'gross_weight',
-                     'trailer_load_braked', 'trailer_load_unbraked', 'support_load',
-                     'last_inspection_km', 'replacement_engine_km', 'replacement_transmission_km',
-                     'num_keys']
-        
-        # Numerische Felder (Float)
-        float_fields = ['tank_size', 'fuel_consumption', 'tire_tread_front', 'tire_tread_rear',
-                       'net_price', 'gross_price', 'transfer_costs', 'optional_price']
-        
-        # Boolean Felder
-        bool_fields = ['particle_filter', 'color_metallic', 'color_matte', 'oil_change_new',
-                      'brakes_new', 'timing_belt_new', 'replacement_engine', 
-                      'replacement_transmission', 'vat_deductible']
-        
+    def from_dict(self, data, validate_options=False):
+        """
+        Aktualisiert das Modell aus einem Dictionary (unbekannte Schlüssel
+        werden ignoriert). Mit validate_options=True werden die Listenfelder
+        gegen die Optionslisten geprüft (ValueError bei unbekannten Werten).
+        """
+        if validate_options:
+            _validate_intake_options(data)
+
         for key, value in data.items():
-            if hasattr(self, key) and key not in ['id', 'created_at']:
-                if key in json_fields:
-                    # JSON-Felder
-                    if isinstance(value, list):
-                        setattr(self, key, json.dumps(value))
-                    elif isinstance(value, str):
-                        setattr(self, key, value)
-                elif key in int_fields:
-                    # Integer-Felder: leere Strings zu None
-                    if value == '' or value is None:
-                        setattr(self, key, None)
-                    else:
-                        try:
-                            setattr(self, key, int(value))
-                        except (ValueError, TypeError):
-                            setattr(self, key, None)
-                elif key in float_fields:
-                    # Float-Felder: leere Strings zu None
-                    if value == '' or value is None:
-                        setattr(self, key, None)
-                    else:
-                        try:
-                            setattr(self, key, float(value))
-                        except (ValueError, TypeError):
-                            setattr(self, key, None)
-                elif key in bool_fields:
-                    # Boolean-Felder
-                    if isinstance(value, bool):
-                        setattr(self, key, value)
-                    elif value in ['true', 'True', '1', 1]:
-                        setattr(self, key, True)
-                    elif value in ['false', 'False', '0', 0, '', None]:
-                        setattr(self, key, False)
-                    else:
-                        setattr(self, key, bool(value))
-                else:
-                    # String-Felder: leere Strings bleiben leer oder werden zu None
-                    if value == '':
-                        setattr(self, key, None)
-                    else:
-                        setattr(self, key, value)
+            coerce = _INTAKE_SETTERS.get(key)
+            if coerce is None:
+                continue
+            value = coerce(value)
+            if value is not _UNCHANGED:
+                setattr(self, key, value)
     
     @staticmethod
     def get_fuel_type_options():
@@ -369,3 +559,99 @@ class VehicleIntake(db.Model):
     def get_warranty_options():
         """Gibt alle verfügbaren Garantie-Optionen zurück."""
         return ['Keine', 'Herstellergarantie', 'Gebrauchtwagengarantie', 'Verlängerte Garantie']
+
+
+# ============== Serialisierung VehicleIntake ==============
+# Einmalig aufgebaut: Spaltenliste, Umwandlung je Feld und Optionsmengen,
+# damit to_dict/from_dict pro Zeile nur noch nachschlagen statt Listen zu durchsuchen.
+
+_UNCHANGED = object()  # from_dict: Feld nicht setzen
+
+_TRUE_VALUES = frozenset(['true', 'True', '1', 1])
+_FALSE_VALUES = frozenset(['false', 'False', '0', 0, '', None])
+
+
+def _parse_json_list(value):
+    if not value:
+        return []
+    try:
+        return json.loads(value)
+    except (json.JSONDecodeError, TypeError):
+        return []
+
+
+def _coerce_json(value):
+    if isinstance(value, list):
+        return json.dumps(value)
+    if isinstance(value, str):
+        return value
+    return _UNCHANGED
+
+
+def _number_coercer(number_type):
+    def coerce(value):
+        # Leere Strings zu None
+        if value == '' or value is None:
+            return None
+        try:
+            return number_type(value)
+        except (ValueError, TypeError):
+            return None
+    return coerce
+
+
+def _coerce_bool(value):
+    if isinstance(value, bool):
+        return value
+    try:
+        if value in _TRUE_VALUES:
+            return True
+        if value in _FALSE_VALUES:
+            return False
+    except TypeError:
+        # nicht hashbar (z.B. Liste)
+        pass
+    return bool(value)
+
+
+def _coerce_string(value):
+    return None if value == '' else value
+
+
+def _build_intake_setters():
+    coercers = {name: _coerce_json for name in VehicleIntake.JSON_FIELDS}
+    coercers.update({name: _number_coercer(int) for name in VehicleIntake.INT_FIELDS})
+    coercers.update({name: _number_coercer(float) for name in VehicleIntake.FLOAT_FIELDS})
+    coercers.update({name: _coerce_bool for name in VehicleIntake.BOOL_FIELDS})
+    return {
+        name: coercers.get(name, _coerce_string)
+        for name in _INTAKE_COLUMNS
+        if name not in VehicleIntake.READONLY_FIELDS
+    }
+
+
+_INTAKE_COLUMNS = tuple(column.name for column in VehicleIntake.__table__.columns)
+_INTAKE_SETTERS = _build_intake_setters()
+
+_INTAKE_OPTIONS = {
+    'fuel_types': frozenset(VehicleIntake.get_fuel_type_options()),
+    'exterior_features': frozenset(VehicleIntake.get_exterior_feature_options()),
+    'interior_materials': frozenset(VehicleIntake.get_interior_material_options()),
+    'comfort_features': frozenset(VehicleIntake.get_comfort_feature_options()),
+    'infotainment_features': frozenset(VehicleIntake.get_infotainment_feature_options()),
+    'safety_features': frozenset(VehicleIntake.get_safety_feature_options()),
+    'airbags': frozenset(VehicleIntake.get_airbag_options()),
+    'parking_features': frozenset(VehicleIntake.get_parking_feature_options()),
+}
+
+
+def _validate_intake_options(data):
+    errors = []
+    for name, options in _INTAKE_OPTIONS.items():
+        values = data.get(name)
+        if isinstance(values, list):
+            unknown = [str(value) for value in values if value not in options]
+            if unknown:
+                errors.append(f"{name}: {', '.join(unknown)}")
+    if errors:
+        raise ValueError(f"Unbekannte Optionen - {'; '.join(errors)}")
@@ -0,0 +1,119 @@
+# pdf_assets.py
+"""
+Druckoptimierte Bildvarianten für die PDF-Generierung.
+
+Die Logos liegen in voller Auflösung in static/images, werden im PDF aber
+nur wenige Zentimeter breit gedruckt. Ohne Vorverarbeitung dekodiert
+WeasyPrint bei jedem Rendering das komplette Bild und bettet es in voller
+Größe ein. Hier werden einmalig verkleinerte Varianten in Druckauflösung
+erzeugt (Dateiname enthält den Hash der Quelle) und von den PDF-Templates
+über `pdf_image()` eingebunden.
+"""
+import glob
+import hashlib
+import os
+import threading
+
+from flask import url_for
+from PIL import Image
+
+from pdf_cache import file_digest
+
+PDF_ASSET_DPI = int(os.getenv('PDF_ASSET_DPI', 300))
+
+# Unterordner von static/ - der URL-Fetcher liefert nur Dateien aus static/ aus
+PDF_ASSET_SUBDIR = 'pdf_assets'
+
+# Erhöhen, wenn sich die Vorverarbeitung ändert (erzeugt neue Dateinamen)
+PDF_ASSET_VERSION = 1
+
+# Maximale Druckbreite der Bilder in CSS-Pixeln (96px = 1 Zoll), siehe car_template.css
+PDF_IMAGE_WIDTHS = {
+    'images/logo.png': 240,
+    'images/santander.png': 240,
+}
+
+_build_lock = threading.Lock()
+
+
+def get_pdf_image(static_folder: str, name: str) -> str:
+    """
+    Gibt den Pfad (relativ zu static/) der Druckvariante eines Bildes zurück.
+    Die Variante wird beim ersten Aufruf erzeugt. Für unbekannte Bilder oder
+    wenn die Vorverarbeitung fehlschlägt, wird das Original verwendet.
+    """
+    css_width = PDF_IMAGE_WIDTHS.get(name)
+    source = os.path.join(static_folder, name)
+    digest = file_digest(source)
+    if css_width is None or digest == 'missing':
+        return name
+
+    variant_id = hashlib.sha256(
+        f'{digest}:{css_width}:{PDF_ASSET_DPI}:{PDF_ASSET_VERSION}'.encode('utf-8')
+    ).hexdigest()[:16]
+    stem = os.path.splitext(os.path.basename(name))[0]
+    relative = f'{PDF_ASSET_SUBDIR}/{stem}.{variant_id}.png'
+    path = os.path.join(static_folder, relative)
+
+    if not os.path.exists(path):
+        with _build_lock:
+            if not os.path.exists(path):
+                try:
+                    _build_variant(source, path, css_width)
+                except (OSError, ValueError):
+                    return name
+                _remove_stale_variants(path, stem)
+    return relative
+
+
+def _build_variant(source: str, path: str, css_width: int):
+    """Verkleinert ein Bild auf die Druckbreite und speichert es optimiert als PNG."""
+    target_width = round(css_width / 96 * PDF_ASSET_DPI)
+
+    with Image.open(source) as image:
+        image.load()
+        if image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+            image = image.convert('RGBA')
+
+        # Vollständig deckender Alphakanal: ohne Alpha speichern, spart im
+        # PDF die zusätzliche Transparenzmaske
+        if image.mode in ('RGBA', 'LA') and image.getchannel('A').getextrema() == (255, 255):
+            image = image.convert(image.mode[:-1])
+
+        if image.width > target_width:
+            target_height = max(1, round(image.height * target_width / image.width))
+            image = image.resize((target_width, target_height), Image.LANCZOS)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        try:
+            image.save(tmp_path, format='PNG', optimize=True, dpi=(PDF_ASSET_DPI, PDF_ASSET_DPI))
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def _remove_stale_variants(current_path: str, stem: str):
+    """Entfernt ältere Varianten desselben Bildes."""
+    pattern = os.path.join(os.path.dirname(current_path), f'{glob.escape(stem)}.*.png')
+    for path in glob.glob(pattern):
+        if path != current_path:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def init_app(app):
+    """Stellt `pdf_image()` in den Templates bereit und erzeugt die Varianten vorab."""
+    static_folder = app.static_folder
+
+    def pdf_image(name):
+        return url_for('static', filename=get_pdf_image(static_folder, name))
+
+    app.jinja_env.globals['pdf_image'] = pdf_image
+
+    for name in PDF_IMAGE_WIDTHS:
+        if get_pdf_image(static_folder, name) == name:
+            app.logger.warning(f"Druckvariante für {name} konnte nicht erzeugt werden - Original wird verwendet")
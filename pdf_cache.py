@@ -0,0 +1,191 @@
+# pdf_cache.py
+"""
+Inhaltsadressierter Datei-Cache für generierte PDFs.
+
+Der Schlüssel ist ein SHA-256-Hash über alle Eingaben eines Renderings
+(Datensatz, Template-Quelltext, eingebundene Bilder). Ändert sich eine
+der Eingaben, ändert sich der Schlüssel - eine explizite Invalidierung
+ist daher in der Regel nicht nötig. Alte Einträge werden per LRU
+(Datei-mtime) und Größenlimit entfernt.
+"""
+import hashlib
+import json
+import os
+import threading
+
+# Cache-Verzeichnis und Limits (über Umgebungsvariablen überschreibbar)
+PDF_CACHE_DIR = os.getenv(
+    'PDF_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'pdf_cache')
+)
+PDF_CACHE_MAX_BYTES = int(os.getenv('PDF_CACHE_MAX_BYTES', 200 * 1024 * 1024))  # 200MB
+PDF_CACHE_MAX_ENTRIES = int(os.getenv('PDF_CACHE_MAX_ENTRIES', 2000))
+
+# Wird in jeden Schlüssel eingerechnet - erhöhen, wenn sich der
+# Render-Code (nicht das Template) so ändert, dass alte PDFs ungültig sind
+CACHE_FORMAT_VERSION = 1
+
+# Digest-Cache für Dateien: path -> (mtime, size, digest)
+_file_digests = {}
+_file_digests_lock = threading.Lock()
+
+
+def file_digest(path: str) -> str:
+    """Gibt den SHA-256-Hash einer Datei zurück (gecacht bis mtime/Größe sich ändern)."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return 'missing'
+
+    with _file_digests_lock:
+        cached = _file_digests.get(path)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2]
+
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            hasher.update(chunk)
+    digest = hasher.hexdigest()
+
+    with _file_digests_lock:
+        _file_digests[path] = (stat.st_mtime_ns, stat.st_size, digest)
+    return digest
+
+
+def template_digest(jinja_env, template_name: str) -> str:
+    """Gibt den Hash des Template-Quelltexts zurück."""
+    source, _, _ = jinja_env.loader.get_source(jinja_env, template_name)
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+
+def make_key(*parts) -> str:
+    """Erzeugt einen Cache-Schlüssel aus beliebigen JSON-serialisierbaren Teilen."""
+    payload = json.dumps([CACHE_FORMAT_VERSION, *parts], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class PdfCache:
+    """Datei-basierter PDF-Cache mit LRU-Verdrängung und Trefferzählern."""
+
+    def __init__(self, cache_dir: str, max_bytes: int, max_entries: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f'{key}.pdf')
+
+    def get(self, key: str):
+        """Gibt die gecachten PDF-Bytes zurück oder None."""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            # mtime aktualisieren = "zuletzt benutzt" für die LRU-Verdrängung
+            os.utime(path, None)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, key: str, data: bytes):
+        """Legt ein PDF im Cache ab und verdrängt bei Bedarf alte Einträge."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            # Atomar ersetzen, damit parallele Leser nie halbe Dateien sehen
+            os.replace(tmp_path, path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+        self._evict()
+
+    def discard(self, key: str):
+        """Entfernt einen einzelnen Eintrag (z.B. nach Änderung des Datensatzes)."""
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _entries(self) -> list:
+        """Listet alle Einträge als (mtime, size, path) auf."""
+        entries = []
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return entries
+        for name in names:
+            if not name.endswith('.pdf'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _evict(self):
+        """Entfernt die am längsten nicht benutzten Einträge bis die Limits passen."""
+        with self._lock:
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            if total <= self.max_bytes and len(entries) <= self.max_entries:
+                return
+
+            entries.sort()  # Älteste mtime zuerst
+            count = len(entries)
+            for _, size, path in entries:
+                if total <= self.max_bytes and count <= self.max_entries:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                count -= 1
+                self.evictions += 1
+
+    def clear(self):
+        """Leert den Cache vollständig."""
+        with self._lock:
+            for _, _, path in self._entries():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def stats(self) -> dict:
+        """Gibt Trefferzähler und Belegung des Caches zurück."""
+        entries = self._entries()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0,
+                'evictions': self.evictions,
+                'entries': len(entries),
+                'size_bytes': sum(size for _, size, _ in entries),
+                'max_bytes': self.max_bytes,
+                'max_entries': self.max_entries
+            }
+
+
+# Globale Cache-Instanz
+pdf_cache = PdfCache(PDF_CACHE_DIR, PDF_CACHE_MAX_BYTES, PDF_CACHE_MAX_ENTRIES)
@@ -0,0 +1,89 @@
+# pdf_fetcher.py
+"""
+URL-Fetcher für WeasyPrint, der statische Dateien direkt aus dem
+Dateisystem liest statt per HTTP über den eigenen Flask-Prozess.
+
+Alle anderen URLs werden abgelehnt - ein PDF-Rendering greift dadurch
+nie auf das Netzwerk zu.
+"""
+import mimetypes
+import os
+import threading
+from urllib.parse import urlsplit, unquote
+
+from weasyprint import default_url_fetcher
+
+# Basis-URL für relative Pfade im HTML. Dient nur der URL-Auflösung,
+# es wird nie ein HTTP-Request an diese Adresse abgesetzt.
+PDF_BASE_URL = 'http://localhost/'
+
+# WeasyPrint-Bildcache (URL -> dekodiertes Bild), wird über alle
+# Renderings hinweg wiederverwendet (write_pdf(..., cache=...))
+image_cache = {}
+
+
+class StaticUrlFetcher:
+    """Löst /static/...-URLs aus dem static-Ordner der App auf."""
+
+    def __init__(self, static_folder: str, url_prefix: str = '/static/'):
+        self.static_folder = os.path.realpath(static_folder)
+        self.url_prefix = url_prefix
+        # Rohdaten-Cache: Pfad -> (mtime_ns, bytes)
+        self._files = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, url: str):
+        """Gibt den lokalen Dateipfad zu einer URL zurück oder None."""
+        path = unquote(urlsplit(url).path)
+        if not path.startswith(self.url_prefix):
+            return None
+
+        relative = path[len(self.url_prefix):]
+        full_path = os.path.realpath(os.path.join(self.static_folder, relative))
+        # Path-Traversal verhindern (z.B. /static/../app.py)
+        if not full_path.startswith(self.static_folder + os.sep):
+            return None
+        return full_path
+
+    def _read(self, path: str) -> bytes:
+        mtime = os.stat(path).st_mtime_ns
+        with self._lock:
+            cached = self._files.get(path)
+            if cached and cached[0] == mtime:
+                return cached[1]
+
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        with self._lock:
+            self._files[path] = (mtime, data)
+        return data
+
+    def __call__(self, url, timeout=10, ssl_context=None):
+        # data:-URLs enthalten ihren Inhalt selbst - kein Netzwerkzugriff
+        if url.startswith('data:'):
+            return default_url_fetcher(url, timeout=timeout, ssl_context=ssl_context)
+
+        path = self.resolve(url)
+        if path is None or not os.path.isfile(path):
+            raise ValueError(f'URL für PDF-Generierung nicht erlaubt: {url}')
+
+        mime_type, _ = mimetypes.guess_type(path)
+        return {
+            'string': self._read(path),
+            'mime_type': mime_type,
+            'redirected_url': url,
+            'filename': os.path.basename(path)
+        }
+
+
+# Fetcher-Instanzen pro static-Ordner (hält den Rohdaten-Cache am Leben)
+_fetchers = {}
+
+
+def get_url_fetcher(static_folder: str) -> StaticUrlFetcher:
+    """Gibt den (gecachten) Fetcher für einen static-Ordner zurück."""
+    fetcher = _fetchers.get(static_folder)
+    if fetcher is None:
+        fetcher = _fetchers.setdefault(static_folder, StaticUrlFetcher(static_folder))
+    return fetcher
@@ -0,0 +1,142 @@
+# pdf_prerender.py
+"""
+Vorab-Rendering von PDFs nach dem Speichern.
+
+Nach jedem Commit, der ein Fahrzeug oder Aufnahmeblatt anlegt oder
+ändert, wird das zugehörige PDF im Hintergrund in den PDF-Cache
+gerendert. Der erste Download nach dem Speichern kommt dann direkt aus
+dem Cache. Schnell aufeinanderfolgende Änderungen desselben Datensatzes
+werden zusammengefasst (Debounce).
+
+Registriert wird das Vorab-Rendering nur im ausliefernden Prozess
+(`python app.py`); Änderungen aus `flask ...`-Befehlen wie dem
+Sammelimport starten keine Render-Timer.
+"""
+import os
+import threading
+import time
+
+from sqlalchemy import event
+
+from models import db, Car, VehicleIntake
+from pdf_service import PdfQueueFullError
+from routes.view_routes import render_car_pdf
+from routes.intake_routes import render_intake_pdf
+
+PDF_PRERENDER_ENABLED = os.getenv('PDF_PRERENDER', '1') == '1'
+PDF_PRERENDER_DELAY = float(os.getenv('PDF_PRERENDER_DELAY', 2))  # Sekunden
+
+_SESSION_KEY = 'pdf_prerender'
+
+
+class PdfPrerenderer:
+    """Plant Hintergrund-Renderings mit Debounce pro Datensatz."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.app = None
+        self._timers = {}  # (kind, id) -> Timer
+        self._last_run = {}  # (kind, id) -> monotonic timestamp
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Registriert die Session-Events für Fahrzeuge und Aufnahmeblätter."""
+        self.app = app
+        event.listen(db.session, 'after_flush', _collect_changes)
+        event.listen(db.session, 'after_commit', self._after_commit)
+        event.listen(db.session, 'after_rollback', _discard_changes)
+
+    def _after_commit(self, session):
+        for kind, object_id in session.info.pop(_SESSION_KEY, ()):
+            self.schedule(kind, object_id)
+
+    def schedule(self, kind: str, object_id: int):
+        """
+        Plant ein Rendering. Die erste Änderung wird sofort gerendert,
+        weitere Änderungen innerhalb von `delay` Sekunden setzen den Timer
+        zurück, sodass nur der letzte Stand gerendert wird.
+        """
+        key = (kind, object_id)
+        now = time.monotonic()
+        with self._lock:
+            pending = self._timers.pop(key, None)
+            if pending is not None:
+                pending.cancel()
+
+            last_run = self._last_run.get(key)
+            recently_run = last_run is not None and now - last_run < self.delay
+            delay = self.delay if pending is not None or recently_run else 0
+
+            timer = threading.Timer(delay, self._run, args=(key, ))
+            timer.daemon = True
+            self._timers[key] = timer
+
+            # Alte Zeitstempel aufräumen
+            for stale in [k for k, t in self._last_run.items() if now - t >= self.delay]:
+                del self._last_run[stale]
+        timer.start()
+
+    def _run(self, key):
+        with self._lock:
+            if self._timers.get(key) is threading.current_thread():
+                del self._timers[key]
+            self._last_run[key] = time.monotonic()
+
+        kind, object_id = key
+        # Request-Kontext wird für url_for() in den Templates benötigt
+        with self.app.test_request_context('/'):
+            try:
+                if kind == 'car':
+                    _prerender_car(object_id)
+                else:
+                    _prerender_intake(object_id)
+            except PdfQueueFullError:
+                # Pool ausgelastet - das PDF wird beim ersten Download gerendert
+                self.app.logger.info(f"PDF-Pre-Rendering übersprungen ({kind} {object_id}): Warteschlange voll")
+            except Exception as e:
+                self.app.logger.error(f"PDF-Pre-Rendering fehlgeschlagen ({kind} {object_id}): {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'enabled': PDF_PRERENDER_ENABLED,
+                'delay': self.delay,
+                'scheduled': len(self._timers)
+            }
+
+
+def _collect_changes(session, flush_context):
+    """Merkt sich geänderte Fahrzeuge/Aufnahmeblätter bis zum Commit."""
+    changes = session.info.setdefault(_SESSION_KEY, set())
+    for obj in list(session.new) + list(session.dirty):
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        if isinstance(obj, Car):
+            changes.add(('car', obj.id))
+        elif isinstance(obj, VehicleIntake):
+            changes.add(('intake', obj.id))
+    for obj in session.deleted:
+        if isinstance(obj, Car):
+            changes.discard(('car', obj.id))
+        elif isinstance(obj, VehicleIntake):
+            changes.discard(('intake', obj.id))
+
+
+def _discard_changes(session):
+    session.info.pop(_SESSION_KEY, None)
+
+
+def _prerender_car(car_id):
+    car = Car.query.get(car_id)
+    if car:
+        render_car_pdf(car.to_dict())
+
+
+def _prerender_intake(intake_id):
+    intake = VehicleIntake.query.get(intake_id)
+    if intake:
+        render_intake_pdf(intake)
+
+
+# Globale Instanz
+pdf_prerenderer = PdfPrerenderer(PDF_PRERENDER_DELAY)
@@ -0,0 +1,305 @@
+# pdf_service.py
+"""
+PDF-Rendering in einem Pool aus Worker-Prozessen.
+
+WeasyPrint ist CPU-gebunden und hält den GIL - ein Rendering im
+Request-Thread blockiert alle anderen Requests des Prozesses. Der
+Service verteilt Renderings auf Worker-Prozesse, begrenzt die Anzahl
+wartender Aufträge und legt Ergebnisse im PDF-Cache ab.
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
+from datetime import datetime
+
+from weasyprint import CSS, HTML
+from weasyprint.text.fonts import FontConfiguration
+
+from pdf_cache import pdf_cache
+from pdf_fetcher import PDF_BASE_URL, get_url_fetcher, image_cache
+
+PDF_WORKERS = int(os.getenv('PDF_WORKERS', os.cpu_count() or 2))
+PDF_QUEUE_SIZE = int(os.getenv('PDF_QUEUE_SIZE', 32))  # Wartende Aufträge zusätzlich zu laufenden
+PDF_RENDER_TIMEOUT = int(os.getenv('PDF_RENDER_TIMEOUT', 60))  # Sekunden
+PDF_JOB_TTL = int(os.getenv('PDF_JOB_TTL', 600))  # Abgeschlossene Jobs werden nach 10 Minuten verworfen
+
+
+class PdfQueueFullError(Exception):
+    """Die Warteschlange des Render-Pools ist voll."""
+
+
+class PdfRenderError(Exception):
+    """Das Rendering im Worker ist fehlgeschlagen."""
+
+
+class PdfRenderTimeoutError(PdfRenderError):
+    """Das Rendering wurde nicht innerhalb von PDF_RENDER_TIMEOUT fertig."""
+
+
+def _wait(future) -> bytes:
+    """Wartet auf ein Rendering und übersetzt Timeout und Worker-Fehler."""
+    try:
+        return future.result(timeout=PDF_RENDER_TIMEOUT)
+    except PdfQueueFullError:
+        raise
+    except FuturesTimeoutError:
+        raise PdfRenderTimeoutError(
+            f'PDF-Erstellung dauert zu lange (über {PDF_RENDER_TIMEOUT} s), bitte später erneut versuchen'
+        )
+    except Exception as e:
+        raise PdfRenderError(f'PDF konnte nicht erstellt werden: {e}') from e
+
+
+# Pro Worker-Prozess: eine Font-Konfiguration und die vorab geparsten
+# Stylesheets (Pfad -> (mtime_ns, CSS)). Die CSS-Objekte sind an die
+# Font-Konfiguration gebunden und werden nur neu geparst, wenn sich die
+# Datei ändert.
+_font_config = None
+_stylesheets = {}
+
+
+def _get_font_config() -> FontConfiguration:
+    global _font_config
+    if _font_config is None:
+        _font_config = FontConfiguration()
+    return _font_config
+
+
+def _get_stylesheets(static_folder: str, names) -> list:
+    """Gibt die geparsten Stylesheets (relativ zu static/) zurück."""
+    stylesheets = []
+    for name in names:
+        path = os.path.join(static_folder, name)
+        mtime = os.stat(path).st_mtime_ns
+        cached = _stylesheets.get(path)
+        if cached is None or cached[0] != mtime:
+            with open(path, encoding='utf-8') as f:
+                css = CSS(string=f.read(),
+                          base_url=PDF_BASE_URL,
+                          url_fetcher=get_url_fetcher(static_folder),
+                          font_config=_get_font_config())
+            cached = (mtime, css)
+            _stylesheets[path] = cached
+        stylesheets.append(cached[1])
+    return stylesheets
+
+
+def render_html_to_pdf(html_content: str, static_folder: str, stylesheets=()) -> bytes:
+    """Rendert HTML zu PDF-Bytes (läuft im Worker-Prozess)."""
+    # Bilder werden direkt aus static/ gelesen statt per HTTP-Loopback
+    html = HTML(string=html_content,
+                base_url=PDF_BASE_URL,
+                url_fetcher=get_url_fetcher(static_folder))
+    return html.write_pdf(stylesheets=_get_stylesheets(static_folder, stylesheets),
+                          font_config=_get_font_config(),
+                          presentational_hints=True,
+                          cache=image_cache)
+
+
+class PdfJob:
+    """Asynchroner Render-Auftrag."""
+
+    def __init__(self, cache_key: str, filename: str):
+        self.id = uuid.uuid4().hex
+        self.cache_key = cache_key
+        self.filename = filename
+        self.status = 'queued'  # queued, running, done, error
+        self.error = None
+        self.created_at = datetime.now()
+        self.finished_at = None
+        self.future = None
+
+    def to_dict(self) -> dict:
+        status = self.status
+        if status == 'queued' and self.future is not None and self.future.running():
+            status = 'running'
+        return {
+            'id': self.id,
+            'status': status,
+            'filename': self.filename,
+            'error': self.error,
+            'created_at': self.created_at.isoformat(timespec='seconds')
+        }
+
+
+class PdfRenderService:
+    """Begrenzter Prozess-Pool mit Job-Verwaltung."""
+
+    def __init__(self, max_workers: int, queue_size: int, job_ttl: int):
+        self.max_workers = max_workers
+        self.queue_size = queue_size
+        self.job_ttl = job_ttl
+        self.static_folder = None
+        self._executor = None
+        self._pending = 0
+        self._jobs = {}
+        self._inflight = {}  # cache_key -> Future
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Übernimmt den static-Ordner der App für den URL-Fetcher der Worker."""
+        self.static_folder = app.static_folder
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # Worker werden erst beim ersten Rendering gestartet
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def run(self, fn, *args):
+        """Führt eine Funktion im Pool aus (begrenzte Warteschlange) und gibt das Future zurück."""
+        with self._lock:
+            if self._pending >= self.max_workers + self.queue_size:
+                raise PdfQueueFullError('PDF-Warteschlange ist voll, bitte später erneut versuchen')
+            self._pending += 1
+            executor = self._get_executor()
+
+        try:
+            future = executor.submit(fn, *args)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        future.add_done_callback(self._release_slot)
+        return future
+
+    def _submit_render(self, html_content: str, stylesheets=()):
+        """Reicht ein Rendering an den Pool weiter."""
+        return self.run(render_html_to_pdf, html_content, self.static_folder, tuple(stylesheets))
+
+    def _release_slot(self, future):
+        with self._lock:
+            self._pending -= 1
+
+    def render_html(self, html_content: str, stylesheets=()) -> bytes:
+        """
+        Rendert HTML im Pool und wartet auf das Ergebnis.
+
+        `stylesheets` sind Pfade relativ zu static/, die im Worker einmal
+        geparst und wiederverwendet werden.
+        """
+        future = self._submit_render(html_content, stylesheets)
+        return _wait(future)
+
+    def _render_async(self, cache_key: str, build_html, stylesheets=()):
+        """
+        Startet ein Rendering für einen Cache-Schlüssel und legt das Ergebnis
+        im Cache ab. Läuft für denselben Schlüssel bereits ein Rendering
+        (z.B. ein Pre-Rendering nach dem Speichern), wird dieses wiederverwendet.
+        """
+        with self._lock:
+            future = self._inflight.get(cache_key)
+            if future is not None:
+                return future
+            # Platzhalter noch unter der Sperre eintragen: ein gleichzeitiger
+            # Fehlzugriff wartet darauf, statt ein zweites Rendering einzureichen
+            future = Future()
+            self._inflight[cache_key] = future
+
+        try:
+            render_future = self._submit_render(build_html(), stylesheets)
+        except Exception as e:
+            with self._lock:
+                self._inflight.pop(cache_key, None)
+            future.set_exception(e)
+            raise
+
+        def store(done_future):
+            error = done_future.exception()
+            if error is None:
+                # Erst cachen, dann austragen - dazwischen gibt es keinen Fehlzugriff
+                pdf_cache.put(cache_key, done_future.result())
+            with self._lock:
+                self._inflight.pop(cache_key, None)
+            if error is None:
+                future.set_result(done_future.result())
+            else:
+                future.set_exception(error)
+
+        render_future.add_done_callback(store)
+        return future
+
+    def _render_fast(self, cache_key: str, fast_render):
+        """Versucht den Schnellpfad; legt das Ergebnis im Cache ab (None = nicht möglich)."""
+        if fast_render is None:
+            return None
+        pdf_bytes = fast_render()
+        if pdf_bytes is not None:
+            pdf_cache.put(cache_key, pdf_bytes)
+        return pdf_bytes
+
+    def render(self, cache_key: str, build_html, stylesheets=(), fast_render=None) -> bytes:
+        """
+        Gibt das PDF zu einem Cache-Schlüssel zurück.
+
+        `build_html` wird nur bei einem Cache-Fehlzugriff aufgerufen und
+        muss das fertige HTML liefern (läuft im Request-Kontext).
+        `fast_render` ist ein optionaler Schnellpfad ohne HTML-Layout, der
+        die PDF-Bytes oder None (nicht möglich) zurückgibt.
+        """
+        pdf_bytes = pdf_cache.get(cache_key)
+        if pdf_bytes is None:
+            pdf_bytes = self._render_fast(cache_key, fast_render)
+        if pdf_bytes is None:
+            future = self._render_async(cache_key, build_html, stylesheets)
+            pdf_bytes = _wait(future)
+        return pdf_bytes
+
+    def submit(self, cache_key: str, build_html, filename: str, stylesheets=(), fast_render=None) -> PdfJob:
+        """Legt einen asynchronen Render-Auftrag an."""
+        self._purge_jobs()
+        job = PdfJob(cache_key, filename)
+
+        # Bereits gecacht oder per Schnellpfad erzeugt: Job ist sofort fertig
+        if pdf_cache.get(cache_key) is not None or self._render_fast(cache_key, fast_render) is not None:
+            job.status = 'done'
+            job.finished_at = time.monotonic()
+        else:
+            job.future = self._render_async(cache_key, build_html, stylesheets)
+            job.future.add_done_callback(lambda future: self._finish_job(job, future))
+
+        with self._lock:
+            self._jobs[job.id] = job
+        return job
+
+    def _finish_job(self, job: PdfJob, future):
+        error = future.exception()
+        if error is None:
+            job.status = 'done'
+        else:
+            job.status = 'error'
+            job.error = str(error)
+        job.finished_at = time.monotonic()
+
+    def _purge_jobs(self):
+        """Verwirft abgeschlossene Jobs, die älter als die TTL sind."""
+        now = time.monotonic()
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and now - job.finished_at > self.job_ttl]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def get_job(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def get_result(self, job: PdfJob):
+        """Gibt die PDF-Bytes eines fertigen Jobs zurück (None, falls verdrängt)."""
+        return pdf_cache.get(job.cache_key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'workers': self.max_workers,
+                'queue_size': self.queue_size,
+                'pending': self._pending,
+                'inflight': len(self._inflight),
+                'jobs': len(self._jobs)
+            }
+
+
+# Globale Service-Instanz
+pdf_service = PdfRenderService(PDF_WORKERS, PDF_QUEUE_SIZE, PDF_JOB_TTL)
@@ -0,0 +1,605 @@
+# pdf_stamp.py
+"""
+Schneller Render-Pfad für das Preisschild.
+
+Das Layout des Preisschilds ist fest - pro Fahrzeug ändern sich nur die
+Texte. Statt für jedes Schild das komplette HTML/CSS-Layout zu rechnen,
+wird pro Layout-Variante (Umweltplakette, MwSt., Verkäufer, Anzahl
+Ausstattungsmerkmale) einmalig ein Master-PDF mit WeasyPrint erzeugt. Im
+Master sind alle Elemente mit `data-stamp`-Attribut unsichtbar; Position,
+Schrift, Farbe und Ausrichtung dieser Felder werden aus dem Layout
+übernommen. Pro Fahrzeug werden danach nur noch die Texte mit pydyf an
+diese Stellen geschrieben.
+
+Passt ein Text nicht in sein Feld (würde umbrechen) oder fehlt ein Zeichen
+in der Schrift, liefert `SignMaster.stamp()` None und der Aufrufer rendert
+das Schild wie bisher komplett mit WeasyPrint.
+"""
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+import pydyf
+
+from pdf_fetcher import PDF_BASE_URL, get_url_fetcher, image_cache
+from pdf_service import PDF_RENDER_TIMEOUT, pdf_service, _get_font_config, _get_stylesheets
+
+PDF_STAMP_ENABLED = os.getenv('PDF_STAMP', '1') == '1'
+PDF_STAMP_MAX_MASTERS = int(os.getenv('PDF_STAMP_MAX_MASTERS', 64))
+
+# Im Master werden die variablen Texte ausgeblendet, das Layout bleibt erhalten
+MASTER_CSS = '[data-stamp] { visibility: hidden !important; }'
+
+# Platzhalter für die Felder im Master (einzeilig, damit das Layout stimmt)
+MASTER_PLACEHOLDER = 'X'
+
+# Zeichen, die der Schnellpfad setzen kann (Latin-1 + übliche Typografie)
+STAMP_CHARSET = (
+    set(range(0x20, 0x7f)) | set(range(0xa0, 0x100)) |
+    {ord(char) for char in '€–—‘’‚“”„…•'}
+)
+
+PT_PER_PX = 0.75  # 72 PDF-Punkte pro Zoll / 96 CSS-Pixel pro Zoll
+
+PDF_HEADER = b'%PDF-1.7\n%\xf0\x9f\x96\xa4\n'
+
+
+class StampError(Exception):
+    """Das Master-PDF ist für den Schnellpfad nicht geeignet."""
+
+
+def _number(value: float) -> bytes:
+    return f'{value:.2f}'.rstrip('0').rstrip('.').encode('ascii')
+
+
+class StampFont:
+    """Teilmenge einer Schrift mit Metriken zum Setzen von Text."""
+
+    def __init__(self, name, weight, data, glyphs, widths, bbox, ascent, descent, cap_height):
+        self.name = name
+        self.weight = weight
+        self.data = data
+        self.glyphs = glyphs  # Zeichen -> Glyph-ID
+        self.widths = widths  # Glyph-ID -> Breite (1/1000 der Schriftgröße)
+        self.bbox = bbox
+        self.ascent = ascent
+        self.descent = descent
+        self.cap_height = cap_height
+
+    @classmethod
+    def from_font_data(cls, data: bytes, index: int = 0):
+        """Erzeugt die Teilmenge `STAMP_CHARSET` einer TrueType-Schrift."""
+        from fontTools import subset
+        from fontTools.ttLib import TTFont
+
+        ttfont = TTFont(io.BytesIO(data), fontNumber=index)
+        if 'glyf' not in ttfont or 'fvar' in ttfont:
+            raise StampError('Nur statische TrueType-Schriften werden unterstützt')
+        weight = ttfont['OS/2'].usWeightClass
+
+        options = subset.Options(hinting=False, desubroutinize=True, notdef_outline=True)
+        options.layout_features = []
+        options.drop_tables += ['GSUB', 'GPOS', 'GDEF', 'kern', 'DSIG']
+        subsetter = subset.Subsetter(options)
+        subsetter.populate(unicodes=STAMP_CHARSET)
+        subsetter.subset(ttfont)
+        output = io.BytesIO()
+        ttfont.save(output)
+        font_data = output.getvalue()
+
+        # Metriken aus der gespeicherten Teilmenge lesen (Glyph-IDs neu nummeriert)
+        ttfont = TTFont(io.BytesIO(font_data))
+        scale = 1000 / ttfont['head'].unitsPerEm
+        glyph_order = ttfont.getGlyphOrder()
+        glyphs = {chr(codepoint): ttfont.getGlyphID(name) for codepoint, name in ttfont.getBestCmap().items()}
+        widths = [round(ttfont['hmtx'][name][0] * scale) for name in glyph_order]
+
+        head, hhea, os2 = ttfont['head'], ttfont['hhea'], ttfont['OS/2']
+        ps_name = (ttfont['name'].getDebugName(6) or 'Font').replace(' ', '')
+        tag = ''.join(chr(65 + byte % 26) for byte in hashlib.sha256(font_data).digest()[:6])
+        return cls(
+            name=f'{tag}+{ps_name}',
+            weight=weight,
+            data=font_data,
+            glyphs=glyphs,
+            widths=widths,
+            bbox=[round(value * scale) for value in (head.xMin, head.yMin, head.xMax, head.yMax)],
+            ascent=round(hhea.ascent * scale),
+            descent=round(hhea.descent * scale),
+            cap_height=round(getattr(os2, 'sCapHeight', 0) * scale or hhea.ascent * scale)
+        )
+
+    def encode(self, text: str):
+        """Gibt die Glyph-IDs zurück oder None, wenn ein Zeichen fehlt."""
+        glyphs = [self.glyphs.get(char) for char in text]
+        if None in glyphs:
+            return None
+        return glyphs
+
+    def text_width(self, glyphs, size: float) -> float:
+        return sum(self.widths[glyph] for glyph in glyphs) * size / 1000
+
+    def add_to(self, pdf: pydyf.PDF) -> bytes:
+        """Legt die Schrift als Type0/CIDFontType2 im PDF an und gibt die Referenz zurück."""
+        font_file = pydyf.Stream([self.data], {'Length1': len(self.data)}, compress=True)
+        pdf.add_object(font_file)
+
+        descriptor = pydyf.Dictionary({
+            'Type': '/FontDescriptor',
+            'FontName': f'/{self.name}',
+            'Flags': 4,
+            'FontBBox': pydyf.Array(self.bbox),
+            'ItalicAngle': 0,
+            'Ascent': self.ascent,
+            'Descent': self.descent,
+            'CapHeight': self.cap_height,
+            'StemV': 80,
+            'FontFile2': font_file.reference
+        })
+        pdf.add_object(descriptor)
+
+        cid_font = pydyf.Dictionary({
+            'Type': '/Font',
+            'Subtype': '/CIDFontType2',
+            'BaseFont': f'/{self.name}',
+            'CIDSystemInfo': pydyf.Dictionary({
+                'Registry': pydyf.String('Adobe'),
+                'Ordering': pydyf.String('Identity'),
+                'Supplement': 0
+            }),
+            'FontDescriptor': descriptor.reference,
+            'W': pydyf.Array([0, pydyf.Array(self.widths)]),
+            'CIDToGIDMap': '/Identity'
+        })
+        pdf.add_object(cid_font)
+
+        # ToUnicode, damit der gestempelte Text durchsuchbar/kopierbar bleibt
+        mapping = {}
+        for char, glyph in sorted(self.glyphs.items()):
+            mapping.setdefault(glyph, char)
+        entries = sorted(mapping.items())
+        cmap = [
+            b'/CIDInit /ProcSet findresource begin', b'12 dict begin', b'begincmap',
+            b'/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def',
+            b'/CMapName /Adobe-Identity-UCS def', b'/CMapType 2 def',
+            b'1 begincodespacerange', b'<0000> <ffff>', b'endcodespacerange'
+        ]
+        for start in range(0, len(entries), 100):
+            chunk = entries[start:start + 100]
+            cmap.append(f'{len(chunk)} beginbfchar'.encode())
+            for glyph, char in chunk:
+                cmap.append(f'<{glyph:04x}> <{char.encode("utf-16-be").hex()}>'.encode())
+            cmap.append(b'endbfchar')
+        cmap += [b'endcmap', b'CMapName currentdict /CMap defineresource pop', b'end', b'end']
+        to_unicode = pydyf.Stream(cmap, compress=True)
+        pdf.add_object(to_unicode)
+
+        font = pydyf.Dictionary({
+            'Type': '/Font',
+            'Subtype': '/Type0',
+            'BaseFont': f'/{self.name}',
+            'Encoding': '/Identity-H',
+            'DescendantFonts': pydyf.Array([cid_font.reference]),
+            'ToUnicode': to_unicode.reference
+        })
+        pdf.add_object(font)
+        return font.reference
+
+
+class StampSlot:
+    """Position und Stil eines Textfelds im Master (PDF-Koordinaten in pt)."""
+
+    def __init__(self, field, x, width, baseline, align, size, weight, color, frame=None):
+        self.field = field
+        self.x = x
+        self.width = width
+        self.baseline = baseline
+        self.align = align  # left, center, right
+        self.size = size
+        self.weight = weight
+        self.color = color  # (r, g, b), 0..1
+        self.frame = frame  # Rahmen, der mit dem Text mitwächst (dict) oder None
+        self.font = None  # Ressourcenname der Schrift, wird beim Zusammenbau gesetzt
+
+
+class SignMaster:
+    """Vorgerendertes Master-PDF, auf das pro Fahrzeug nur Text gestempelt wird."""
+
+    def __init__(self, body, offsets, slots, fonts, catalog_number, info_number, stamp_number, info):
+        self.body = body
+        self.slots = slots
+        self.fonts = fonts  # Ressourcenname -> StampFont
+        self.catalog_number = catalog_number
+        self.info_number = info_number
+        self.stamp_number = stamp_number
+        self.info = info
+
+        # Querverweistabelle für die unveränderlichen Objekte vorberechnen
+        self._xref = {number: f'{len(PDF_HEADER) + offset:010} 00000 n \n'.encode()
+                      for number, offset in offsets.items()}
+
+    def stamp(self, values: dict, title: str = None):
+        """
+        Setzt die Feldwerte auf den Master und gibt die PDF-Bytes zurück.
+        Listenfelder (z.B. Ausstattung) erwarten eine Liste mit genau so
+        vielen Einträgen wie der Master Felder hat. Gibt None zurück, wenn
+        ein Text nicht passt.
+        """
+        slots_by_field = {}
+        for slot in self.slots:
+            slots_by_field.setdefault(slot.field, []).append(slot)
+
+        operations = [b'Q']
+        for field, slots in slots_by_field.items():
+            value = values.get(field)
+            texts = value if isinstance(value, (list, tuple)) else [value]
+            if value is None or len(texts) != len(slots):
+                return None
+            for slot, text in zip(slots, texts):
+                # Gleiche Leerzeichen-Behandlung wie im HTML
+                text = ' '.join(str(text).split())
+                if not text and isinstance(value, (list, tuple)):
+                    return None  # Leere Listeneinträge haben im Layout eine andere Höhe
+                drawn = self._draw_text(slot, text)
+                if drawn is None:
+                    return None
+                operations.extend(drawn)
+
+        content = pydyf.Stream([b'\n'.join(operations)], compress=True)
+        info = pydyf.Dictionary({key: pydyf.String(value) for key, value in self.info.items()})
+        if title is not None:
+            info['Title'] = pydyf.String(title)
+
+        output = [PDF_HEADER, self.body]
+        position = len(PDF_HEADER) + len(self.body)
+        offsets = {}
+        for number, data in ((self.info_number, info.data), (self.stamp_number, content.data)):
+            chunk = f'{number} 0 obj\n'.encode() + data + b'\nendobj\n'
+            offsets[number] = f'{position:010} 00000 n \n'.encode()
+            output.append(chunk)
+            position += len(chunk)
+
+        size = self.stamp_number + 1
+        output.append(f'xref\n0 {size}\n'.encode())
+        output.append(b'0000000000 65535 f \n')
+        for number in range(1, size):
+            output.append(offsets.get(number) or self._xref[number])
+        output.append(
+            f'trailer\n<</Size {size} /Root {self.catalog_number} 0 R /Info {self.info_number} 0 R>>\n'
+            f'startxref\n{position}\n%%EOF\n'.encode()
+        )
+        return b''.join(output)
+
+    def _draw_text(self, slot: StampSlot, text: str):
+        """Gibt die Zeichenoperationen für ein Feld zurück (None = passt nicht)."""
+        font = self.fonts[slot.font]
+        glyphs = font.encode(text)
+        if glyphs is None:
+            return None
+        width = font.text_width(glyphs, slot.size)
+
+        operations = []
+        frame = slot.frame
+        if frame:
+            # Rahmen wächst mit dem Text (z.B. Inseratsnummer) und wird zentriert
+            frame_width = width + frame['inner_width']
+            if frame_width > slot.width + 0.01:
+                return None
+            frame_x = slot.x + (slot.width - frame_width) / 2
+            x = frame_x + frame['text_offset']
+            line = frame['line_width']
+            operations.append(b' '.join([
+                b'q', _number(line), b'w', *map(_number, frame['color']), b'RG',
+                _number(frame_x + line / 2), _number(frame['y'] + line / 2),
+                _number(frame_width - line), _number(frame['height'] - line), b're S Q'
+            ]))
+        else:
+            if width > slot.width + 0.01:
+                return None
+            if slot.align == 'center':
+                x = slot.x + (slot.width - width) / 2
+            elif slot.align == 'right':
+                x = slot.x + slot.width - width
+            else:
+                x = slot.x
+
+        if glyphs:
+            operations.append(b' '.join([
+                b'BT', f'/{slot.font}'.encode(), _number(slot.size), b'Tf',
+                *map(_number, slot.color), b'rg',
+                b'1 0 0 1', _number(x), _number(slot.baseline), b'Tm',
+                b'<' + ''.join(f'{glyph:04x}' for glyph in glyphs).encode() + b'> Tj ET'
+            ]))
+        return operations
+
+
+# ============== Master-Erzeugung (läuft im Worker-Prozess) ==============
+
+_master_css = None
+_stamp_fonts = {}  # SHA-256 der Schriftdatei -> StampFont
+
+
+def _get_master_css():
+    global _master_css
+    if _master_css is None:
+        from weasyprint import CSS
+        _master_css = CSS(string=MASTER_CSS, font_config=_get_font_config())
+    return _master_css
+
+
+def build_sign_master(master_html: str, static_folder: str, stylesheets=()):
+    """
+    Rendert das Master-PDF und gibt (SignMaster, None) zurück - oder
+    (None, Grund), wenn der Master für den Schnellpfad nicht geeignet ist.
+    """
+    try:
+        return _build_sign_master(master_html, static_folder, stylesheets), None
+    except Exception as e:
+        return None, str(e) or type(e).__name__
+
+
+def _build_sign_master(master_html, static_folder, stylesheets):
+    from weasyprint import HTML
+
+    html = HTML(string=master_html,
+                base_url=PDF_BASE_URL,
+                url_fetcher=get_url_fetcher(static_folder))
+    document = html.render(stylesheets=_get_stylesheets(static_folder, stylesheets) + [_get_master_css()],
+                           font_config=_get_font_config(),
+                           presentational_hints=True,
+                           cache=image_cache)
+    if len(document.pages) != 1:
+        raise StampError('Master-PDF hat mehr als eine Seite')
+
+    page = document.pages[0]
+    slots = _find_slots(page._page_box, page.height)
+    if not slots:
+        raise StampError('Keine Felder mit data-stamp gefunden')
+
+    result = {}
+
+    def finisher(document, pdf):
+        result['master'] = _assemble_master(document, pdf, slots)
+
+    document.write_pdf(finisher=finisher)
+    return result['master']
+
+
+def _find_slots(page_box, page_height):
+    """Sucht die Felder mit `data-stamp` im Layout und übernimmt Position und Stil."""
+    from weasyprint.formatting_structure import boxes
+
+    slots = []
+
+    def walk(box, parents):
+        element = getattr(box, 'element', None)
+        field = element.get('data-stamp') if element is not None else None
+        # Ein Element kann mehrere Boxen haben - nur die äußerste zählt
+        if field and not (parents and getattr(parents[-1], 'element', None) is element):
+            slots.append(_make_slot(field, box, parents, page_height, boxes))
+            return
+        if isinstance(box, boxes.ParentBox):
+            for child in box.children:
+                walk(child, parents + [box])
+
+    walk(page_box, [])
+    return slots
+
+
+def _make_slot(field, box, parents, page_height, boxes):
+    text = next((child for child in box.descendants() if isinstance(child, boxes.TextBox)), None)
+    if text is None:
+        raise StampError(f'Feld {field} enthält keinen Text')
+
+    style = text.style
+    if style['color'].alpha < 1:
+        raise StampError(f'Feld {field} hat eine transparente Textfarbe')
+    color = tuple(style['color'].to('srgb').coordinates)
+
+    frame = None
+    if box.element.get('data-stamp-fit') is not None:
+        # Flex-Element zwischen zwei Nachbarn (justify-content: space-between):
+        # wird mittig in der Lücke zwischen den Nachbarn platziert
+        siblings = [child for child in parents[-1].children if isinstance(child, boxes.Box)]
+        index = siblings.index(box)
+        if index == 0 or index == len(siblings) - 1:
+            raise StampError(f'Feld {field} braucht Nachbarn links und rechts')
+        previous, following = siblings[index - 1], siblings[index + 1]
+        left = previous.border_box_x() + previous.border_width()
+        width = following.border_box_x() - left
+        align = 'center'
+
+        border_widths = {box.border_top_width, box.border_right_width, box.border_bottom_width, box.border_left_width}
+        if len(border_widths) != 1:
+            raise StampError(f'Feld {field} braucht einen gleichmäßigen Rahmen')
+        border = border_widths.pop()
+        border_color = box.style['border_top_color']
+        if border_color == 'currentcolor':
+            border_color = box.style['color']
+        frame = {
+            'inner_width': (box.padding_left + box.padding_right + 2 * border) * PT_PER_PX,
+            'text_offset': (box.padding_left + border) * PT_PER_PX,
+            'line_width': border * PT_PER_PX,
+            'color': tuple(border_color.to('srgb').coordinates),
+            'y': (page_height - box.border_box_y() - box.border_height()) * PT_PER_PX,
+            'height': box.border_height() * PT_PER_PX
+        }
+    else:
+        # Inline-Feld: Breite und Ausrichtung kommen vom umgebenden Block
+        block = box
+        if isinstance(box, boxes.InlineBox):
+            block = next(parent for parent in reversed(parents)
+                         if isinstance(parent, boxes.BlockContainerBox))
+        left, width = block.content_box_x(), block.width
+        align = {'right': 'right', 'end': 'right', 'center': 'center'}.get(block.style['text_align_all'], 'left')
+
+    return StampSlot(
+        field=field,
+        x=left * PT_PER_PX,
+        width=width * PT_PER_PX,
+        baseline=(page_height - text.position_y - text.baseline) * PT_PER_PX,
+        align=align,
+        size=style['font_size'] * PT_PER_PX,
+        weight=style['font_weight'],
+        color=color,
+        frame=frame
+    )
+
+
+def _select_fonts(document, weights):
+    """
+    Wählt für jede benötigte Schriftstärke eine Schrift aus dem Master.
+    Verwendet wird die Schriftfamilie mit den meisten gesetzten Glyphen
+    (der Fließtext), innerhalb der Familie die nächstliegende Stärke.
+    """
+    from weasyprint.text.fonts import get_hb_object_data
+
+    families = {}
+    for font in document.fonts.values():
+        if not font.style:  # keine kursiven Schnitte
+            families.setdefault(font.family, []).append(font)
+    if not families:
+        raise StampError('Keine Schriften im Master gefunden')
+    family = max(families, key=lambda name: sum(len(font.cmap) for font in families[name]))
+
+    candidates = {}
+    for font in families[family]:
+        # Vollständige Schriftdatei (die im Master eingebettete ist bereits reduziert)
+        data = get_hb_object_data(font.hb_face)
+        if not data:
+            continue
+        digest = hashlib.sha256(data).hexdigest()
+        if digest not in _stamp_fonts:
+            _stamp_fonts[digest] = StampFont.from_font_data(data, font.index)
+        candidates[digest] = _stamp_fonts[digest]
+    if not candidates:
+        raise StampError('Schriftdateien nicht lesbar')
+
+    return {weight: min(candidates.values(), key=lambda font: abs(font.weight - weight)) for weight in weights}
+
+
+def _assemble_master(document, pdf, slots):
+    """Ergänzt Stempel-Schriften und Inhaltsreihenfolge und serialisiert den Master."""
+    fonts = _select_fonts(document, {slot.weight for slot in slots})
+
+    page = pdf.objects[pdf.pages['Kids'][0]]
+    resources = pdf.objects[int(page['Resources'].split()[0])]
+    font_resources = pdf.objects[int(resources['Font'].split()[0])]
+
+    names = {}
+    for index, font in enumerate(dict.fromkeys(fonts.values())):
+        name = f'Stamp{index}'
+        font_resources[name] = font.add_to(pdf)
+        names[id(font)] = name
+    for slot in slots:
+        slot.font = names[id(fonts[slot.weight])]
+
+    # Master-Inhalt in q ... Q kapseln, damit der Stempel im Standard-Koordinatensystem beginnt
+    save_state = pydyf.Stream([b'q'])
+    pdf.add_object(save_state)
+    stamp_number = len(pdf.objects)
+    page['Contents'] = pydyf.Array([save_state.reference, page['Contents'], f'{stamp_number} 0 R'.encode()])
+
+    body, offsets = [], {}
+    position = 0
+    for pdf_object in pdf.objects:
+        if pdf_object.free == 'f' or pdf_object is pdf.info:
+            continue
+        chunk = pdf_object.indirect + b'\n'
+        offsets[pdf_object.number] = position
+        body.append(chunk)
+        position += len(chunk)
+
+    info = {key: value.string for key, value in pdf.info.items() if isinstance(value, pydyf.String)}
+    return SignMaster(
+        body=b''.join(body),
+        offsets=offsets,
+        slots=slots,
+        fonts={names[id(font)]: font for font in fonts.values()},
+        catalog_number=pdf.catalog.number,
+        info_number=pdf.info.number,
+        stamp_number=stamp_number,
+        info=info
+    )
+
+
+# ============== Master-Cache (im Web-Prozess) ==============
+
+class SignMasterCache:
+    """LRU-Cache der Master-PDFs; jeder Master wird nur einmal gerendert."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.stamped = 0
+        self.fallbacks = 0
+        self._masters = OrderedDict()  # master_key -> SignMaster oder None (ungeeignet)
+        self._inflight = {}  # master_key -> Future
+        self._lock = threading.Lock()
+
+    def get(self, master_key: str, build_html=None, stylesheets=()):
+        """
+        Gibt den Master zurück. Fehlt er und ist `build_html` angegeben, wird
+        er im Render-Pool erzeugt (blockiert bis fertig), sonst None.
+        """
+        with self._lock:
+            if master_key in self._masters:
+                self._masters.move_to_end(master_key)
+                return self._masters[master_key]
+            future = self._inflight.get(master_key)
+
+        owner = False
+        if future is None:
+            if build_html is None:
+                return None
+            master_html = build_html()
+            with self._lock:
+                # Ein paralleler Request kann den Master inzwischen angestoßen haben
+                future = self._inflight.get(master_key)
+                if future is None:
+                    future = pdf_service.run(build_sign_master, master_html, pdf_service.static_folder, tuple(stylesheets))
+                    self._inflight[master_key] = future
+                    owner = True
+
+        try:
+            master, reason = future.result(timeout=PDF_RENDER_TIMEOUT)
+        finally:
+            with self._lock:
+                self._inflight.pop(master_key, None)
+
+        if master is None and owner:
+            from flask import current_app
+            current_app.logger.warning(f"PDF-Schnellpfad für Master {master_key[:12]} nicht verfügbar: {reason}")
+
+        with self._lock:
+            self._masters[master_key] = master
+            while len(self._masters) > self.max_entries:
+                self._masters.popitem(last=False)
+        return master
+
+    def count(self, stamped: bool):
+        with self._lock:
+            if stamped:
+                self.stamped += 1
+            else:
+                self.fallbacks += 1
+
+    def clear(self):
+        with self._lock:
+            self._masters.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'enabled': PDF_STAMP_ENABLED,
+                'masters': sum(1 for master in self._masters.values() if master is not None),
+                'unusable_masters': sum(1 for master in self._masters.values() if master is None),
+                'max_masters': self.max_entries,
+                'stamped': self.stamped,
+                'fallbacks': self.fallbacks
+            }
+
+
+# Globale Instanz
+sign_masters = SignMasterCache(PDF_STAMP_MAX_MASTERS)
@@ -1,19 +1,41 @@
-from flask import Blueprint, jsonify, request
-from database import get_car_by_id, update_car, delete_car
-from models import db, Car
-from sqlalchemy import func, desc
-from datetime import datetime, timedelta
+from datetime import datetime
+from itertools import chain
+
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from database import (get_car_by_id, update_car, delete_car, get_cars_page, count_cars, count_archived_cars,
+                      build_cars_query, build_archive_query, bulk_update_cars, bulk_delete_cars)
+from car_export import iter_export_rows, iter_csv, iter_xlsx, gzip_stream
+from car_import import import_cars, iter_records, detect_format, IMPORT_FORMATS
+from models import db, Car, CarArchive
+from car_stats import car_stats, query_stats_groups, REPORT_DIMENSIONS
+from feature_index import get_feature_catalogue
+from conditional_requests import (row_etag, get_row_validators, is_not_modified, not_modified, set_validators,
+                                  if_match_failed, precondition_failed)
+from sqlalchemy import desc
+from sqlalchemy.orm.exc import StaleDataError
 
 bp = Blueprint('car', __name__)
 
 
+def car_etag(car_id, version):
+    return row_etag('car', car_id, version)
+
+
 @bp.route('/car/<int:car_id>', methods=['GET'])
 def get_car(car_id):
+    # Unverändert seit dem letzten Abruf: 304 ohne das Fahrzeug zu laden
+    validators = get_row_validators(Car, car_id)
+    if validators is None:
+        return jsonify({'error': 'Fahrzeug nicht gefunden'}), 404
+    version, last_modified = validators
+    if is_not_modified(car_etag(car_id, version), last_modified):
+        return not_modified(car_etag(car_id, version), last_modified)
+
     car = get_car_by_id(car_id)
 
     if car:
         # Convert Car object to dictionary
-        return jsonify(car.to_dict())
+        return set_validators(jsonify(car.to_dict()), car_etag(car.id, car.version), car.updated_at or car.created_at)
     else:
         return jsonify({'error': 'Fahrzeug nicht gefunden'}), 404
 
@@ -23,10 +45,26 @@ def update_car_route(car_id):
     if not request.is_json:
         return jsonify({'error': 'Content-Type muss application/json sein'}), 400
 
+    car = get_car_by_id(car_id)
+    if not car:
+        return jsonify({'error': 'Fahrzeug nicht gefunden'}), 404
+    # Mit If-Match: nur speichern, wenn seit dem Laden niemand geändert hat
+    if if_match_failed(car_etag(car.id, car.version)):
+        return precondition_failed(car_etag(car.id, car.version))
+
     try:
         data = request.get_json()
         update_car(car_id, data)
-        return jsonify({'message': 'Fahrzeug erfolgreich aktualisiert'})
+        response = jsonify({'message': 'Fahrzeug erfolgreich aktualisiert'})
+        response.set_etag(car_etag(car.id, car.version))
+        return response
+    except StaleDataError:
+        # Zwischen Laden und Speichern geändert (UPDATE ... WHERE version = ?)
+        db.session.rollback()
+        validators = get_row_validators(Car, car_id)
+        if validators is None:
+            return jsonify({'error': 'Fahrzeug nicht gefunden'}), 404
+        return precondition_failed(car_etag(car_id, validators[0]))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -40,58 +78,189 @@ def delete_car_route(car_id):
         return jsonify({'error': str(e)}), 500
 
 
+# ============== Sammelaktionen ==============
+
+def _get_bulk_selection(data):
+    """Auswahl einer Sammelaktion: `ids` oder `filter` (wie /view-cars), optional `exclude_ids`."""
+    return {
+        'car_ids': data.get('ids'),
+        'filters': data.get('filter'),
+        'exclude_ids': data.get('exclude_ids')
+    }
+
+
+@bp.route('/api/cars/bulk-update', methods=['POST'])
+def bulk_update_cars_route():
+    """
+    Ändert alle ausgewählten Fahrzeuge mit einem UPDATE, z.B.
+    {"ids": [1, 2], "changes": {"in_stock": false}} oder
+    {"filter": {"search": "golf"}, "changes": {"price_percent": -5}}.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Content-Type muss application/json sein'}), 400
+
+    try:
+        count = bulk_update_cars(data.get('changes'), **_get_bulk_selection(data))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    return jsonify({'message': f'{count} Fahrzeug(e) aktualisiert', 'updated': count})
+
+
+@bp.route('/api/cars/bulk-delete', methods=['POST'])
+def bulk_delete_cars_route():
+    """Löscht alle ausgewählten Fahrzeuge mit einem DELETE (Auswahl wie bulk-update)."""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Content-Type muss application/json sein'}), 400
+
+    try:
+        count = bulk_delete_cars(**_get_bulk_selection(data))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    return jsonify({'message': f'{count} Fahrzeug(e) gelöscht', 'deleted': count})
+
+
+# ============== Fahrzeugliste (Keyset-Pagination) ==============
+
+CARS_PAGE_SIZE = 50
+CARS_PAGE_SIZE_MAX = 200
+
+
+def _car_list_item(car):
+    """Felder einer Zeile der Fahrzeugübersicht."""
+    return {
+        'id': car.id,
+        'listing_number': car.listing_number,
+        'brand': car.brand,
+        'model': car.model,
+        'engine_capacity': car.engine_capacity,
+        'power': car.power,
+        'fuel_type': car.fuel_type,
+        'transmission': car.transmission,
+        'mileage': car.mileage,
+        'first_registration': car.first_registration,
+        'features': car.features,
+        'eco_badge': car.eco_badge,
+        'price': car.price,
+        'vat_deductible': car.vat_deductible,
+        'in_stock': car.in_stock,
+        'created_at': car.created_at.strftime('%d.%m.%Y') if car.created_at else '',
+        'archived': isinstance(car, CarArchive)
+    }
+
+
+def _include_archive():
+    """`include_archive=1`: archivierte Fahrzeuge (siehe car_archive.py) anhängen."""
+    return request.args.get('include_archive') == '1'
+
+
+@bp.route('/api/cars', methods=['GET'])
+def list_cars():
+    """
+    Gibt eine Seite der Fahrzeugliste zurück (Parameter wie /view-cars:
+    search, feature (mehrfach), sort, order, include_archive). Die nächste Seite wird mit
+    `cursor=<next_cursor>` abgefragt; `total` wird nur für die erste Seite berechnet.
+    Archivierte Fahrzeuge folgen auf den Bestand und sind mit `archived` markiert;
+    `archived_total` gibt ihren Anteil an `total` an.
+    """
+    search_term = request.args.get('search', '')
+    features = request.args.getlist('feature')
+    sort_by = request.args.get('sort', 'relevance' if search_term else 'id')
+    sort_order = request.args.get('order', 'asc')
+    cursor = request.args.get('cursor')
+    limit = request.args.get('limit', CARS_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, CARS_PAGE_SIZE_MAX))
+    include_archive = _include_archive()
+
+    try:
+        cars, next_cursor = get_cars_page(search_term, sort_by, sort_order, cursor, limit, features,
+                                          include_archive)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    result = {
+        'items': [_car_list_item(car) for car in cars],
+        'next_cursor': next_cursor
+    }
+    if not cursor:
+        result['total'] = count_cars(search_term, features)
+        if include_archive:
+            result['archived_total'] = count_archived_cars(search_term, features)
+            result['total'] += result['archived_total']
+    return jsonify(result)
+
+
+@bp.route('/api/features', methods=['GET'])
+def list_features():
+    """
+    Ausstattungskatalog mit festen Codes (Parameter: category, z.B. 'car'
+    oder 'comfort_features'; with_counts=1 für die Anzahl Zuordnungen je
+    Merkmal). Codes und Namen können als `feature` in /api/cars und
+    /api/intakes gefiltert werden.
+    """
+    category = request.args.get('category') or None
+    with_counts = request.args.get('with_counts', '').lower() in ('1', 'true')
+    return jsonify(get_feature_catalogue(category, with_counts))
+
+
 # ============== Dashboard API-Endpunkte ==============
 
 @bp.route('/api/cars/stats', methods=['GET'])
 def get_car_stats():
     """Gibt Statistiken über alle Fahrzeuge im Bestand zurück (verkaufte Fahrzeuge werden ausgeschlossen)."""
     try:
-        # Basis-Query: nur Fahrzeuge im Bestand
-        in_stock_filter = Car.in_stock == True
-        
-        # Gesamtanzahl (nur im Bestand)
-        total = Car.query.filter(in_stock_filter).count()
-        
-        # Durchschnittspreis (nur im Bestand)
-        avg_price_result = db.session.query(func.avg(Car.price)).filter(in_stock_filter).scalar()
-        avg_price = float(avg_price_result) if avg_price_result else 0
-        
-        # Durchschnittliche Kilometer (nur im Bestand)
-        avg_mileage_result = db.session.query(func.avg(Car.mileage)).filter(in_stock_filter).scalar()
-        avg_mileage = float(avg_mileage_result) if avg_mileage_result else 0
-        
-        # Fahrzeuge diese Woche hinzugefügt (nur im Bestand)
-        week_ago = datetime.now() - timedelta(days=7)
-        recent_count = Car.query.filter(in_stock_filter, Car.created_at >= week_ago).count()
-        
-        # Fahrzeuge nach Marke (Top 5, nur im Bestand)
-        brands = db.session.query(
-            Car.brand, 
-            func.count(Car.id).label('count')
-        ).filter(in_stock_filter).group_by(Car.brand).order_by(desc('count')).limit(5).all()
-        
-        brands_data = [{'brand': b[0], 'count': b[1]} for b in brands]
-        
-        # Fahrzeuge nach Kraftstoff (nur im Bestand)
-        fuel_types = db.session.query(
-            Car.fuel_type,
-            func.count(Car.id).label('count')
-        ).filter(in_stock_filter).group_by(Car.fuel_type).all()
-        
-        fuel_data = [{'fuel_type': f[0], 'count': f[1]} for f in fuel_types]
-        
-        return jsonify({
-            'total': total,
-            'avg_price': round(avg_price, 2),
-            'avg_mileage': round(avg_mileage, 2),
-            'recent_count': recent_count,
-            'brands': brands_data,
-            'fuel_types': fuel_data
-        })
-        
+        # Gecacht bis zur nächsten Änderung am Bestand (siehe car_stats.py)
+        return jsonify(car_stats.get())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/api/cars/stats/report', methods=['GET'])
+def get_car_stats_report():
+    """
+    Auswertung nach frei wählbaren Gruppen aus der Statistik-Tabelle.
+    Parameter: group_by (kommagetrennt: brand, fuel_type, seller, in_stock,
+    day, month, year), in_stock (1/0), from/to (YYYY-MM-DD, Anlagedatum).
+    """
+    group_by = [name.strip() for name in request.args.get('group_by', 'brand').split(',') if name.strip()]
+    unknown = [name for name in group_by if name not in REPORT_DIMENSIONS]
+    if unknown:
+        return jsonify({'error': f"Unbekannte Gruppierung: {', '.join(unknown)}"}), 400
+
+    in_stock = request.args.get('in_stock')
+    if in_stock not in (None, '', '0', '1'):
+        return jsonify({'error': 'in_stock muss 0 oder 1 sein'}), 400
+
+    try:
+        rows = query_stats_groups(
+            group_by,
+            in_stock=None if in_stock in (None, '') else in_stock == '1',
+            date_from=request.args.get('from') or None,
+            date_to=request.args.get('to') or None
+        )
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+    items = []
+    for row in rows:
+        count, price_sum, mileage_sum = row[-3:]
+        item = dict(zip(group_by, row[:-3]))
+        count = count or 0
+        item.update({
+            'count': count,
+            'price_sum': price_sum or 0,
+            'mileage_sum': mileage_sum or 0,
+            'avg_price': round((price_sum or 0) / count, 2) if count else 0,
+            'avg_mileage': round((mileage_sum or 0) / count, 2) if count else 0,
+        })
+        items.append(item)
+    return jsonify({'group_by': group_by, 'items': items})
+
 
 @bp.route('/api/cars/recent', methods=['GET'])
 def get_recent_cars():
@@ -122,6 +291,80 @@ def get_recent_cars():
         return jsonify({'error': str(e)}), 500
 
 
+def _export_rows():
+    """Exportzeilen mit den Parametern von /view-cars (Archiv mit include_archive=1 dahinter)."""
+    search_term = request.args.get('search', '')
+    sort_by = request.args.get('sort', 'relevance' if search_term else 'id')
+    sort_order = request.args.get('order', 'asc')
+    features = request.args.getlist('feature')
+    rows = iter_export_rows(build_cars_query(search_term, sort_by, sort_order, features))
+    if _include_archive():
+        archive_query = build_archive_query(search_term, sort_by, sort_order, features)
+        rows = chain(rows, iter_export_rows(archive_query, CarArchive))
+    return rows
+
+
+def _export_filename(extension):
+    return f"fahrzeuge_export_{datetime.now().strftime('%Y-%m-%d')}.{extension}"
+
+
+@bp.route('/api/cars/export.csv', methods=['GET'])
+def export_cars_csv():
+    """
+    Streamt die Fahrzeugliste als CSV (Filter wie /view-cars). Unterstützt
+    der Client gzip, wird die Ausgabe fortlaufend komprimiert.
+    """
+    chunks = iter_csv(_export_rows())
+    headers = {
+        'Content-Disposition': f'attachment; filename="{_export_filename("csv")}"',
+        'Vary': 'Accept-Encoding'
+    }
+    if 'gzip' in request.accept_encodings:
+        chunks = gzip_stream(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    return Response(stream_with_context(chunks), mimetype='text/csv', headers=headers)
+
+
+@bp.route('/api/cars/export.xlsx', methods=['GET'])
+def export_cars_xlsx():
+    """Streamt die Fahrzeugliste als Excel-Arbeitsmappe (Filter wie /view-cars)."""
+    chunks = iter_xlsx(_export_rows())
+    return Response(
+        stream_with_context(chunks),
+        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        headers={'Content-Disposition': f'attachment; filename="{_export_filename("xlsx")}"'}
+    )
+
+
+@bp.route('/api/cars/import', methods=['POST'])
+def import_cars_file():
+    """
+    Sammelimport aus CSV oder mobile.de-Export (siehe car_import.py).
+    Die Datei kommt als Upload (`file`) oder als Request-Body; das Format
+    wird über `format` (csv/xml) angegeben oder aus Dateiname/Content-Type
+    erkannt. Gibt die Anzahl neuer/aktualisierter Fahrzeuge und die
+    fehlerhaften Zeilen zurück.
+    """
+    upload = request.files.get('file')
+    if upload is not None:
+        stream, filename, content_type = upload.stream, upload.filename, upload.mimetype
+    elif request.content_length:
+        stream, filename, content_type = request.stream, '', request.mimetype
+    else:
+        return jsonify({'error': 'Keine Datei übermittelt'}), 400
+
+    file_format = request.args.get('format') or detect_format(filename, content_type)
+    if file_format not in IMPORT_FORMATS:
+        return jsonify({'error': f'Unbekanntes Format: {file_format}'}), 400
+
+    try:
+        result = import_cars(iter_records(stream, file_format))
+    except (ValueError, SyntaxError) as e:
+        # z.B. ungültiges XML oder nicht lesbare CSV
+        return jsonify({'error': f'Datei konnte nicht gelesen werden: {e}'}), 400
+    return jsonify(result.to_dict())
+
+
 @bp.route('/api/cars/export', methods=['GET'])
 def export_cars():
     """Exportiert alle Fahrzeuge als JSON (für CSV-Export im Frontend)."""
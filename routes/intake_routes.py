@@ -2,15 +2,101 @@
 Routes für das Fahrzeug-Aufnahmeblatt (Vehicle Intake Form)
 Enthält CRUD-Operationen und PDF-Export
 """
-from flask import Blueprint, jsonify, request, render_template, make_response
+from flask import Blueprint, jsonify, request, render_template, make_response, current_app, send_file
 from models import db, VehicleIntake
+from pdf_cache import pdf_cache, make_key, template_digest
+from pdf_service import pdf_service, PdfQueueFullError, PdfRenderTimeoutError
+from feature_index import intake_feature_condition
+from intake_numbers import reserve_number, release_number
+from intake_summary import intake_counts, summary_items
+from conditional_requests import (row_etag, get_row_validators, is_not_modified, not_modified, set_validators,
+                                  if_match_failed, precondition_failed)
+from io import BytesIO
 from sqlalchemy import desc
+from sqlalchemy.orm.exc import StaleDataError
+from werkzeug.http import quote_etag
 from datetime import datetime
 import json
 
 bp = Blueprint('intake', __name__)
 
 
+def get_intake_print_context(data):
+    """Bereitet die Template-Variablen für die Druckansicht vor."""
+    # Eco-Badge Farbe bestimmen
+    eco_badge_colors = {
+        'grün': ('#22c55e', '#16a34a'),
+        'gelb': ('#eab308', '#ca8a04'),
+        'rot': ('#ef4444', '#dc2626'),
+    }
+    eco_badge = data.get('eco_badge', 'grün')
+    eco_color, eco_stroke = eco_badge_colors.get(eco_badge, ('#22c55e', '#16a34a'))
+
+    return {
+        'intake': data,
+        'eco_badge_color': eco_color,
+        'eco_badge_stroke': eco_stroke,
+        'print_date': datetime.now().strftime('%d.%m.%Y')
+    }
+
+
+def get_intake_print_key(intake_id, version):
+    """
+    Schlüssel der Druckansicht (PDF-Cache und ETag von PDF und Druckansicht).
+
+    Versioniert über die Zeilenversion - der Datensatz muss dafür weder
+    geladen noch serialisiert werden.
+    """
+    return make_key(
+        'intake_pdf.html',
+        intake_id,
+        version,
+        # Das Druckdatum steht im PDF
+        datetime.now().strftime('%Y-%m-%d'),
+        template_digest(current_app.jinja_env, 'intake_pdf.html')
+    )
+
+
+def get_intake_pdf_cache_key(intake):
+    """Berechnet den Cache-Schlüssel für das Aufnahmeblatt-PDF."""
+    return get_intake_print_key(intake.id, intake.version)
+
+
+def intake_etag(intake_id, version):
+    return row_etag('intake', intake_id, version)
+
+
+def _print_not_modified(intake_id):
+    """304-Antwort für PDF und Druckansicht, wenn der ETag noch passt (sonst None)."""
+    validators = get_row_validators(VehicleIntake, intake_id)
+    if validators is None:
+        return None
+    etag = get_intake_print_key(intake_id, validators[0])
+    # Ohne Last-Modified: Druckdatum und Template gehen nur in den ETag ein
+    if is_not_modified(etag):
+        return not_modified(etag)
+    return None
+
+
+def build_intake_pdf_html(data):
+    """Rendert das HTML des Aufnahmeblatts für die PDF-Erzeugung."""
+    return render_template('intake_pdf.html', **get_intake_print_context(data))
+
+
+def render_intake_pdf(intake):
+    """Gibt das Aufnahmeblatt als PDF-Bytes zurück (aus dem Cache oder neu gerendert)."""
+    return pdf_service.render(
+        get_intake_pdf_cache_key(intake),
+        lambda: build_intake_pdf_html(intake.to_dict())
+    )
+
+
+def get_intake_pdf_filename(intake):
+    """Gibt den Download-Dateinamen für ein Aufnahmeblatt zurück."""
+    number = intake.internal_number or intake.id
+    return f"Aufnahmeblatt_{intake.brand}_{intake.model_variant}_{number}.pdf".replace(" ", "_").replace("/", "-")
+
+
 # ============== API-Endpunkte ==============
 
 @bp.route('/api/intake', methods=['POST'])
@@ -35,11 +121,13 @@ def create_intake():
         db.session.add(intake)
         db.session.commit()
         
-        return jsonify({
+        response = jsonify({
             'success': True,
             'message': 'Aufnahmeblatt erfolgreich erstellt',
             'id': intake.id
-        }), 201
+        })
+        response.set_etag(intake_etag(intake.id, intake.version))
+        return response, 201
         
     except Exception as e:
         db.session.rollback()
@@ -48,13 +136,24 @@ def create_intake():
 
 @bp.route('/api/intake/<int:intake_id>', methods=['GET'])
 def get_intake(intake_id):
-    """Gibt ein einzelnes Aufnahmeblatt zurück."""
+    """Gibt ein einzelnes Aufnahmeblatt zurück (304, wenn unverändert)."""
+    validators = get_row_validators(VehicleIntake, intake_id)
+    if validators is None:
+        return jsonify({'error': 'Aufnahmeblatt nicht gefunden'}), 404
+    version, last_modified = validators
+    if is_not_modified(intake_etag(intake_id, version), last_modified):
+        return not_modified(intake_etag(intake_id, version), last_modified)
+
     intake = VehicleIntake.query.get(intake_id)
     
     if not intake:
         return jsonify({'error': 'Aufnahmeblatt nicht gefunden'}), 404
     
-    return jsonify(intake.to_dict())
+    return set_validators(
+        jsonify(intake.to_dict()),
+        intake_etag(intake.id, intake.version),
+        intake.updated_at or intake.created_at
+    )
 
 
 @bp.route('/api/intake/<int:intake_id>', methods=['PUT'])
@@ -66,17 +165,33 @@ def update_intake(intake_id):
     intake = VehicleIntake.query.get(intake_id)
     if not intake:
         return jsonify({'error': 'Aufnahmeblatt nicht gefunden'}), 404
+    # Mit If-Match: nur speichern, wenn seit dem Laden niemand geändert hat
+    if if_match_failed(intake_etag(intake.id, intake.version)):
+        return precondition_failed(intake_etag(intake.id, intake.version))
     
     try:
+        # Das alte PDF wird nach dem Speichern nie mehr abgerufen - gleich verwerfen
+        old_cache_key = get_intake_pdf_cache_key(intake)
+        
         data = request.get_json()
         intake.from_dict(data)
+        pdf_cache.discard(old_cache_key)
         db.session.commit()
         
-        return jsonify({
+        response = jsonify({
             'success': True,
             'message': 'Aufnahmeblatt erfolgreich aktualisiert'
         })
+        response.set_etag(intake_etag(intake.id, intake.version))
+        return response
         
+    except StaleDataError:
+        # Zwischen Laden und Speichern geändert (UPDATE ... WHERE version = ?)
+        db.session.rollback()
+        validators = get_row_validators(VehicleIntake, intake_id)
+        if validators is None:
+            return jsonify({'error': 'Aufnahmeblatt nicht gefunden'}), 404
+        return precondition_failed(intake_etag(intake_id, validators[0]))
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -90,7 +205,9 @@ def delete_intake(intake_id):
         return jsonify({'error': 'Aufnahmeblatt nicht gefunden'}), 404
     
     try:
+        old_cache_key = get_intake_pdf_cache_key(intake)
         db.session.delete(intake)
+        pdf_cache.discard(old_cache_key)
         db.session.commit()
         
         return jsonify({
@@ -105,11 +222,15 @@ def delete_intake(intake_id):
 
 @bp.route('/api/intakes', methods=['GET'])
 def list_intakes():
-    """Gibt alle Aufnahmeblätter zurück (mit Pagination)."""
+    """
+    Gibt alle Aufnahmeblätter zurück (mit Pagination).
+    `fields=summary` liefert nur die Felder der Übersicht (siehe intake_summary.py).
+    """
     try:
-        page = request.args.get('page', 1, type=int)
+        page = max(request.args.get('page', 1, type=int), 1)
         per_page = request.args.get('per_page', 20, type=int)
-        per_page = min(per_page, 100)  # Maximal 100 pro Seite
+        per_page = min(per_page, 100) if per_page > 0 else 20  # Maximal 100 pro Seite
+        summary = request.args.get('fields') == 'summary'
         
         # Sortierung
         sort_by = request.args.get('sort_by', 'created_at')
@@ -131,6 +252,16 @@ def list_intakes():
                 )
             )
         
+        # Ausstattungsfilter (Namen oder Codes aus /api/features, match=all|any)
+        features = request.args.getlist('feature')
+        feature_match = 'any' if request.args.get('feature_match') == 'any' else 'all'
+        feature_filter = intake_feature_condition(features, feature_match)
+        if feature_filter is not None:
+            query = query.filter(feature_filter)
+        
+        # Anzahl vor der Sortierung (gecacht je Filter)
+        total = intake_counts.count((search, tuple(features), feature_match), query)
+        
         # Sortierung anwenden
         if hasattr(VehicleIntake, sort_by):
             order_column = getattr(VehicleIntake, sort_by)
@@ -142,16 +273,18 @@ def list_intakes():
             query = query.order_by(desc(VehicleIntake.created_at))
         
         # Pagination
-        pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+        pages = (total + per_page - 1) // per_page
+        query = query.limit(per_page).offset((page - 1) * per_page)
+        items = summary_items(query) if summary else [item.to_dict() for item in query]
         
         result = {
-            'items': [item.to_dict() for item in pagination.items],
-            'total': pagination.total,
-            'pages': pagination.pages,
+            'items': items,
+            'total': total,
+            'pages': pages,
             'current_page': page,
             'per_page': per_page,
-            'has_next': pagination.has_next,
-            'has_prev': pagination.has_prev
+            'has_next': page < pages,
+            'has_prev': page > 1
         }
         
         return jsonify(result)
@@ -186,52 +319,65 @@ def get_intake_options():
 
 @bp.route('/api/intake/<int:intake_id>/pdf', methods=['GET'])
 def get_intake_pdf(intake_id):
-    """Generiert eine druckbare PDF-Ansicht des Aufnahmeblatts."""
+    """Generiert das Aufnahmeblatt als PDF (gecacht bis zur nächsten Änderung)."""
+    response = _print_not_modified(intake_id)
+    if response:
+        return response
+
     intake = VehicleIntake.query.get(intake_id)
     
     if not intake:
         return jsonify({'error': 'Aufnahmeblatt nicht gefunden'}), 404
     
-    # Daten für Template vorbereiten
-    data = intake.to_dict()
-    
-    # Eco-Badge Farbe bestimmen
-    eco_badge_colors = {
-        'grün': ('#22c55e', '#16a34a'),
-        'gelb': ('#eab308', '#ca8a04'),
-        'rot': ('#ef4444', '#dc2626'),
-    }
-    eco_badge = data.get('eco_badge', 'grün')
-    eco_color, eco_stroke = eco_badge_colors.get(eco_badge, ('#22c55e', '#16a34a'))
+    try:
+        pdf_bytes = render_intake_pdf(intake)
+    except PdfQueueFullError as e:
+        return jsonify({'error': str(e)}), 503
+    except PdfRenderTimeoutError as e:
+        return jsonify({'error': str(e)}), 504
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
     
-    return render_template(
-        'intake_pdf.html',
-        intake=data,
-        eco_badge_color=eco_color,
-        eco_badge_stroke=eco_stroke,
-        print_date=datetime.now().strftime('%d.%m.%Y')
+    # inline: Browser öffnet das PDF direkt zum Drucken
+    response = send_file(
+        BytesIO(pdf_bytes),
+        download_name=get_intake_pdf_filename(intake),
+        as_attachment=False,
+        mimetype='application/pdf'
     )
+    return set_validators(response, get_intake_pdf_cache_key(intake))
 
 
-@bp.route('/api/intake/generate-number', methods=['GET'])
+@bp.route('/api/intake/generate-number', methods=['POST'])
 def generate_internal_number():
-    """Generiert eine neue interne Fahrzeugnummer."""
+    """Reserviert die nächste interne Fahrzeugnummer des Jahres (siehe intake_numbers.py)."""
     try:
-        year = datetime.now().year
-        
-        # Zähle bestehende Einträge dieses Jahres
-        count = VehicleIntake.query.filter(
-            VehicleIntake.internal_number.like(f'{year}-%')
-        ).count()
-        
-        # Neue Nummer generieren
-        new_number = f'{year}-{str(count + 1).zfill(3)}'
+        new_number = reserve_number()
+        db.session.commit()
         
         return jsonify({
             'internal_number': new_number
         })
         
     except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/api/intake/release-number', methods=['POST'])
+def release_internal_number():
+    """Gibt eine reservierte Nummer frei, wenn das Formular ohne Speichern verlassen wird."""
+    data = request.get_json(silent=True) or {}
+    number = data.get('internal_number')
+    if not number:
+        return jsonify({'error': 'internal_number fehlt'}), 400
+    
+    try:
+        released = release_number(number)
+        db.session.commit()
+        return jsonify({'released': released})
+    except Exception as e:
+        db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
 
@@ -250,34 +396,23 @@ def edit_intake_form(intake_id):
     if not intake:
         return render_template('404.html'), 404
     
-    return render_template('intake_form.html', intake=intake.to_dict(), mode='edit')
+    return render_template('intake_form.html', intake=intake.to_dict(), mode='edit',
+                           intake_etag=quote_etag(intake_etag(intake.id, intake.version)))
 
 
 @bp.route('/intake/<int:intake_id>/view')
 def view_intake(intake_id):
     """Zeigt ein Aufnahmeblatt in der Druckansicht."""
+    response = _print_not_modified(intake_id)
+    if response:
+        return response
+
     intake = VehicleIntake.query.get(intake_id)
     if not intake:
         return render_template('404.html'), 404
     
-    data = intake.to_dict()
-    
-    # Eco-Badge Farbe bestimmen
-    eco_badge_colors = {
-        'grün': ('#22c55e', '#16a34a'),
-        'gelb': ('#eab308', '#ca8a04'),
-        'rot': ('#ef4444', '#dc2626'),
-    }
-    eco_badge = data.get('eco_badge', 'grün')
-    eco_color, eco_stroke = eco_badge_colors.get(eco_badge, ('#22c55e', '#16a34a'))
-    
-    return render_template(
-        'intake_pdf.html',
-        intake=data,
-        eco_badge_color=eco_color,
-        eco_badge_stroke=eco_stroke,
-        print_date=datetime.now().strftime('%d.%m.%Y')
-    )
+    response = make_response(render_template('intake_pdf.html', **get_intake_print_context(intake.to_dict())))
+    return set_validators(response, get_intake_pdf_cache_key(intake))
 
 
 @bp.route('/intakes')
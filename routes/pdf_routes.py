@@ -0,0 +1,109 @@
+"""
+Routes für asynchrone PDF-Aufträge (Preisschilder und Aufnahmeblätter).
+
+Ablauf: Auftrag anlegen -> Status abfragen -> PDF herunterladen.
+"""
+from flask import Blueprint, jsonify, request, send_file, url_for
+from io import BytesIO
+from database import get_car_by_id
+from models import VehicleIntake
+from pdf_service import pdf_service, PdfQueueFullError
+from pdf_stamp import sign_masters
+from routes.view_routes import get_car_pdf_cache_key, build_car_pdf_html, get_car_pdf_filename, render_car_pdf_fast, CAR_PDF_STYLESHEETS
+from routes.intake_routes import get_intake_pdf_cache_key, build_intake_pdf_html, get_intake_pdf_filename
+
+bp = Blueprint('pdf', __name__)
+
+
+def _job_response(job):
+    result = job.to_dict()
+    result['status_url'] = url_for('pdf.get_pdf_job', job_id=job.id)
+    if result['status'] == 'done':
+        result['download_url'] = url_for('pdf.download_pdf_job', job_id=job.id)
+    return result
+
+
+@bp.route('/api/pdf-jobs', methods=['POST'])
+def create_pdf_job():
+    """Legt einen PDF-Auftrag an. Body: {"type": "car"|"intake", "id": <id>}"""
+    if not request.is_json:
+        return jsonify({'error': 'Content-Type muss application/json sein'}), 400
+
+    data = request.get_json()
+    job_type = data.get('type')
+    object_id = data.get('id')
+
+    if job_type == 'car':
+        car = get_car_by_id(object_id)
+        if not car:
+            return jsonify({'error': 'Fahrzeug nicht gefunden'}), 404
+        record = car.to_dict()
+        cache_key = get_car_pdf_cache_key(record)
+        build_html = lambda: build_car_pdf_html(record)
+        filename = get_car_pdf_filename(record)
+        stylesheets = CAR_PDF_STYLESHEETS
+        # Schnellpfad nur mit vorhandenem Master - ein fehlender Master wird
+        # nicht im Request erzeugt, sondern das PDF regulär im Pool gerendert
+        fast_render = lambda: render_car_pdf_fast(record, build_master=False)
+    elif job_type == 'intake':
+        intake = VehicleIntake.query.get(object_id)
+        if not intake:
+            return jsonify({'error': 'Aufnahmeblatt nicht gefunden'}), 404
+        cache_key = get_intake_pdf_cache_key(intake)
+        build_html = lambda: build_intake_pdf_html(intake.to_dict())
+        filename = get_intake_pdf_filename(intake)
+        stylesheets = ()
+        fast_render = None
+    else:
+        return jsonify({'error': 'type muss car oder intake sein'}), 400
+
+    try:
+        job = pdf_service.submit(cache_key, build_html, filename, stylesheets, fast_render=fast_render)
+    except PdfQueueFullError as e:
+        return jsonify({'error': str(e)}), 503
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    return jsonify(_job_response(job)), 202
+
+
+@bp.route('/api/pdf-jobs/<job_id>', methods=['GET'])
+def get_pdf_job(job_id):
+    """Gibt den Status eines PDF-Auftrags zurück."""
+    job = pdf_service.get_job(job_id)
+    if not job:
+        return jsonify({'error': 'Auftrag nicht gefunden'}), 404
+    return jsonify(_job_response(job))
+
+
+@bp.route('/api/pdf-jobs/<job_id>/download', methods=['GET'])
+def download_pdf_job(job_id):
+    """Liefert das PDF eines fertigen Auftrags."""
+    job = pdf_service.get_job(job_id)
+    if not job:
+        return jsonify({'error': 'Auftrag nicht gefunden'}), 404
+
+    status = job.to_dict()['status']
+    if status == 'error':
+        return jsonify({'error': job.error}), 500
+    if status != 'done':
+        return jsonify({'error': 'PDF ist noch nicht fertig', 'status': status}), 409
+
+    pdf_bytes = pdf_service.get_result(job)
+    if pdf_bytes is None:
+        return jsonify({'error': 'PDF nicht mehr im Cache - bitte neu anfordern'}), 410
+
+    return send_file(
+        BytesIO(pdf_bytes),
+        download_name=job.filename,
+        as_attachment=True,
+        mimetype='application/pdf'
+    )
+
+
+@bp.route('/api/pdf-jobs/stats', methods=['GET'])
+def get_pdf_service_stats():
+    """Gibt Auslastung des Render-Pools und des Schnellpfads zurück."""
+    stats = pdf_service.stats()
+    stats['stamp'] = sign_masters.stats()
+    return jsonify(stats)
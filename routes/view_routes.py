@@ -1,12 +1,30 @@
-from flask import Blueprint, render_template, request, jsonify, send_file, current_app, redirect, url_for
-from weasyprint import HTML
+from flask import Blueprint, render_template, request, jsonify, send_file, current_app, redirect, url_for, Response, stream_with_context
 from io import BytesIO
-from database import get_all_cars, get_car_by_id, insert_car
+from datetime import datetime
+from database import get_car_by_id, insert_car, build_cars_query, iter_cars_by_ids, count_cars
 from forms import CarForm
+from pdf_cache import pdf_cache, make_key, file_digest, template_digest
+from pdf_service import pdf_service, PdfQueueFullError, PdfRenderError, PdfRenderTimeoutError
+from pdf_assets import get_pdf_image
+from pdf_stamp import sign_masters, PDF_STAMP_ENABLED, MASTER_PLACEHOLDER
+from car_export import ZipStreamBuffer
+from conditional_requests import get_row_validators, is_not_modified, not_modified, set_validators
+from models import Car
 import os
+import zipfile
 
 bp = Blueprint('views', __name__)
 
+# Templates, Stylesheets und Bilder des Preisschilds (fließen in den Cache-Schlüssel ein)
+CAR_PDF_TEMPLATES = ['car_template.html', 'car_sign_page.html']
+CAR_PDF_STYLESHEETS = ['css/car_template.css']
+CAR_PDF_IMAGES = ['images/logo.png', 'images/santander.png']
+
+# Ein Sammel-PDF wird in einem Layout-Durchlauf erzeugt und hält dabei alle
+# Seiten im Speicher - größere Mengen laufen über den ZIP-Stream
+BATCH_PDF_MAX_CARS = int(os.getenv('BATCH_PDF_MAX_CARS', 100))
+BATCH_YIELD_PER = 50
+
 
 def get_eco_badge_colors(badge_number):
     colors = {
@@ -29,25 +47,187 @@ def serve_image(filename):
 @bp.route('/view-cars')
 def view_cars():
     search_term = request.args.get('search', '')
-    sort_by = request.args.get('sort', 'id')
+    # Suchergebnisse standardmäßig nach Relevanz sortieren
+    sort_by = request.args.get('sort', 'relevance' if search_term else 'id')
     sort_order = request.args.get('order', 'asc')
+    features = [feature for feature in request.args.getlist('feature') if feature.strip()]
+    # Archivierte Fahrzeuge einbeziehen (None: Parameter entfällt in den Links)
+    include_archive = '1' if request.args.get('include_archive') == '1' else None
 
-    cars = get_all_cars(search_term, sort_by, sort_order)
-
+    # Die Zeilen lädt die Seite seitenweise über /api/cars nach
     return render_template('view_cars.html',
-                           cars=cars,
                            search_term=search_term,
+                           features=features,
                            sort_by=sort_by,
-                           sort_order=sort_order)
+                           sort_order=sort_order,
+                           include_archive=include_archive)
 
 
-def generate_pdf_from_template(html_content):
+def generate_pdf_from_template(html_content, stylesheets=()):
     """Helper function to generate PDF with correct image handling"""
-    pdf_file = BytesIO()
-    html = HTML(string=html_content, base_url=request.url_root)
-    html.write_pdf(pdf_file, presentational_hints=True)
-    pdf_file.seek(0)
-    return pdf_file
+    # Rendering läuft in einem Worker-Prozess, der Request-Thread wartet nur
+    return BytesIO(pdf_service.render_html(html_content, stylesheets))
+
+
+def _get_car_pdf_asset_digests():
+    """Digests von Templates, Stylesheets und Bildern des Preisschilds."""
+    static_folder = current_app.static_folder
+    return [
+        [template_digest(current_app.jinja_env, name) for name in CAR_PDF_TEMPLATES],
+        [file_digest(os.path.join(static_folder, name)) for name in CAR_PDF_STYLESHEETS],
+        # Name der Druckvariante enthält Quell-Hash und Vorverarbeitungs-Parameter
+        [get_pdf_image(static_folder, name) for name in CAR_PDF_IMAGES]
+    ]
+
+
+def get_car_pdf_cache_key(car_dict):
+    """Berechnet den Cache-Schlüssel aus Datensatz, Template und Bildern."""
+    return make_key('car_template.html', car_dict, *_get_car_pdf_asset_digests())
+
+
+def get_car_pdf_etag(car_id, version):
+    """ETag des Preisschilds aus Zeilenversion und Assets (ohne das Fahrzeug zu laden)."""
+    return make_key('car_template.html', car_id, version, *_get_car_pdf_asset_digests())
+
+
+def get_car_sign_text(car_dict):
+    """Formatiert die fahrzeugabhängigen Texte des Preisschilds (HTML und Schnellpfad)."""
+    numberformat = current_app.jinja_env.filters['numberformat']
+    features = car_dict['features']
+    if isinstance(features, str):
+        features = features.split(', ')
+
+    sign_text = {
+        'listing_number': str(car_dict['listing_number']),
+        'vehicle_name': f"{car_dict['brand']} {car_dict['model']}",
+        'engine_capacity': f"{car_dict['engine_capacity']} ccm",
+        'power': f"{car_dict['power']} PS ({int(round(car_dict['power'] * 0.735499))} KW)",
+        'fuel_type': str(car_dict['fuel_type']),
+        'transmission': str(car_dict['transmission']),
+        'mileage': f"{numberformat(car_dict['mileage'])} km",
+        'first_registration': str(car_dict['first_registration']),
+        'features': list(features),
+        'price': f"{numberformat(car_dict['price'])},- €",
+        'net_price': None
+    }
+    if car_dict['vat_deductible']:
+        sign_text['net_price'] = f"MwSt. ausweisbar (Netto: {numberformat(int(round(car_dict['price'] / 1.19)))},- €)"
+    return sign_text
+
+
+def get_car_sign_context(car_dict):
+    """Bereitet die Template-Variablen für ein Preisschild vor."""
+    car_dict = dict(car_dict)
+    car_dict['features'] = car_dict['features'].split(', ')
+
+    eco_badge_color, eco_badge_stroke = get_eco_badge_colors(car_dict['eco_badge'])
+    return {
+        'car': car_dict,
+        'sign_text': get_car_sign_text(car_dict),
+        'eco_badge_color': eco_badge_color,
+        'eco_badge_stroke': eco_badge_stroke,
+        'seller': car_dict.get('seller', 'Auto Berndl')
+    }
+
+
+def get_car_pdf_filename(car_dict):
+    """Gibt den Download-Dateinamen für ein Preisschild zurück."""
+    return f"{car_dict['brand']}_{car_dict['model']}_{car_dict['listing_number']}.pdf".replace(" ", "_")
+
+
+def render_car_pdf(car_dict):
+    """Gibt das Preisschild als PDF-Bytes zurück (aus dem Cache oder neu gerendert)."""
+    # Cache-Treffer: WeasyPrint wird komplett übersprungen
+    return pdf_service.render(
+        get_car_pdf_cache_key(car_dict),
+        lambda: build_car_pdf_html(car_dict),
+        CAR_PDF_STYLESHEETS,
+        fast_render=lambda: render_car_pdf_fast(car_dict)
+    )
+
+
+def build_car_pdf_html(car_dict):
+    """Rendert das HTML des Preisschilds."""
+    return render_template('car_template.html', **get_car_sign_context(car_dict))
+
+
+# ============== Schnellpfad (Master-PDF + Textstempel) ==============
+
+def _get_car_layout_variant(car_dict):
+    """Merkmale, die das Layout außerhalb der Textfelder verändern."""
+    return {
+        'eco_badge': car_dict['eco_badge'],
+        'vat_deductible': bool(car_dict['vat_deductible']),
+        'consignment': car_dict.get('seller', 'Auto Berndl') == 'Im Auftrag',
+        'feature_count': len(car_dict['features'].split(', '))
+    }
+
+
+def get_car_master_key(car_dict):
+    """Schlüssel des Master-PDFs: gleiche Layout-Variante teilt sich einen Master."""
+    return make_key('car_master', _get_car_layout_variant(car_dict), *_get_car_pdf_asset_digests())
+
+
+def build_car_master_html(car_dict):
+    """Rendert das HTML des Masters (Platzhalter statt Fahrzeugdaten)."""
+    variant = _get_car_layout_variant(car_dict)
+    placeholder_car = dict(car_dict)
+    placeholder_car['features'] = ', '.join([MASTER_PLACEHOLDER] * variant['feature_count'])
+    placeholder_car['seller'] = 'Im Auftrag' if variant['consignment'] else 'Auto Berndl'
+
+    context = get_car_sign_context(placeholder_car)
+    sign_text = context['sign_text']
+    for field, value in sign_text.items():
+        if isinstance(value, list):
+            sign_text[field] = [MASTER_PLACEHOLDER] * len(value)
+        elif value is not None:
+            sign_text[field] = MASTER_PLACEHOLDER
+    return render_template('car_template.html', **context)
+
+
+def render_car_pdf_fast(car_dict, build_master=True):
+    """
+    Erzeugt das Preisschild ohne HTML-Layout durch Stempeln der Texte auf
+    den Master. Gibt None zurück, wenn der Schnellpfad nicht möglich ist
+    (z.B. Text zu lang) - dann wird regulär mit WeasyPrint gerendert.
+    Mit build_master=False wird nur ein bereits vorhandener Master verwendet.
+    """
+    if not PDF_STAMP_ENABLED:
+        return None
+
+    try:
+        master = sign_masters.get(
+            get_car_master_key(car_dict),
+            (lambda: build_car_master_html(car_dict)) if build_master else None,
+            CAR_PDF_STYLESHEETS
+        )
+    except PdfQueueFullError:
+        raise
+    except Exception as e:
+        current_app.logger.warning(f"PDF-Master konnte nicht erzeugt werden: {e}")
+        return None
+    if master is None:
+        return None
+
+    pdf_bytes = master.stamp(
+        get_car_sign_text(car_dict),
+        title=f"Auto Berndl - {car_dict['brand']} {car_dict['model']}"
+    )
+    sign_masters.count(pdf_bytes is not None)
+    return pdf_bytes
+
+
+@bp.route('/api/pdf-cache', methods=['GET'])
+def get_pdf_cache_stats():
+    """Gibt Treffer-/Fehlzähler und Belegung des PDF-Caches zurück."""
+    return jsonify(pdf_cache.stats())
+
+
+@bp.route('/api/pdf-cache', methods=['DELETE'])
+def clear_pdf_cache():
+    """Leert den PDF-Cache."""
+    pdf_cache.clear()
+    return jsonify({'message': 'PDF-Cache geleert'})
 
 
 @bp.route('/car-form', methods=['GET', 'POST'])
@@ -87,25 +267,176 @@ def car_form():
 @bp.route('/car/<int:car_id>/pdf')
 def generate_car_pdf(car_id):
     """Generate PDF for an existing car"""
+    validators = get_row_validators(Car, car_id)
+    if validators is None:
+        return render_template('404.html'), 404
+    etag = get_car_pdf_etag(car_id, validators[0])
+    if is_not_modified(etag):
+        return not_modified(etag)
+
     car = get_car_by_id(car_id)
     if not car:
         return render_template('404.html'), 404
 
     car_dict = car.to_dict()
-    car_dict['features'] = car_dict['features'].split(', ')
+    try:
+        pdf_bytes = render_car_pdf(car_dict)
+    except PdfQueueFullError as e:
+        return jsonify({'error': str(e)}), 503
+    except PdfRenderTimeoutError as e:
+        return jsonify({'error': str(e)}), 504
+    except PdfRenderError as e:
+        current_app.logger.error(f"Preisschild {car_id}: {e}")
+        return jsonify({'error': str(e)}), 500
 
-    eco_badge_color, eco_badge_stroke = get_eco_badge_colors(car_dict['eco_badge'])
-    html_content = render_template('car_template.html',
-                                   car=car_dict,
-                                   eco_badge_color=eco_badge_color,
-                                   eco_badge_stroke=eco_badge_stroke,
-                                   seller=car_dict.get('seller', 'Auto Berndl'))
-    pdf_file = generate_pdf_from_template(html_content)
-    filename = f"{car_dict['brand']}_{car_dict['model']}_{car_dict['listing_number']}.pdf".replace(" ", "_")
+    response = send_file(
+        BytesIO(pdf_bytes),
+        download_name=get_car_pdf_filename(car_dict),
+        as_attachment=True,
+        mimetype='application/pdf'
+    )
+    return set_validators(response, get_car_pdf_etag(car.id, car_dict['version']))
+
+
+def _parse_car_id(value):
+    """Eine Fahrzeug-ID aus JSON oder Query (Zahl oder Ziffernfolge)."""
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    raise ValueError('Ungültige Fahrzeug-IDs')
+
+
+def _get_batch_params():
+    """
+    Liest Auswahl und Format eines Sammel-Exports aus JSON-Body oder
+    Query-Parametern. Wirft ValueError bei ungültigen Parametern.
+    """
+    if request.is_json:
+        data = request.get_json(silent=True)
+        if data is None:
+            data = {}
+        if not isinstance(data, dict):
+            raise ValueError('JSON-Body muss ein Objekt sein')
+        features = data.get('features') or []
+        if not isinstance(features, list) or not all(isinstance(feature, str) for feature in features):
+            raise ValueError('features muss eine Liste von Ausstattungsmerkmalen sein')
+    else:
+        data = request.args
+        features = data.getlist('feature')
+
+    car_ids = data.get('ids')
+    if isinstance(car_ids, str):
+        car_ids = [part for part in car_ids.split(',') if part.strip()]
+    elif car_ids is not None and not isinstance(car_ids, list):
+        car_ids = [car_ids]
+    if car_ids:
+        car_ids = [_parse_car_id(car_id) for car_id in car_ids]
+
+    params = {
+        'car_ids': car_ids or None,
+        'search_term': data.get('search', ''),
+        'features': features,
+        'sort_by': data.get('sort', 'id'),
+        'sort_order': data.get('order', 'asc'),
+        'format': data.get('format', 'pdf')
+    }
+    if not all(isinstance(params[name], str) for name in ('search_term', 'sort_by', 'sort_order', 'format')):
+        raise ValueError('search, sort, order und format müssen Texte sein')
+    return params
+
+
+def _iter_batch_cars(params):
+    """Liefert die ausgewählten Fahrzeuge, ohne alle gleichzeitig zu laden."""
+    if params['car_ids']:
+        return iter_cars_by_ids(params['car_ids'])
+    query = build_cars_query(params['search_term'], params['sort_by'], params['sort_order'], params['features'])
+    return query.yield_per(BATCH_YIELD_PER)
+
+
+def _count_batch_cars(params):
+    if params['car_ids']:
+        return len(params['car_ids'])
+    return count_cars(params['search_term'], params['features'])
+
+
+@bp.route('/cars/pdf', methods=['GET', 'POST'])
+def generate_cars_batch_pdf():
+    """
+    Erzeugt Preisschilder für mehrere Fahrzeuge.
+
+    Auswahl über `ids` (Liste oder kommagetrennt) oder die Such-/Sortier-
+    parameter der Fahrzeugübersicht (`search`, `feature`, `sort`, `order`).
+    `format=pdf` erzeugt ein mehrseitiges PDF in einem Layout-Durchlauf,
+    `format=zip` streamt ein ZIP mit je einem PDF pro Fahrzeug.
+    """
+    try:
+        params = _get_batch_params()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    timestamp = datetime.now().strftime('%Y-%m-%d')
+
+    if params['format'] == 'zip':
+        def generate():
+            buffer = ZipStreamBuffer()
+            used_names = set()
+            with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as zip_file:
+                for car in _iter_batch_cars(params):
+                    car_dict = car.to_dict()
+                    name = get_car_pdf_filename(car_dict)
+                    if name in used_names:
+                        name = f"{car_dict['id']}_{name}"
+                    used_names.add(name)
+
+                    try:
+                        pdf_bytes = render_car_pdf(car_dict)
+                    except (PdfQueueFullError, PdfRenderError) as e:
+                        # Status ist schon gesendet: Fehler als Eintrag vermerken, ZIP bleibt gültig
+                        current_app.logger.error(f"Sammel-ZIP: Preisschild {car_dict['id']} fehlt: {e}")
+                        zip_file.writestr(
+                            f"FEHLER_{car_dict['id']}.txt",
+                            f"Preisschild für Fahrzeug {car_dict['id']} ({name}) konnte nicht erstellt werden:\n{e}\n"
+                        )
+                        yield buffer.pop()
+                        continue
+                    # PDFs sind bereits komprimiert - ZIP_STORED spart CPU
+                    zip_file.writestr(name, pdf_bytes)
+                    yield buffer.pop()
+            yield buffer.pop()
+
+        return Response(
+            stream_with_context(generate()),
+            mimetype='application/zip',
+            headers={'Content-Disposition': f'attachment; filename=preisschilder_{timestamp}.zip'}
+        )
+
+    if params['format'] != 'pdf':
+        return jsonify({'error': 'Format muss pdf oder zip sein'}), 400
+
+    count = _count_batch_cars(params)
+    if count == 0:
+        return jsonify({'error': 'Keine Fahrzeuge ausgewählt'}), 404
+    if count > BATCH_PDF_MAX_CARS:
+        return jsonify({
+            'error': f'Maximal {BATCH_PDF_MAX_CARS} Fahrzeuge pro Sammel-PDF - bitte format=zip verwenden'
+        }), 400
+
+    signs = [get_car_sign_context(car.to_dict()) for car in _iter_batch_cars(params)]
+    html_content = render_template('car_batch_template.html', signs=signs)
+    try:
+        pdf_file = generate_pdf_from_template(html_content, CAR_PDF_STYLESHEETS)
+    except PdfQueueFullError as e:
+        return jsonify({'error': str(e)}), 503
+    except PdfRenderTimeoutError as e:
+        return jsonify({'error': str(e)}), 504
+    except PdfRenderError as e:
+        current_app.logger.error(f"Sammel-PDF: {e}")
+        return jsonify({'error': str(e)}), 500
 
     return send_file(
         pdf_file,
-        download_name=filename,
+        download_name=f'preisschilder_{timestamp}.pdf',
         as_attachment=True,
         mimetype='application/pdf'
     )
@@ -1,4 +1,7 @@
 document.addEventListener('DOMContentLoaded', function() {
+    // Version des geladenen Fahrzeugs (If-Match beim Speichern)
+    let editCarEtag = null;
+
     // Sortierung
     document.querySelectorAll('.sort-icon').forEach(icon => {
         icon.addEventListener('click', function() {
@@ -26,6 +29,7 @@ document.addEventListener('DOMContentLoaded', function() {
             try {
                 const response = await fetch(`/car/${carId}`);
                 const car = await response.json();
+                editCarEtag = response.headers.get('ETag');
 
                 // Formular mit den Fahrzeugdaten füllen
                 const form = document.getElementById('editCarForm');
@@ -176,11 +180,13 @@ document.addEventListener('DOMContentLoaded', function() {
         };
 
         try {
+            const headers = {
+                'Content-Type': 'application/json',
+            };
+            if (editCarEtag) headers['If-Match'] = editCarEtag;
             const response = await fetch(`/car/${carId}`, {
                 method: 'PUT',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
+                headers,
                 body: JSON.stringify(formData)
             });
 
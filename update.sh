@@ -97,8 +97,14 @@ create_backup() {
     local backup_file="${BACKUP_DIR}/car_data_${timestamp}.db"
     
     if [[ -f "$db_file" ]]; then
-        cp "$db_file" "$backup_file"
-        log_success "Backup erstellt: $backup_file"
+        # Online-Backup über SQLite: berücksichtigt im WAL-Modus auch Änderungen,
+        # die noch in car_data.db-wal stehen (ein einfaches cp würde sie verlieren)
+        if python3 -c 'import sqlite3, sys; src = sqlite3.connect(sys.argv[1]); dst = sqlite3.connect(sys.argv[2]); src.backup(dst); dst.close(); src.close()' "$db_file" "$backup_file" 2>/dev/null; then
+            log_success "Backup erstellt: $backup_file"
+        else
+            cp "$db_file" "$backup_file"
+            log_success "Backup erstellt (Dateikopie): $backup_file"
+        fi
         
         # Alte Backups aufräumen (behalte nur die letzten MAX_BACKUPS)
         local backup_count=$(ls -1 "${BACKUP_DIR}"/car_data_*.db 2>/dev/null | wc -l)
@@ -265,66 +271,9 @@ run_database_migration() {
         source "${SCRIPT_DIR}/.venv/bin/activate"
     fi
     
-    # Führe Python-Skript für Migration aus
-    python3 << 'EOF'
-import os
-import sys
-
-# Füge das Skript-Verzeichnis zum Pfad hinzu
-sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
-
-try:
-    from flask import Flask
-    from models import db, Car
-    from sqlalchemy import text, inspect
-    
-    # Erstelle temporäre Flask-App für Datenbank-Zugriff
-    app = Flask(__name__)
-    data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
-    os.makedirs(data_dir, exist_ok=True)
-    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(data_dir, "car_data.db")}'
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-    
-    db.init_app(app)
-    
-    with app.app_context():
-        # Erstelle alle Tabellen (falls nicht vorhanden)
-        db.create_all()
-        
-        # Prüfe und füge neue Spalten hinzu
-        inspector = inspect(db.engine)
-        
-        if 'cars' in inspector.get_table_names():
-            columns = [col['name'] for col in inspector.get_columns('cars')]
-            
-            # Migration: in_stock Spalte
-            if 'in_stock' not in columns:
-                with db.engine.connect() as conn:
-                    conn.execute(text('ALTER TABLE cars ADD COLUMN in_stock BOOLEAN DEFAULT 1 NOT NULL'))
-                    conn.commit()
-                print("Migration: in_stock Spalte hinzugefügt")
-            else:
-                # Setze NULL-Werte auf 1
-                with db.engine.connect() as conn:
-                    conn.execute(text('UPDATE cars SET in_stock = 1 WHERE in_stock IS NULL'))
-                    conn.commit()
-            
-            # Hier können weitere Migrationen hinzugefügt werden
-            # Beispiel:
-            # if 'neue_spalte' not in columns:
-            #     with db.engine.connect() as conn:
-            #         conn.execute(text('ALTER TABLE cars ADD COLUMN neue_spalte TEXT'))
-            #         conn.commit()
-            #     print("Migration: neue_spalte hinzugefügt")
-        
-        print("Datenbank-Migration erfolgreich abgeschlossen")
-        
-except Exception as e:
-    print(f"Migration-Fehler: {e}")
-    sys.exit(1)
-EOF
-
-    if [[ $? -eq 0 ]]; then
+    # Ausstehende Migrationen anwenden (Schema-Version in PRAGMA user_version),
+    # damit der Dienst beim Start keine Schema-Arbeit mehr erledigen muss
+    if python3 migrations.py; then
         log_success "Datenbank-Migration abgeschlossen"
     else
         log_warning "Datenbank-Migration hatte Probleme - bitte manuell prüfen"